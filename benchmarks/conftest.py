@@ -0,0 +1,13 @@
+from benchmarks.corpus import SHAPES
+from benchmarks.suite import DEFAULT_REPEAT, DEFAULT_THRESHOLD
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption("--benchmark-sizes", default="1KB,4KB", help="comma separated sizes of the generated sources")
+    group.addoption("--benchmark-shapes", default=",".join(SHAPES), help="comma separated shapes of the sources")
+    group.addoption("--benchmark-engine", default="classic", help="lexer engine to benchmark")
+    group.addoption("--benchmark-repeat", type=int, default=DEFAULT_REPEAT, help="runs per phase")
+    group.addoption("--benchmark-output", help="JSON file to write the results to")
+    group.addoption("--benchmark-baseline", help="JSON file of earlier results, regressions from it fail the run")
+    group.addoption("--benchmark-threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed relative regression")
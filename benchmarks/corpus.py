@@ -0,0 +1,97 @@
+from typing import Callable, Dict, List
+import random
+import re
+
+
+# Every shape builds a top level unit of code at a time, the same seed always gives the same source
+def _imports(rng: random.Random, i: int) -> str:
+    if rng.random() < 0.5:
+        return f"import module_{i}\n"
+    names = ", ".join(f"name_{i}_{j}" for j in range(rng.randint(1, 4)))
+    return f"from package_{rng.randint(0, 99)}.module_{i} import {names}\n"
+
+
+def _classes(rng: random.Random, i: int) -> str:
+    bases = ", ".join(f"Base{rng.randint(0, 9)}" for _ in range(rng.randint(0, 2)))
+    lines = [f"class Class{i}({bases}):\n" if bases else f"class Class{i}:\n"]
+    for j in range(rng.randint(1, 4)):
+        lines.append(f"    attribute_{j}: int = {rng.randint(0, 1000)}\n")
+    for j in range(rng.randint(1, 3)):
+        lines.append(f"\n    def method_{j}():\n")
+        lines.append(f"        value = self.attribute_0 + {j}\n")
+        lines.append("        return value\n")
+    return "".join(lines) + "\n"
+
+
+def _indented(rng: random.Random, i: int) -> str:
+    depth = rng.randint(4, 12)
+    lines = [f"def nested_{i}():\n"]
+    for level in range(1, depth):
+        indent = "    " * level
+        lines.append(f"{indent}if flag_{level}:\n")
+        lines.append(f"{indent}    counter_{level} = {level}\n")
+    return "".join(lines) + "\n"
+
+
+def _strings(rng: random.Random, i: int) -> str:
+    words = " ".join(rng.choice(("lorem", "ipsum", "dolor", "sit", "amet")) for _ in range(rng.randint(10, 60)))
+    if rng.random() < 0.3:
+        return f'text_{i} = """{words}\n{words}"""\n'
+    return f'text_{i} = "{words}"\n'
+
+
+def _numeric(rng: random.Random, i: int) -> str:
+    terms = []
+    for _ in range(rng.randint(2, 8)):
+        if rng.random() < 0.5:
+            terms.append(str(rng.randint(0, 10 ** 6)))
+        else:
+            terms.append(f"{rng.randint(0, 999)}.{rng.randint(0, 99)}")
+        terms.append(rng.choice(("+", "-", "*", "/", "**")))
+    return f"number_{i} = {' '.join(terms[:-1])}\n"
+
+
+SHAPES: Dict[str, Callable[[random.Random, int], str]] = {
+    "imports": _imports,
+    "classes": _classes,
+    "indented": _indented,
+    "strings": _strings,
+    "numeric": _numeric,
+}
+
+
+def _mixed(rng: random.Random, i: int) -> str:
+    return SHAPES[rng.choice(sorted(SHAPES))](rng, i)
+
+
+SHAPES["mixed"] = _mixed
+
+
+def generate(size: int, shape: str = "mixed", seed: int = 0) -> str:
+    # Sources are cut at the last line that fits, so they're at most `size` chars long
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape '{shape}', available: {', '.join(SHAPES)}")
+    rng = random.Random(f"{shape}:{seed}")
+    build = SHAPES[shape]
+    units: List[str] = []
+    length = 0
+    i = 0
+    while length < size:
+        unit = build(rng, i)
+        units.append(unit)
+        length += len(unit)
+        i += 1
+    source = "".join(units)
+    return source[:source.rfind("\n", 0, size) + 1]
+
+
+SIZE_PATTERN = re.compile(r"(\d+)\s*(B|KB|MB|GB)?", re.IGNORECASE)
+SIZE_UNITS = {"B": 1, "KB": 2 ** 10, "MB": 2 ** 20, "GB": 2 ** 30}
+
+
+def parse_size(size: str) -> int:
+    # "100MB", "1kb" or a plain number of bytes
+    match = SIZE_PATTERN.fullmatch(size.strip())
+    if match is None:
+        raise ValueError(f"Invalid size '{size}'")
+    return int(match.group(1)) * SIZE_UNITS[(match.group(2) or "B").upper()]
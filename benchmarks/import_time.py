@@ -0,0 +1,124 @@
+from typing import Callable, Dict, Iterable, List, Set
+import argparse
+import compileall
+import pathlib
+import re
+import subprocess
+import sys
+
+ROOT = pathlib.Path(__file__).parent.parent
+# Milliseconds the imports of every entry point may take, well above what they take to leave room for slow machines
+BUDGETS: Dict[str, float] = {
+    "lib.lexer,lib.parser": 60.0,
+    "lib.client": 60.0,
+    "main": 80.0,
+}
+# Modules which only some modes need, and none of the entry points may load on import
+DEFERRED_MODULES: Dict[str, Set[str]] = {
+    "lib.lexer,lib.parser": {"logging", "json", "dataclasses", "lib.disk_cache", "lib.stats"},
+    "lib.client": {"lib.lexer", "lib.parser", "lib.server"},
+    "main": {"lib.lexer", "lib.parser", "lib.batch", "lib.server", "lib.symbols", "logging"},
+}
+# Milliseconds all imports of a run of main.py with the arguments may take, the ones made while it runs included
+RUN_BUDGETS: Dict[str, float] = {
+    "lib/token.py -q": 80.0,
+}
+# Modules of other modes and flags which runs of main.py on a single script may not load
+RUN_MODULES = {"lib.client", "lib.server", "lib.batch", "lib.symbols", "socket", "json", "tempfile"}
+DEFERRED_RUN_MODULES: Dict[str, Set[str]] = {
+    "lib/token.py -q": RUN_MODULES | {"logging", "lib.disk_cache", "lib.stats", "lib.binary_format"},
+    "lib/token.py": RUN_MODULES | {"lib.disk_cache", "lib.stats", "lib.binary_format"},
+}
+DEFAULT_REPEAT = 5
+IMPORT_TIME_PATTERN = re.compile(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)")
+# Runs main.py with the arguments after it. It prints the AST to stdout, so the loaded modules go to stderr
+RUN_STATEMENT = (
+    "import sys; sys.argv[1:] = sys.argv[2:]; import main; main.main(); print(*sys.modules, file=sys.stderr)"
+)
+
+
+def compile_sources():
+    # Bytecode may not be written on import, which would time the compiler instead
+    compileall.compile_dir((ROOT / "lib").as_posix(), quiet=1)
+    compileall.compile_file((ROOT / "main.py").as_posix(), quiet=1)
+
+
+def measure_import(modules: str) -> float:
+    # Cumulative milliseconds of the top level imports of a fresh interpreter, as reported by -X importtime
+    statement = "; ".join(f"import {module}" for module in modules.split(","))
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    total = 0
+    for match in IMPORT_TIME_PATTERN.finditer(process.stderr):
+        if not match.group(2) and match.group(3) in modules.split(","):
+            total += int(match.group(1))
+    return total / 1000
+
+
+def loaded_modules(modules: str) -> Set[str]:
+    statement = "; ".join(f"import {module}" for module in modules.split(",")) + "; import sys; print(*sys.modules)"
+    process = subprocess.run([sys.executable, "-c", statement], cwd=ROOT, capture_output=True, text=True, check=True)
+    return set(process.stdout.split())
+
+
+def measure_run_imports(arguments: str) -> float:
+    # Cumulative milliseconds of the top level imports from `main` on, the ones before are the interpreter's own
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUN_STATEMENT, "main.py", *arguments.split()], cwd=ROOT,
+        capture_output=True, text=True, check=True
+    )
+    total = 0
+    started = False
+    for match in IMPORT_TIME_PATTERN.finditer(process.stderr):
+        started = started or match.group(3) == "main"
+        if started and not match.group(2):
+            total += int(match.group(1))
+    return total / 1000
+
+
+def run_loaded_modules(arguments: str) -> Set[str]:
+    process = subprocess.run(
+        [sys.executable, "-c", RUN_STATEMENT, "main.py", *arguments.split()], cwd=ROOT, capture_output=True, text=True,
+        check=True
+    )
+    return set(process.stderr.split())
+
+
+def run(
+    entry_points: Iterable[str], repeat: int = DEFAULT_REPEAT, measure: Callable[[str], float] = measure_import
+) -> Dict[str, float]:
+    # The best of `repeat` runs counts, as anything slower was slowed down by something else
+    compile_sources()
+    return {modules: min(measure(modules) for _ in range(repeat)) for modules in entry_points}
+
+
+def over_budget(times: Dict[str, float], budgets: Dict[str, float] = BUDGETS) -> List[str]:
+    return [modules for modules, milliseconds in times.items() if milliseconds > budgets[modules]]
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="Time the imports of every entry point against their budgets")
+    arg_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per entry point, the best counts")
+    return arg_parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    times = run(BUDGETS, args.repeat)
+    for modules, milliseconds in times.items():
+        print(f"{modules:<24} {milliseconds:8.2f} ms of {BUDGETS[modules]:.0f} ms")
+    run_times = run(RUN_BUDGETS, args.repeat, measure_run_imports)
+    for arguments, milliseconds in run_times.items():
+        print(f"{'main.py ' + arguments:<24} {milliseconds:8.2f} ms of {RUN_BUDGETS[arguments]:.0f} ms")
+    failed = over_budget(times)
+    for modules in failed:
+        print(f"Importing {modules} is over budget")
+    failed_runs = over_budget(run_times, RUN_BUDGETS)
+    for arguments in failed_runs:
+        print(f"Running main.py {arguments} imports over budget")
+    return 1 if failed or failed_runs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+import contextlib
+import io
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, pathlib.Path(__file__).parent.parent.as_posix())
+
+from benchmarks.corpus import generate
+from lib.lexer import tokenize_source
+from lib.parser import Parser
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def tokens_of_size(size: int) -> list:
+    # Generated sources of about 6 chars per token, cut to the exact number of tokens
+    tokens = list(tokenize_source(generate(size * 8, "mixed"), engine="fast"))
+    return tokens[:size]
+
+
+def time_parse(tokens: list) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        Parser(tokens)
+        return time.perf_counter() - start
+
+
+def main():
+    # Parsing should scale linearly, so time per token is expected to stay roughly the same for every size
+    for size in SIZES:
+        tokens = tokens_of_size(size)
+        elapsed = time_parse(tokens)
+        print(f"{len(tokens):>8} tokens: {elapsed * 1000:9.2f} ms, {elapsed / len(tokens) * 1e9:7.0f} ns/token")
+
+
+if __name__ == "__main__":
+    main()
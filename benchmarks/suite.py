@@ -0,0 +1,237 @@
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import argparse
+import contextlib
+import io
+import json
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, pathlib.Path(__file__).parent.parent.as_posix())
+
+from benchmarks.corpus import SHAPES, generate, parse_size
+from lib.lexer import Lexer, tokenize_source
+from lib.parser import Parser
+from lib.token import Token, TokenType
+
+PHASES = ("tokenize", "parse", "end_to_end")
+DEFAULT_SIZES = ("1KB", "64KB", "1MB")
+DEFAULT_REPEAT = 3
+# Relative slowdown, or growth of peak memory, from the baseline which fails a run
+DEFAULT_THRESHOLD = 0.2
+RESULTS_VERSION = 1
+
+
+@dataclass
+class BenchmarkResult:
+    engine: str
+    shape: str
+    size: int
+    phase: str
+    seconds: float
+    tokens: int
+    nodes: int
+    peak_bytes: int
+
+    @property
+    def key(self) -> Tuple[str, str, int, str]:
+        return self.engine, self.shape, self.size, self.phase
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.size / self.seconds if self.seconds else 0.0
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    def to_json(self) -> dict:
+        return {
+            **asdict(self),
+            "tokens_per_second": self.tokens_per_second,
+            "bytes_per_second": self.bytes_per_second,
+            "nodes_per_second": self.nodes_per_second,
+        }
+
+    def __str__(self):
+        return (
+            f"{self.engine:>7} {self.shape:>9} {self.size:>10} B {self.phase:>10}: {self.seconds * 1000:10.2f} ms, "
+            f"{self.tokens_per_second:12.0f} tokens/s, {self.bytes_per_second / 2 ** 20:8.2f} MB/s, "
+            f"{self.nodes_per_second:10.0f} nodes/s, peak {self.peak_bytes / 2 ** 20:8.2f} MB"
+        )
+
+
+def measure(run: Callable[[], None], repeat: int) -> Tuple[float, int]:
+    # Best time of `repeat` runs, and the peak memory of one more run traced on its own, as tracing slows it down
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmark(
+    shape: str, size: int, engine: str = "classic", repeat: int = DEFAULT_REPEAT
+) -> List[BenchmarkResult]:
+    source = generate(size, shape)
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        path = os.path.join(directory, f"{shape}.py")
+        with open(path, "w") as file:
+            file.write(source)
+
+        tokens = Lexer(path, engine=engine).tokens
+        nodes = len(Parser(tokens).ast)
+        phases: Dict[str, Tuple[Callable[[], None], int, int]] = {
+            "tokenize": (lambda: Lexer(path, engine=engine), len(tokens), 0),
+            "parse": (lambda: Parser(tokens), len(tokens), nodes),
+            "end_to_end": (lambda: Parser(Lexer(path, engine=engine).tokens), len(tokens), nodes),
+        }
+        results = []
+        for phase in PHASES:
+            run, phase_tokens, phase_nodes = phases[phase]
+            seconds, peak = measure(run, repeat)
+            results.append(
+                BenchmarkResult(engine, shape, len(source), phase, seconds, phase_tokens, phase_nodes, peak)
+            )
+    return results
+
+
+# Token as it used to be, with a dict per instance, to compare its memory with
+@dataclass
+class DataclassToken:
+    value: str
+    type: TokenType
+    start: int = field(default=0, compare=False, repr=False)
+    end: int = field(default=0, compare=False, repr=False)
+    line: int = field(default=1, compare=False, repr=False)
+    column: int = field(default=0, compare=False, repr=False)
+
+
+TOKEN_CLASSES: Dict[str, Callable[..., object]] = {"dataclass": DataclassToken, "token": Token}
+
+
+def token_memory(source: str, engine: str = "classic") -> Dict[str, float]:
+    # Bytes held per token, values included, by the tokens of `source` built as every class of TOKEN_CLASSES.
+    # Values are sliced from the source as the scanners do, so that only interning can share them
+    positions = [
+        (token.type, token.start, token.end, token.line, token.column) for token in tokenize_source(source, engine)
+    ]
+    per_token = {}
+    for name, token_class in TOKEN_CLASSES.items():
+        tracemalloc.start()
+        try:
+            tokens = [
+                token_class(source[start:end], token_type, start, end, line, column)
+                for token_type, start, end, line, column in positions
+            ]
+            held, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        per_token[name] = held / len(tokens) if tokens else 0.0
+        del tokens
+    return per_token
+
+
+def run_suite(
+    sizes: Iterable[int], shapes: Iterable[str], engine: str = "classic", repeat: int = DEFAULT_REPEAT
+) -> List[BenchmarkResult]:
+    return [result for shape in shapes for size in sizes for result in run_benchmark(shape, size, engine, repeat)]
+
+
+def write_results(path: str, results: Iterable[BenchmarkResult]):
+    data = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "results": [result.to_json() for result in results],
+    }
+    with open(path, "w") as file:
+        json.dump(data, file, indent=2)
+
+
+def read_results(path: str) -> List[BenchmarkResult]:
+    with open(path) as file:
+        data = json.load(file)
+    if data.get("version") != RESULTS_VERSION:
+        raise ValueError(
+            f"{path} has version {data.get('version')} of the results, only {RESULTS_VERSION} is supported"
+        )
+    fields = BenchmarkResult.__dataclass_fields__
+    return [BenchmarkResult(**{name: entry[name] for name in fields}) for entry in data["results"]]
+
+
+def find_regressions(
+    results: Iterable[BenchmarkResult], baseline: Iterable[BenchmarkResult], threshold: float = DEFAULT_THRESHOLD
+) -> List[str]:
+    # Only results with a counterpart of the same engine, shape, size and phase in the baseline are compared
+    baseline_by_key = {result.key: result for result in baseline}
+    regressions = []
+    for result in results:
+        base: Optional[BenchmarkResult] = baseline_by_key.get(result.key)
+        if base is None:
+            continue
+        name = f"{result.engine}/{result.shape}/{result.size}/{result.phase}"
+        if result.seconds > base.seconds * (1 + threshold):
+            regressions.append(f"{name} took {result.seconds / base.seconds - 1:.0%} longer than the baseline")
+        if result.peak_bytes > base.peak_bytes * (1 + threshold):
+            regressions.append(
+                f"{name} took {result.peak_bytes / base.peak_bytes - 1:.0%} more memory than the baseline"
+            )
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="Benchmark the Lexer and Parser on generated sources")
+    arg_parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES), help="comma separated sizes, like 1KB,100MB")
+    arg_parser.add_argument("--shapes", default=",".join(SHAPES), help=f"comma separated shapes of {', '.join(SHAPES)}")
+    arg_parser.add_argument("--engine", default="classic", help="lexer engine to benchmark")
+    arg_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="runs per phase, the best one counts")
+    arg_parser.add_argument("-o", "--output", help="JSON file to write the results to")
+    arg_parser.add_argument("--baseline", help="JSON file of earlier results to compare against")
+    arg_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed relative regression")
+    return arg_parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    results = []
+    for shape in args.shapes.split(","):
+        for size in sizes:
+            for result in run_benchmark(shape, size, args.engine, args.repeat):
+                print(result)
+                results.append(result)
+            memory = token_memory(generate(size, shape), args.engine)
+            print(f"{shape:>9} {size:>10} B memory per token: " + ", ".join(
+                f"{bytes_per_token:.0f} B as {name}" for name, bytes_per_token in memory.items()
+            ))
+
+    if args.output is not None:
+        write_results(args.output, results)
+    if args.baseline is not None:
+        regressions = find_regressions(results, read_results(args.baseline), args.threshold)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
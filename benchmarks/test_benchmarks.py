@@ -0,0 +1,76 @@
+from typing import List
+
+from benchmarks.corpus import SHAPES, generate, parse_size
+from benchmarks.suite import (
+    PHASES, BenchmarkResult, find_regressions, read_results, run_benchmark, token_memory, write_results
+)
+import pytest
+
+
+def pytest_generate_tests(metafunc):
+    # Shapes and sizes to benchmark come from the command line
+    if "benchmark_shape" in metafunc.fixturenames:
+        metafunc.parametrize("benchmark_shape", metafunc.config.getoption("benchmark_shapes").split(","))
+    if "benchmark_size" in metafunc.fixturenames:
+        sizes = metafunc.config.getoption("benchmark_sizes").split(",")
+        metafunc.parametrize("benchmark_size", [parse_size(size) for size in sizes], ids=sizes)
+
+
+@pytest.fixture(scope="session")
+def collected_results(request) -> List[BenchmarkResult]:
+    # Written out once every benchmark ran
+    results: List[BenchmarkResult] = []
+    yield results
+    # Options without a value aren't set at all when the conftest isn't loaded up front, as in a run of the whole repo
+    output = request.config.getoption("benchmark_output", None)
+    if output is not None:
+        write_results(output, results)
+
+
+@pytest.fixture(scope="session")
+def baseline(request) -> List[BenchmarkResult]:
+    path = request.config.getoption("benchmark_baseline", None)
+    return read_results(path) if path is not None else []
+
+
+class TestCorpus:
+    @pytest.mark.parametrize("shape", SHAPES)
+    def test_is_deterministic_and_bounded(self, shape: str) -> None:
+        source = generate(4096, shape)
+        assert source == generate(4096, shape)
+        assert source != generate(4096, shape, seed=1)
+        assert 3072 < len(source) <= 4096
+        assert source.endswith("\n")
+
+    def test_parses_sizes(self) -> None:
+        assert [parse_size(size) for size in ("512", "1KB", "100mb")] == [512, 1024, 100 * 2 ** 20]
+        with pytest.raises(ValueError):
+            parse_size("big")
+
+
+class TestTokenMemory:
+    @pytest.mark.parametrize("engine", ("classic", "fast"))
+    def test_tokens_take_less_than_half_of_dataclasses(self, engine: str) -> None:
+        memory = token_memory(generate(16384, "mixed"), engine)
+        assert 0 < memory["token"] < memory["dataclass"] / 2
+
+
+class TestThroughput:
+    def test_within_threshold_of_baseline(
+        self,
+        request,
+        benchmark_shape: str,
+        benchmark_size: int,
+        collected_results: List[BenchmarkResult],
+        baseline: List[BenchmarkResult]
+    ) -> None:
+        config = request.config
+        results = run_benchmark(
+            benchmark_shape, benchmark_size, config.getoption("benchmark_engine"), config.getoption("benchmark_repeat")
+        )
+        collected_results.extend(results)
+        assert [result.phase for result in results] == list(PHASES)
+        assert all(result.tokens > 0 and result.seconds > 0 and result.peak_bytes > 0 for result in results)
+
+        regressions = find_regressions(results, baseline, config.getoption("benchmark_threshold"))
+        assert not regressions, "\n".join(regressions)
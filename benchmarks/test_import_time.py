@@ -0,0 +1,27 @@
+from benchmarks.import_time import (
+    BUDGETS, DEFERRED_MODULES, DEFERRED_RUN_MODULES, RUN_BUDGETS, loaded_modules, measure_run_imports, over_budget,
+    run, run_loaded_modules
+)
+import pytest
+
+
+class TestImportTime:
+    @pytest.mark.parametrize("modules", DEFERRED_MODULES)
+    def test_defers_modules_of_other_modes(self, modules: str) -> None:
+        assert not DEFERRED_MODULES[modules] & loaded_modules(modules)
+
+    @pytest.mark.parametrize("arguments", DEFERRED_RUN_MODULES)
+    def test_single_script_run_defers_modules_of_other_modes(self, arguments: str) -> None:
+        assert not DEFERRED_RUN_MODULES[arguments] & run_loaded_modules(arguments)
+
+    def test_imports_are_within_budget(self) -> None:
+        times = run(BUDGETS, repeat=3)
+        assert set(times) == set(BUDGETS)
+        assert all(milliseconds > 0 for milliseconds in times.values())
+        assert not over_budget(times), times
+
+    def test_single_script_run_imports_are_within_budget(self) -> None:
+        times = run(RUN_BUDGETS, repeat=3, measure=measure_run_imports)
+        assert set(times) == set(RUN_BUDGETS)
+        assert all(milliseconds > 0 for milliseconds in times.values())
+        assert not over_budget(times, RUN_BUDGETS), times
@@ -0,0 +1,130 @@
+from concurrent.futures import CancelledError, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Optional, Set, Union
+import asyncio
+import functools
+import threading
+
+from lib.ast_node import AstNode
+from lib.cache import ParseResult
+from lib.lexer import ENGINES, tokenize_source, tokenize_stream
+from lib.parser import Parser
+from lib.token import Token
+from lib.token_array import TokenArray
+from lib.utils import read_source
+
+# Tokens produced by a single step off the event loop, between which cancellation is checked
+TOKEN_BATCH_SIZE = 4096
+DEFAULT_CONCURRENCY = 8
+
+
+def _take(tokens: Iterator[Token], count: int) -> List[Token]:
+    return list(islice(tokens, count))
+
+
+def _parse_source(
+    source: str, path: Optional[str], engine: str, cancelled: Optional[threading.Event] = None
+) -> ParseResult:
+    # Runs in the executor. Threads stop at the next batch of tokens once `cancelled` is set,
+    # processes can't share the event and always finish the file
+    raw_tokens = tokenize_source(source, engine)
+    tokens = TokenArray(source)
+    while batch := _take(raw_tokens, TOKEN_BATCH_SIZE):
+        if cancelled is not None and cancelled.is_set():
+            raise CancelledError
+        tokens.extend(batch)
+    tokens = tokens[:]
+    ast = tuple(
+        AstNode(type=node.type, source=tokens, start=node.start, end=node.end) for node in Parser(tokens).ast
+    )
+    return ParseResult(source, tokens, ast, path)
+
+
+def _check_engine(engine: str):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown lexer engine '{engine}', available: {', '.join(ENGINES)}")
+
+
+async def parse_file(path: str, engine: str = "classic", executor: Optional[Executor] = None) -> ParseResult:
+    # The file is read on the default executor of the loop, tokenized and parsed on `executor`,
+    # the default one too when not given. Cancelling stops a thread before its next batch of tokens
+    _check_engine(engine)
+    loop = asyncio.get_running_loop()
+    source = await loop.run_in_executor(None, read_source, path)
+    if isinstance(executor, ProcessPoolExecutor):
+        return await loop.run_in_executor(executor, _parse_source, source, path, engine)
+
+    cancelled = threading.Event()
+    try:
+        return await loop.run_in_executor(executor, _parse_source, source, path, engine, cancelled)
+    finally:
+        cancelled.set()
+
+
+async def iter_tokens(
+    path: str, engine: str = "classic", executor: Optional[Executor] = None, batch_size: int = TOKEN_BATCH_SIZE
+) -> AsyncIterator[Token]:
+    # The file is read and tokenized a batch at a time on `executor`, so only a batch is ever held.
+    # The tokenizer is resumed from whichever thread runs the next batch, which processes can't do
+    _check_engine(engine)
+    if isinstance(executor, ProcessPoolExecutor):
+        raise ValueError("Tokens are only iterated on threads")
+    loop = asyncio.get_running_loop()
+    file = await loop.run_in_executor(executor, functools.partial(open, path, encoding="utf-8"))
+    try:
+        tokens = tokenize_stream(file, engine)
+        while batch := await loop.run_in_executor(executor, _take, tokens, batch_size):
+            for token in batch:
+                yield token
+    finally:
+        file.close()
+
+
+async def _iter_paths(paths: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    if isinstance(paths, AsyncIterable):
+        async for path in paths:
+            yield path
+    else:
+        for path in paths:
+            yield path
+
+
+async def parse_many(
+    paths: Union[Iterable[str], AsyncIterable[str]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    engine: str = "classic",
+    executor: Union[Executor, str, None] = None
+) -> AsyncIterator[ParseResult]:
+    # Yields results as files are done, with at most `concurrency` of them in flight. No more paths are taken
+    # while the consumer doesn't take the results, and the first error cancels the remaining files.
+    # `executor` can also be "thread" or "process", for a pool of `concurrency` workers only used by this call
+    _check_engine(engine)
+    if concurrency < 1:
+        raise ValueError("At least a single file has to be parsed at a time")
+    own_executor = None
+    if executor == "thread":
+        executor = own_executor = ThreadPoolExecutor(max_workers=concurrency)
+    elif executor == "process":
+        executor = own_executor = ProcessPoolExecutor(max_workers=concurrency)
+    elif isinstance(executor, str):
+        raise ValueError(f"Unknown executor '{executor}', available: thread, process")
+
+    pending: Set[asyncio.Future] = set()
+    try:
+        async for path in _iter_paths(paths):
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            pending.add(asyncio.ensure_future(parse_file(path, engine, executor)))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if own_executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, own_executor.shutdown)
@@ -1,9 +1,8 @@
-from abc import abstractmethod, ABC, abstractstaticmethod
-from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional, Type
+from typing import ClassVar, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Type, Union
 
-from lib.token import TokenType, Token
+from lib.token import TokenType, Token, TOKEN_TYPES, TOKEN_TYPE_IDS
+from lib.token_array import lazy_type_ids
 
 
 class AstNodeType(Enum):
@@ -13,164 +12,338 @@ class AstNodeType(Enum):
     IMPORT = 'IMPORT'
 
 
-@dataclass
+# References a range of tokens of the sequence it was parsed from, which only gets sliced when accessed.
+# Can also be created from a list of tokens directly. Immutable and hashable like its tokens, the slice is only cached
 class AstNode:
-    tokens: List[Token]
+    __slots__ = ("type", "source", "start", "end", "_tokens")
     type: AstNodeType
+    source: Sequence[Token]
+    start: int
+    end: int
+
+    def __init__(
+        self,
+        tokens: Optional[Sequence[Token]] = None,
+        type: Optional[AstNodeType] = None,
+        source: Optional[Sequence[Token]] = None,
+        start: int = 0,
+        end: Optional[int] = None
+    ):
+        if source is None:
+            tokens = tokens if tokens is not None else []
+            source, start, end = tokens, 0, len(tokens)
+        else:
+            tokens = None
+            end = end if end is not None else len(source)
+        object.__setattr__(self, "type", type)
+        object.__setattr__(self, "source", source)
+        object.__setattr__(self, "start", start)
+        object.__setattr__(self, "end", end)
+        object.__setattr__(self, "_tokens", tokens)
+
+    @property
+    def tokens(self) -> Sequence[Token]:
+        if self._tokens is None:
+            object.__setattr__(self, "_tokens", self.source[self.start:self.end])
+        return self._tokens
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f"Can't set '{name}', AstNode is immutable")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"Can't delete '{name}', AstNode is immutable")
+
+    def __reduce__(self):
+        return AstNode, (None, self.type, self.source, self.start, self.end)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, AstNode):
+            return NotImplemented
+        return self.type == other.type and len(self) == len(other) and list(self.tokens) == list(other.tokens)
+
+    def __hash__(self) -> int:
+        return hash((self.type, tuple(self.tokens)))
+
+    def __repr__(self) -> str:
+        return f"AstNode(tokens={list(self.tokens)!r}, type={self.type!r})"
+
+
+# Named tuples rather than dataclasses, which take long to import
+class AstPatternElement(NamedTuple):
+    # A token of this type, or of any of these types
+    token: Union[TokenType, Tuple[TokenType, ...]]
+    optional: bool = False
+    # Matches one or more times, any number of times if also optional
+    repeated: bool = False
 
 
-@dataclass
-class AstPatternElement:
-    token: TokenType
+class AstPatternGroup(NamedTuple):
+    elements: Tuple["AstPatternPart", ...]
     optional: bool = False
+    repeated: bool = False
 
 
-class AstPattern(ABC):
-    cursor = -1
-    tokens: List[Token] = []
+class AstPatternChoice(NamedTuple):
+    alternatives: Tuple["AstPatternPart", ...]
+    optional: bool = False
+    repeated: bool = False
+
+
+AstPatternPart = Union[AstPatternElement, AstPatternGroup, AstPatternChoice]
+
+
+# Nondeterministic automaton with a state per position in the patterns, only used to compile the deterministic one
+class _PatternNfa:
+    def __init__(self):
+        self.epsilon: List[List[int]] = []
+        self.moves: List[List[Tuple[FrozenSet[int], int]]] = []
+        self.accepting: Dict[int, int] = {}
+
+    def add_state(self) -> int:
+        self.epsilon.append([])
+        self.moves.append([])
+        return len(self.moves) - 1
+
+    def add_part(self, part: AstPatternPart, start: int) -> int:
+        # Wrapped in states of its own, so that skipping and repeating the part can't leak into its neighbours
+        part_start = self.add_state()
+        self.epsilon[start].append(part_start)
+        if isinstance(part, AstPatternElement):
+            token_types = part.token if isinstance(part.token, tuple) else (part.token,)
+            part_end = self.add_state()
+            self.moves[part_start].append((frozenset(TOKEN_TYPE_IDS[t] for t in token_types), part_end))
+        elif isinstance(part, AstPatternGroup):
+            part_end = part_start
+            for element in part.elements:
+                part_end = self.add_part(element, part_end)
+        else:
+            part_end = self.add_state()
+            for alternative in part.alternatives:
+                self.epsilon[self.add_part(alternative, part_start)].append(part_end)
+
+        end = self.add_state()
+        self.epsilon[part_end].append(end)
+        if part.repeated:
+            self.epsilon[part_end].append(part_start)
+        if part.optional:
+            self.epsilon[start].append(end)
+        return end
+
+    def closure(self, states: Iterable[int]) -> FrozenSet[int]:
+        result = set(states)
+        stack = list(result)
+        while stack:
+            for state in self.epsilon[stack.pop()]:
+                if state not in result:
+                    result.add(state)
+                    stack.append(state)
+        return frozenset(result)
+
+
+# Deterministic automaton over token type ids recognizing all the given patterns at once.
+# Each state has a row of next states indexed by the type id, -1 where no pattern can continue
+class AstPatternAutomaton:
+    transitions: List[List[int]]
+    accepting: List[Optional[Type["AstPattern"]]]
+
+    def __init__(self, patterns: Iterable[Type["AstPattern"]] = ()):
+        self._pending: Optional[List[Type["AstPattern"]]] = None
+        self.compile(patterns)
+
+    def compile(self, patterns: Iterable[Type["AstPattern"]]):
+        self._pending = None
+        patterns = list(patterns)
+        nfa = _PatternNfa()
+        nfa_start = nfa.add_state()
+        for i, pattern in enumerate(patterns):
+            nfa.accepting[nfa.add_part(AstPatternGroup(pattern.elements), nfa_start)] = i
+
+        # Subset construction, every reachable set of NFA states becomes a single state
+        self.transitions = []
+        self.accepting = []
+        state_ids: Dict[FrozenSet[int], int] = {}
+        pending = [nfa.closure([nfa_start])]
+        state_ids[pending[0]] = 0
+        while pending:
+            states = pending.pop()
+            row = [-1] * len(TOKEN_TYPES)
+            targets: Dict[int, set] = {}
+            for state in states:
+                for type_ids, target in nfa.moves[state]:
+                    for type_id in type_ids:
+                        targets.setdefault(type_id, set()).add(target)
+            for type_id, target_states in targets.items():
+                target_states = nfa.closure(target_states)
+                if target_states not in state_ids:
+                    state_ids[target_states] = len(state_ids)
+                    pending.append(target_states)
+                row[type_id] = state_ids[target_states]
+
+            state_id = state_ids[states]
+            while len(self.transitions) <= state_id:
+                self.transitions.append([])
+                self.accepting.append(None)
+            self.transitions[state_id] = row
+            # When patterns match the same tokens, the one registered first wins
+            matched = [nfa.accepting[state] for state in states if state in nfa.accepting]
+            self.accepting[state_id] = patterns[min(matched)] if matched else None
+
+        if self.accepting[0] is not None:
+            raise ValueError(f"Pattern {self.accepting[0].__name__} matches no tokens")
+
+    def compile_later(self, patterns: List[Type["AstPattern"]]):
+        # Compiled once it's next used, so that registering several patterns in a row, as importing does,
+        # only compiles them once
+        self._pending = patterns
+
+    def ensure_compiled(self) -> "AstPatternAutomaton":
+        if self._pending is not None:
+            self.compile(self._pending)
+        return self
+
+    def first(self) -> Tuple[TokenType, ...]:
+        self.ensure_compiled()
+        return tuple(TOKEN_TYPES[type_id] for type_id, state in enumerate(self.transitions[0]) if state >= 0)
+
+    # Returns the longest match starting at `start` and its length in tokens
+    def match(self, type_ids: Sequence[int], start: int = 0) -> Optional[Tuple[Type["AstPattern"], int]]:
+        if self._pending is not None:
+            self.compile(self._pending)
+        transitions = self.transitions
+        accepting = self.accepting
+        result = None
+        state = 0
+        for i in range(start, len(type_ids)):
+            state = transitions[state][type_ids[i]]
+            if state < 0:
+                break
+            if accepting[state] is not None:
+                result = (accepting[state], i + 1 - start)
+        return result
+
+
+# Every pattern with elements registers itself on definition, in definition order, and gets compiled into
+# the automaton the parser matches all of them with at once. The dispatch table maps each token type to the
+# patterns which can start with it
+AST_PATTERNS: List[Type["AstPattern"]] = []
+PATTERN_DISPATCH: Dict[TokenType, List[Type["AstPattern"]]] = {token_type: [] for token_type in TokenType}
+PATTERN_AUTOMATON = AstPatternAutomaton()
+
+
+# Matches against a shared sequence of tokens starting at `start`, without copying any of it,
+# so that a single instance can be reused for every position by resetting its cursor
+class AstPattern:
+    start = 0
+    tokens: Sequence[Token] = []
     type: AstNodeType
-
-    _cursor_transaction = -1
-
-    def __init__(self, tokens: List[Token]):
+    elements: ClassVar[Tuple[AstPatternPart, ...]] = ()
+    # Types of the tokens a match can start with, derived from the elements
+    first: ClassVar[Tuple[TokenType, ...]] = ()
+    automaton: ClassVar[AstPatternAutomaton]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not cls.elements:
+            return
+        cls.automaton = AstPatternAutomaton([cls])
+        cls.first = cls.automaton.first()
+        AST_PATTERNS.append(cls)
+        for token_type in cls.first:
+            PATTERN_DISPATCH[token_type].append(cls)
+        PATTERN_AUTOMATON.compile_later(AST_PATTERNS)
+
+    def __init__(self, tokens: Sequence[Token], start: int = 0):
         self.tokens = tokens
+        self.start = start
 
-    def reset_cursor(self):
-        self.cursor = -1
-        self._cursor_transaction = -1
-
-    def get_current_token(self):
-        return self.tokens[self.cursor]
-
-    def get_next_token(self) -> Token:
-        self.cursor += 1
-        return self.get_current_token()
-
-    def is_current_token_type(self, token_type: TokenType) -> bool:
-        token = self.get_current_token()
-        return token.type == token_type
-
-    def is_next_token_type(self, token_type: TokenType) -> bool:
-        next_token = self.get_next_token()
-        return next_token.type == token_type
-
-    def is_next_token_type_one_of(self, token_types: List[TokenType]) -> bool:
-        next_token = self.get_next_token()
-        return next_token.type in token_types
-
-    def start_transaction(self):
-        self._cursor_transaction = self.cursor
+    def reset_cursor(self, start: Optional[int] = None):
+        if start is not None:
+            self.start = start
 
-    def rollback_transaction(self):
-        self.cursor = self._cursor_transaction
+    def match(self) -> Optional[AstNode]:
+        # Only the type ids of the tokens the automaton steps over are looked up
+        result = self.automaton.match(lazy_type_ids(self.tokens), self.start)
+        if result is None:
+            return None
+        return AstNode(type=self.type, source=self.tokens, start=self.start, end=self.start + result[1])
 
-    def get_resulting_node(self) -> AstNode:
-        amount = self.cursor + 1
-        return AstNode(tokens=self.tokens[0:amount], type=self.type)
 
-    @abstractmethod
-    def match(self) -> Optional[AstNode]:
-        pass
+VALUE_TOKENS = (
+    TokenType.INT_LITERAL, TokenType.FLOAT_LITERAL, TokenType.STR_LITERAL,
+    TokenType.TRUE, TokenType.FALSE, TokenType.NONE, TokenType.IDENTIFIER
+)
 
 
 class AstAssignmentPattern(AstPattern):
     type = AstNodeType.ASSIGNMENT
-
-    def match(self) -> Optional[AstNode]:
-        if not self.is_next_token_type(TokenType.IDENTIFIER):
-            return None
-        # TODO: Complex type hints, e.g. List[Optional[int]]
-        if self.is_next_token_type(TokenType.COLON):
-            if not self.is_next_token_type(TokenType.IDENTIFIER):
-                return None
-            self.get_next_token()
-        # TODO: Declaration only, no assignment
-        # TODO: Complex operators, e.g. MULT_EQ
-        elif not self.is_current_token_type(TokenType.EQ):
-            return None
-        # TODO: Expressions (make the value be an AstNode?)
-        if self.is_next_token_type_one_of([
-            TokenType.INT_LITERAL, TokenType.FLOAT_LITERAL, TokenType.STR_LITERAL,
-            TokenType.TRUE, TokenType.FALSE, TokenType.NONE, TokenType.IDENTIFIER]
-        ):
-            return self.get_resulting_node()
-        return None
+    # TODO: Complex type hints, e.g. List[Optional[int]]
+    # TODO: Declaration only, no assignment
+    # TODO: Complex operators, e.g. MULT_EQ
+    # TODO: Expressions (make the value be an AstNode?)
+    elements = (
+        AstPatternElement(TokenType.IDENTIFIER),
+        AstPatternGroup((AstPatternElement(TokenType.COLON), AstPatternElement(TokenType.IDENTIFIER)), optional=True),
+        AstPatternElement(TokenType.EQ),
+        AstPatternElement(VALUE_TOKENS),
+    )
 
 
 class AstClassPattern(AstPattern):
     type = AstNodeType.CLASS
-
-    def match(self) -> Optional[AstNode]:
-        if not self.is_next_token_type(TokenType.CLASS):
-            return None
-        if not self.is_next_token_type(TokenType.IDENTIFIER):
-            return None
-        if self.is_next_token_type(TokenType.COLON):
-            return self.get_resulting_node()
-
-        if not self.is_current_token_type(TokenType.OPEN_PAREN):
-            return None
-
-        while True:
-            if self.is_next_token_type(TokenType.IDENTIFIER):
-                if self.is_next_token_type(TokenType.COMMA):
-                    continue
-                if self.is_current_token_type(TokenType.CLOSE_PAREN):
-                    break
-                return None
-            else:
-                return None
-
-        if self.is_next_token_type(TokenType.COLON):
-            return self.get_resulting_node()
-        return None
-
-        # TODO: Class properties
-        # TODO: Class methods
+    # TODO: Class properties
+    # TODO: Class methods
+    elements = (
+        AstPatternElement(TokenType.CLASS),
+        AstPatternElement(TokenType.IDENTIFIER),
+        AstPatternGroup((
+            AstPatternElement(TokenType.OPEN_PAREN),
+            AstPatternElement(TokenType.IDENTIFIER),
+            AstPatternGroup(
+                (AstPatternElement(TokenType.COMMA), AstPatternElement(TokenType.IDENTIFIER)),
+                optional=True, repeated=True
+            ),
+            AstPatternElement(TokenType.CLOSE_PAREN),
+        ), optional=True),
+        AstPatternElement(TokenType.COLON),
+    )
 
 
 class AstDefPattern(AstPattern):
     type = AstNodeType.DEF
-
-    def match(self) -> Optional[AstNode]:
-        if not self.is_next_token_type(TokenType.DEF):
-            return None
-        if not self.is_next_token_type(TokenType.IDENTIFIER):
-            return None
-        if not self.is_next_token_type(TokenType.OPEN_PAREN):
-            return None
-        # TODO: Multiple comma-separated identifiers
-        # TODO: Types of arguments
-        # TODO: Default arguments (assignments)
-        if not self.is_next_token_type(TokenType.CLOSE_PAREN):
-            return None
-        # TODO: Return type
-        if self.is_next_token_type(TokenType.COLON):
-            return self.get_resulting_node()
-        return None
+    # TODO: Multiple comma-separated identifiers
+    # TODO: Types of arguments
+    # TODO: Default arguments (assignments)
+    # TODO: Return type
+    elements = (
+        AstPatternElement(TokenType.DEF),
+        AstPatternElement(TokenType.IDENTIFIER),
+        AstPatternElement(TokenType.OPEN_PAREN),
+        AstPatternElement(TokenType.CLOSE_PAREN),
+        AstPatternElement(TokenType.COLON),
+    )
+
+
+DOTTED_NAME = AstPatternGroup((
+    AstPatternElement(TokenType.IDENTIFIER),
+    AstPatternGroup((AstPatternElement(TokenType.DOT), AstPatternElement(TokenType.IDENTIFIER)),
+                    optional=True, repeated=True),
+))
 
 
 class AstImportPattern(AstPattern):
     type = AstNodeType.IMPORT
-
-    def match_import_part(self) -> Optional[AstNode]:
-        if not self.is_next_token_type(TokenType.IMPORT):
-            return None
-        # TODO: Multiple comma-separated identifiers
-        # TODO: Parentheses
-        if self.is_next_token_type(TokenType.IDENTIFIER):
-            return self.get_resulting_node()
-        return None
-
-    def match(self) -> Optional[AstNode]:
-        if self.is_next_token_type(TokenType.FROM):
-            if not self.is_next_token_type(TokenType.IDENTIFIER):
-                return None
-            return self.match_import_part()
-
-        self.reset_cursor()
-        return self.match_import_part()
-
-
-
-AST_PATTERNS: List[Type[AstPattern]] = [AstImportPattern, AstClassPattern, AstDefPattern, AstAssignmentPattern]
+    # TODO: Multiple comma-separated identifiers
+    # TODO: Parentheses
+    elements = (
+        AstPatternGroup((
+            AstPatternElement(TokenType.FROM),
+            # Relative imports, `...` is read as an ellipsis
+            AstPatternElement((TokenType.DOT, TokenType.ELLIPSIS), optional=True, repeated=True),
+            DOTTED_NAME._replace(optional=True),
+        ), optional=True),
+        AstPatternElement(TokenType.IMPORT),
+        DOTTED_NAME,
+    )
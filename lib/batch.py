@@ -0,0 +1,124 @@
+from concurrent.futures import as_completed, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional
+import os
+import time
+
+from lib.disk_cache import DEFAULT_MAX_SIZE, DiskCache
+from lib.lexer import ENGINES, Lexer
+from lib.parser import Parser
+from lib.stats import Stats
+from lib.utils import discover_files
+
+
+@dataclass
+class FileResult:
+    path: str
+    tokens: int = 0
+    nodes: int = 0
+    # Set instead of the counts when lexing or parsing the file failed
+    error: Optional[str] = None
+    # Only collected when asked for
+    stats: Optional[Stats] = None
+
+
+@dataclass
+class BatchSummary:
+    files: int = 0
+    failed: int = 0
+    tokens: int = 0
+    nodes: int = 0
+    wall_time: float = 0.0
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def add(self, result: FileResult):
+        self.files += 1
+        if result.error is not None:
+            self.failed += 1
+        self.tokens += result.tokens
+        self.nodes += result.nodes
+        self.wall_time = time.perf_counter() - self.started
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.wall_time if self.wall_time else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.files} files ({self.failed} failed), {self.tokens} tokens, {self.nodes} nodes "
+            f"in {self.wall_time:.2f}s ({self.files_per_second:.1f} files/s, {self.tokens_per_second:.0f} tokens/s)"
+        )
+
+
+def process_file(
+    path: str, engine: str = "classic", cache: Optional[DiskCache] = None, collect_stats: bool = False
+) -> FileResult:
+    stats = Stats() if collect_stats else None
+    try:
+        # Unchanged files are counted from the stat data in the cache, without reading them
+        record = cache.lookup(path, ENGINES[engine].variant) if cache is not None and engine in ENGINES else None
+        if record is not None:
+            return FileResult(path, tokens=record.tokens, nodes=record.nodes, stats=stats)
+        lexer = Lexer(path, engine=engine, cache=cache, stats=stats)
+        parser = Parser(lexer.tokens, ast=lexer.ast, stats=stats)
+    except Exception as e:
+        return FileResult(path, error=f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+    return FileResult(path, tokens=len(lexer.tokens), nodes=len(parser.ast), stats=stats)
+
+
+def _process_chunk(
+    paths: List[str], engine: str, cache_dir: Optional[str], cache_size: int, collect_stats: bool
+) -> List[FileResult]:
+    cache = DiskCache(cache_dir, cache_size) if cache_dir is not None else None
+    return [process_file(path, engine, cache, collect_stats) for path in paths]
+
+
+def _chunk_results(future: Future, paths: List[str]) -> List[FileResult]:
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        # A worker died (e.g. killed by the OS), only the files of its chunks are lost
+        return [FileResult(path, error=f"{type(e).__name__}: {e}") for path in paths]
+
+
+def process_tree(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    chunk_size: Optional[int] = None,
+    engine: str = "classic",
+    cache_dir: Optional[str] = None,
+    cache_size: int = DEFAULT_MAX_SIZE,
+    collect_stats: bool = False
+) -> Iterator[FileResult]:
+    # Lexes and parses all .py files found in `paths` across `workers` processes (all CPUs by default),
+    # yielding a result per file as soon as its chunk is done, in the order of the files if `ordered`
+    files = discover_files(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) <= 1:
+        cache = DiskCache(cache_dir, cache_size) if cache_dir is not None else None
+        for path in files:
+            yield process_file(path, engine, cache, collect_stats)
+        return
+
+    # Several chunks per worker keep all of them busy when files differ in size,
+    # while still sending few enough tasks for the overhead not to matter
+    chunk_size = chunk_size or max(1, min(64, len(files) // (workers * 4)))
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = {
+            executor.submit(_process_chunk, chunk, engine, cache_dir, cache_size, collect_stats): chunk
+            for chunk in chunks
+        }
+        try:
+            for future in (futures if ordered else as_completed(futures)):
+                yield from _chunk_results(future, futures[future])
+        finally:
+            # Stopping the iteration early shouldn't wait for the remaining chunks
+            for future in futures:
+                future.cancel()
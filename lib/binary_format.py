@@ -0,0 +1,233 @@
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
+from typing import BinaryIO, Dict, Iterable, List, Union, overload
+import mmap
+import struct
+import sys
+
+from lib.ast_node import AstNode, AstNodeType
+from lib.token import Token, TokenType, TOKEN_TYPES, TOKEN_TYPE_IDS
+
+
+# Layout of a file, all numbers little-endian:
+#   header       magic, version, counts of the sections below and their offsets
+#   tokens       a (type id, string index, start, end) record per token, in order
+#   strings      offsets of the end of every string in the blob, then the UTF-8 blob of all distinct token values
+#   lines        line numbers and the offsets they start at, for the lines any token is on
+#   nodes        a (type id, first token, end token) record per AST node
+# Tokens are written as they come, everything else once the writer is closed
+MAGIC = b"PYDT"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sHxxIIII5Q")
+TOKEN_RECORD = struct.Struct("<BIII")
+NODE_RECORD = struct.Struct("<BII")
+AST_NODE_TYPES: List[AstNodeType] = list(AstNodeType)
+AST_NODE_TYPE_IDS: Dict[AstNodeType, int] = {node_type: i for i, node_type in enumerate(AST_NODE_TYPES)}
+
+
+class BinaryWriter:
+    file: BinaryIO
+    token_count: int
+
+    # `file` has to be seekable, the header is written again with the final counts and offsets when closing
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.token_count = 0
+        self._start = file.tell()
+        self._strings: Dict[str, int] = {}
+        self._line_starts: Dict[int, int] = {}
+        self._nodes = bytearray()
+        self._node_count = 0
+        self._closed = False
+        file.write(bytes(HEADER.size))
+
+    def write_token(self, token: Token):
+        string_index = self._strings.setdefault(token.value, len(self._strings))
+        self._line_starts.setdefault(token.line, token.start - token.column)
+        self.file.write(TOKEN_RECORD.pack(TOKEN_TYPE_IDS[token.type], string_index, token.start, token.end))
+        self.token_count += 1
+
+    def write_tokens(self, tokens: Iterable[Token]):
+        for token in tokens:
+            self.write_token(token)
+
+    def write_node(self, node: AstNode):
+        if not 0 <= node.start <= node.end <= self.token_count:
+            raise ValueError("AST node out of range of the written tokens")
+        self._nodes += NODE_RECORD.pack(AST_NODE_TYPE_IDS[node.type], node.start, node.end)
+        self._node_count += 1
+
+    def write_nodes(self, nodes: Iterable[AstNode]):
+        for node in nodes:
+            self.write_node(node)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        tokens_offset = HEADER.size
+
+        strings_offset = self._tell()
+        blobs = [value.encode("utf-8", "surrogatepass") for value in self._strings]
+        ends = array('I')
+        end = 0
+        for blob in blobs:
+            end += len(blob)
+            ends.append(end)
+        self._write_array(ends)
+        for blob in blobs:
+            self.file.write(blob)
+
+        lines_offset = self._tell()
+        lines = sorted(self._line_starts)
+        self._write_array(array('I', lines))
+        self._write_array(array('I', (self._line_starts[line] for line in lines)))
+
+        nodes_offset = self._tell()
+        self.file.write(self._nodes)
+        end_offset = self._tell()
+
+        self.file.seek(self._start)
+        self.file.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, self.token_count, len(blobs), len(lines), self._node_count,
+            tokens_offset, strings_offset, lines_offset, nodes_offset, end_offset
+        ))
+        self.file.seek(self._start + end_offset)
+
+    def __enter__(self) -> "BinaryWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _tell(self) -> int:
+        return self.file.tell() - self._start
+
+    def _write_array(self, values: array):
+        if values.itemsize != 4:
+            raise ValueError("Only 4 byte arrays are written")
+        # Arrays are stored little-endian regardless of the platform
+        if sys.byteorder != "little":
+            values = array(values.typecode, values)
+            values.byteswap()
+        self.file.write(values.tobytes())
+
+
+# Random access to the tokens and nodes of a file through mmap, each one is only decoded when accessed
+class BinaryReader(Sequence):
+    path: str
+    token_count: int
+    string_count: int
+    line_count: int
+    node_count: int
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is too short for a header")
+
+        (
+            magic, version, self.token_count, self.string_count, self.line_count, self.node_count,
+            self._tokens_offset, self._strings_offset, self._lines_offset, self._nodes_offset, end_offset
+        ) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a token file")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path} has version {version} of the format, only {FORMAT_VERSION} is supported")
+        if end_offset > len(self._mmap):
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+        self._string_ends = self._array_at(self._strings_offset, self.string_count)
+        self._blob_offset = self._strings_offset + 4 * self.string_count
+        self._lines = self._array_at(self._lines_offset, self.line_count)
+        self._line_starts = self._array_at(self._lines_offset + 4 * self.line_count, self.line_count)
+
+    def string(self, i: int) -> str:
+        start = self._string_ends[i - 1] if i > 0 else 0
+        blob = self._mmap[self._blob_offset + start:self._blob_offset + self._string_ends[i]]
+        return blob.decode("utf-8", "surrogatepass")
+
+    def type_at(self, i: int) -> TokenType:
+        return TOKEN_TYPES[self._mmap[self._tokens_offset + self._index(i) * TOKEN_RECORD.size]]
+
+    def value_at(self, i: int) -> str:
+        offset = self._tokens_offset + self._index(i) * TOKEN_RECORD.size
+        return self.string(TOKEN_RECORD.unpack_from(self._mmap, offset)[1])
+
+    def node(self, i: int) -> AstNode:
+        if not 0 <= i < self.node_count:
+            raise IndexError("Node index out of range")
+        type_id, start, end = NODE_RECORD.unpack_from(self._mmap, self._nodes_offset + i * NODE_RECORD.size)
+        return AstNode(type=AST_NODE_TYPES[type_id], source=self, start=start, end=end)
+
+    def nodes(self) -> List[AstNode]:
+        return [self.node(i) for i in range(self.node_count)]
+
+    def __len__(self) -> int:
+        return self.token_count
+
+    @overload
+    def __getitem__(self, i: int) -> Token: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[Token]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Token, List[Token]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        type_id, string_index, start, end = TOKEN_RECORD.unpack_from(
+            self._mmap, self._tokens_offset + self._index(i) * TOKEN_RECORD.size
+        )
+        line_index = bisect_right(self._line_starts, start) - 1
+        return Token(
+            value=self.string(string_index),
+            type=TOKEN_TYPES[type_id],
+            start=start,
+            end=end,
+            line=self._lines[line_index] if line_index >= 0 else 1,
+            column=start - self._line_starts[line_index] if line_index >= 0 else start
+        )
+
+    def close(self):
+        # Views of the mmap have to be released before it can be closed
+        for name in ("_string_ends", "_lines", "_line_starts"):
+            view = self.__dict__.pop(name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "BinaryReader":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _array_at(self, offset: int, count: int) -> Union[memoryview, array]:
+        view = memoryview(self._mmap)[offset:offset + 4 * count]
+        if sys.byteorder == "little":
+            return view.cast('I')
+        values = array('I', view.tobytes())
+        view.release()
+        values.byteswap()
+        return values
+
+    def _index(self, i: int) -> int:
+        if i < 0:
+            i += self.token_count
+        if not 0 <= i < self.token_count:
+            raise IndexError("Token index out of range")
+        return i
+
+
+def write_file(path: str, tokens: Iterable[Token], ast: Iterable[AstNode] = ()):
+    with open(path, "wb") as file, BinaryWriter(file) as writer:
+        writer.write_tokens(tokens)
+        writer.write_nodes(ast)
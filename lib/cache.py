@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional, Tuple, Union
+import hashlib
+import os
+import threading
+
+from lib.ast_node import AstNode
+from lib.lexer import Lexer
+from lib.parser import Parser
+from lib.token_array import TokenArray
+
+
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_MAX_TOKENS = 1_000_000
+
+
+# Shared between every caller getting it from the cache, so nothing of it can be changed:
+# the tokens are a view of a TokenArray, which can't be appended to, and the nodes are ranges of that view
+@dataclass(frozen=True)
+class ParseResult:
+    source: str
+    tokens: TokenArray
+    ast: Tuple[AstNode, ...]
+    path: Optional[str] = None
+
+
+# Keeps the most recently requested results in memory, bounded by their number and by the number of tokens
+# they hold altogether. Files are keyed by their path along with their stat data, sources by their hash
+class ResultCache:
+    max_entries: int
+    max_tokens: int
+    engine: str
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        engine: str = "classic"
+    ):
+        self.max_entries = max_entries
+        self.max_tokens = max_tokens
+        self.engine = engine
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, ParseResult]" = OrderedDict()
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def get_ast(self, path: Optional[Union[str, os.PathLike]] = None, source: Optional[str] = None) -> ParseResult:
+        # Either the file at `path` or the `source` given, a path is never taken for a source or the other way round
+        if (path is None) == (source is None):
+            raise ValueError("Either a path or a source has to be given")
+        if path is not None:
+            path = os.fspath(path)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"{path} doesn't lead to a file") from None
+            key = ("path", os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        else:
+            key = ("source", hashlib.blake2b(source.encode("utf-8", "surrogatepass")).digest())
+
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        # Parsed outside of the lock, concurrent misses of the same key just parse it more than once
+        result = self._parse(path, source)
+        with self._lock:
+            self._add(key, result)
+        return result
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens = 0
+
+    def _parse(self, path: Optional[str], source: Optional[str]) -> ParseResult:
+        if path is not None:
+            lexer = Lexer(path, engine=self.engine, columnar=True)
+        else:
+            lexer = Lexer(engine=self.engine, columnar=True)
+            lexer.reset(source)
+        parser = Parser(lexer.tokens)
+        tokens = lexer.tokens[:]
+        ast = tuple(AstNode(type=node.type, source=tokens, start=node.start, end=node.end) for node in parser.ast)
+        return ParseResult(lexer.source, tokens, ast, path)
+
+    def _add(self, key: Hashable, result: ParseResult):
+        # Results too big for the cache are only returned
+        if len(result.tokens) > self.max_tokens or key in self._entries:
+            return
+        self._entries[key] = result
+        self._tokens += len(result.tokens)
+        while len(self._entries) > self.max_entries or self._tokens > self.max_tokens:
+            _, evicted = self._entries.popitem(last=False)
+            self._tokens -= len(evicted.tokens)
+            self.evictions += 1
+
+
+DEFAULT_CACHE = ResultCache()
+
+
+def get_ast(path: Optional[Union[str, os.PathLike]] = None, source: Optional[str] = None) -> ParseResult:
+    return DEFAULT_CACHE.get_ast(path, source)
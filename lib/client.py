@@ -0,0 +1,61 @@
+from typing import Iterable, Iterator, List, Optional
+import json
+import os
+import socket
+import tempfile
+
+# Requests and responses are JSON objects, one per line, any number of them on a connection:
+#   {"path": "/abs/script.py" | "source": "...", "output": ["tokens", "ast", "stats"], "engine": "classic"}
+#   {"command": "ping" | "shutdown"}
+# Responses have "ok", and either the requested outputs or an "error".
+# Only the standard library is imported here, so that a client starts as fast as possible
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), f"pydoc-{os.getuid()}.sock")
+OUTPUTS = ("tokens", "ast", "stats")
+
+
+class Client:
+    socket_path: str
+
+    # Keeps a single connection open for any number of requests
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: Optional[float] = None):
+        self.socket_path = socket_path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(socket_path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile("rwb")
+
+    def request(self, request: dict) -> dict:
+        self._file.write(json.dumps(request).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def is_running(socket_path: str = DEFAULT_SOCKET_PATH) -> bool:
+    try:
+        with Client(socket_path, timeout=1.0) as client:
+            return client.request({"command": "ping"}).get("ok", False)
+    except OSError:
+        return False
+
+
+def file_requests(paths: Iterable[str], output: List[str], engine: Optional[str] = None) -> Iterator[dict]:
+    # Paths are made absolute, the server doesn't share the working directory of the client
+    for path in paths:
+        yield {"path": os.path.abspath(path), "output": output, "engine": engine}
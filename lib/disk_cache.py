@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+import hashlib
+import os
+import pickle
+import time
+
+from lib.ast_node import AstNode, AstNodeType
+from lib.token import Token
+from lib.token_array import TokenArray
+from lib.utils import read_source, write_atomically
+
+
+# Bump whenever the tokens or the AST produced for the same source change, entries of other versions are ignored
+FORMAT_VERSION = 10
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+# Entries are only marked as used again after this many seconds, so that warm runs don't rewrite their times
+LRU_RESOLUTION = 60
+# A file modified this recently may still change without its mtime changing
+RACY_STAT_SECONDS = 2
+
+
+@dataclass
+class CacheRecord:
+    # Stat data of the file when it had the content with `content_hash`, checked instead of hashing it again
+    mtime_ns: int
+    size: int
+    inode: int
+    content_hash: str
+    tokens: int
+    nodes: int
+
+
+@dataclass
+class CacheEntry:
+    source: str
+    tokens: TokenArray
+    # (type, start, end) of every node, ranges of `tokens`
+    ast: List[Tuple[AstNodeType, int, int]]
+
+
+# Stores the tokens and the AST of files in `directory`, keyed by a hash of their content. Records per path remember
+# the stat data of the file along with its hash, so that unchanged files are found without reading them.
+# Tokens of a variant other than the default one, as produced by some lexer engines, are stored apart.
+# Every file is written atomically, so the cache can be shared by any number of processes
+class DiskCache:
+    directory: str
+    max_size: int
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = os.path.join(directory, f"v{FORMAT_VERSION}")
+        self.max_size = max_size
+        self._stored_size = 0
+        os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, "paths"), exist_ok=True)
+
+    def lookup(self, path: str, variant: str = "") -> Optional[CacheRecord]:
+        # Only succeeds if the stat data of the file is unchanged since it got stored, without reading the file
+        record = self._read(self._record_path(path, variant))
+        if record is None:
+            return None
+        st = os.stat(path)
+        if (record.mtime_ns, record.size, record.inode) != (st.st_mtime_ns, st.st_size, st.st_ino):
+            return None
+        if not os.path.exists(self._object_path(record.content_hash, variant)):
+            return None
+        return record
+
+    def load(self, path: str, variant: str = "") -> Optional[CacheEntry]:
+        record = self.lookup(path, variant)
+        if record is not None:
+            content_hash = record.content_hash
+        else:
+            content_hash = self.hash_source(read_source(path))
+
+        object_path = self._object_path(content_hash, variant)
+        entry = self._read(object_path)
+        if entry is None:
+            return None
+        self._touch(object_path)
+        if record is None:
+            self._write_record(path, variant, content_hash, len(entry.tokens), len(entry.ast))
+        return entry
+
+    def store(self, path: str, source: str, tokens: Sequence[Token], ast: List[AstNode], variant: str = ""):
+        if not isinstance(tokens, TokenArray) or len(tokens.types) != len(tokens):
+            tokens = TokenArray.from_tokens(tokens, source)
+        entry = CacheEntry(source, tokens, [(node.type, node.start, node.end) for node in ast])
+
+        content_hash = self.hash_source(source)
+        self._stored_size += self._write(self._object_path(content_hash, variant), entry)
+        self._write_record(path, variant, content_hash, len(tokens), len(ast))
+        if self._stored_size > self.max_size // 8:
+            self.prune()
+
+    def prune(self):
+        # Removes the least recently used entries until the cache takes at most `max_size` bytes
+        self._stored_size = 0
+        files = []
+        for subdirectory in ("objects", "paths"):
+            with os.scandir(os.path.join(self.directory, subdirectory)) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, entry.path))
+
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, file_path in sorted(files):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+    @staticmethod
+    def hash_source(source: str) -> str:
+        return hashlib.blake2b(source.encode("utf-8", "surrogatepass"), digest_size=20).hexdigest()
+
+    def _write_record(self, path: str, variant: str, content_hash: str, tokens: int, nodes: int):
+        st = os.stat(path)
+        # The file could still change within the same mtime, so only its content hash can be trusted
+        if time.time() - st.st_mtime < RACY_STAT_SECONDS:
+            return
+        record = CacheRecord(st.st_mtime_ns, st.st_size, st.st_ino, content_hash, tokens, nodes)
+        self._stored_size += self._write(self._record_path(path, variant), record)
+
+    def _object_path(self, content_hash: str, variant: str = "") -> str:
+        return os.path.join(self.directory, "objects", f"{content_hash}-{variant}" if variant else content_hash)
+
+    def _record_path(self, path: str, variant: str = "") -> str:
+        key = os.path.abspath(path) + (f"\0{variant}" if variant else "")
+        path_hash = hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=20)
+        return os.path.join(self.directory, "paths", path_hash.hexdigest())
+
+    def _write(self, path: str, value) -> int:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        write_atomically(path, data)
+        return len(data)
+
+    @staticmethod
+    def _read(path: str):
+        try:
+            with open(path, "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            # Not a complete entry of this version, it just gets written again
+            return None
+
+    @staticmethod
+    def _touch(path: str):
+        try:
+            if time.time() - os.stat(path).st_mtime > LRU_RESOLUTION:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
@@ -1,152 +1,322 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
 from enum import Enum
-from typing import List, Optional, Tuple
+from functools import lru_cache
+from itertools import accumulate, chain, compress, count, islice, repeat
+from operator import add, itemgetter, ne, sub
+from sys import intern
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple, Type, \
+    TYPE_CHECKING, Union
+import mmap
 import os
+import re
 from lib.token import Token, SPACING_CHARS, TokenType, RESTRICTED_CHARS, STR_LITERAL_CHARS, match_token_type, \
-    get_eq_token_variant, OPERATOR_TOKENS_WITH_VARIANTS
-from lib.utils import convert_leading_spaces_to_tabs
+    CharClass, CHAR_CLASSES, EQ_TOKEN_VARIANTS, LEXEME_TYPES, TOKEN_SPEC, DIGITS_POINT_FLOAT, EXPONENT, \
+    POINT_DIGITS_FLOAT, INTERNED_TYPES, TOKEN_TYPE_IDS, TYPE_LEXEMES
+from lib.ast_node import AstNode
+from lib.parser import Parser
+from lib.token_array import PostingLists, TokenArray, TokenList, token_type_ids
+from lib.utils import convert_leading_spaces_to_tabs, log_progress, phase, read_source
+
+if TYPE_CHECKING:
+    from lib.disk_cache import DiskCache
+    from lib.stats import Stats
 
 
 class Lexer:
-    path: str = ""
-    cursor: int = 0
-    content: str = ""
-    tokens: List[Token] = []
+    path: Optional[str]
+    source: str
+    engine: str
+    columnar: bool
+    # A list until it gets edited, then a TokenList, which shifts the tokens after the edit lazily
+    tokens: Union[List[Token], TokenList, TokenArray]
+    cache: Optional["DiskCache"]
+    # Only set when tokenizing through a cache, which stores the AST of the tokens along with them
+    ast: Optional[List[AstNode]]
+    stats: Optional["Stats"]
+    # Indices of the tokens per type, only recorded when asked for
+    postings: Optional[PostingLists]
 
-    def __init__(self, path: str):
+    # Without a path nothing gets tokenized until `reset` is called with a source,
+    # which allows reusing a single instance for any number of sources
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        engine: str = "classic",
+        columnar: bool = False,
+        cache: Optional["DiskCache"] = None,
+        stats: Optional["Stats"] = None,
+        postings: bool = False
+    ):
         self.path = path
+        self.source = ""
+        self.engine = engine
+        self.columnar = columnar
+        self.tokens = TokenArray("") if columnar else []
+        self.cache = cache
+        self.ast = None
+        self.stats = stats
+        self.postings = PostingLists() if postings else None
 
-        if not os.path.isfile(path):
-            print("The path provided doesn't lead to a file")
-            raise FileNotFoundError
+        if path is not None and not os.path.isfile(path):
+            raise FileNotFoundError(f"{path} doesn't lead to a file")
 
-        if not path.endswith(".py"):
-            print("The path provided doesn't lead to a valid Python file")
-            raise AttributeError
+        if path is not None and not path.endswith(".py"):
+            raise ValueError(f"{path} is not a Python file")
 
-        self.read()
-        self.tokenize()
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown lexer engine '{engine}', available: {', '.join(ENGINES)}")
 
-    def read(self):
-        print(f"Reading {self.path}...")
-        self.content = '\n'.join(convert_leading_spaces_to_tabs(line) for line in open(self.path))
+        if path is not None:
+            self.tokenize()
 
     def tokenize(self):
-        print(f"Tokenizing {self.path}...")
+        log_progress(__name__, f"Tokenizing {self.path}...")
+        if self.cache is not None:
+            with phase(self.stats, "cache"):
+                if self._load_from_cache():
+                    return
 
-        while (word_tup := self._read_next_word()) is not None:
-            word, t_type = word_tup
-            if t_type is None:
-                t_type = match_token_type(word)
-            token = Token(value=word, type=t_type)
-            self.tokens.append(token)
+        # The source is kept around to slice token values from and to re-tokenize edited parts of it
+        with phase(self.stats, "read"):
+            self.source = read_source(self.path)
+        self._tokenize_source()
+
+        if self.cache is not None:
+            self.ast = Parser(self.tokens, stats=self.stats).ast
+            with phase(self.stats, "cache"):
+                self.cache.store(self.path, self.source, self.tokens, self.ast, ENGINES[self.engine].variant)
+
+    def reset(self, source: str, path: Optional[str] = None):
+        # Replaces all state of the previous source, nothing of it is kept referenced
+        self.path = path
+        self.source = source
+        self.ast = None
+        self._tokenize_source()
+
+    def apply_edit(self, start: int, end: int, new_text: str) -> range:
+        # Replaces source[start:end] with `new_text` and re-tokenizes only the lines around the edit,
+        # returns the range of indices of the tokens which were tokenized again. The tokens are spliced in place,
+        # and the ones after the edit are only shifted where they're read
+        if not 0 <= start <= end <= len(self.source):
+            raise IndexError("Edit out of range of the source")
 
-        self._simplify_tokens()
+        old_source = self.source
+        old_tokens = self.tokens
+        self.source = old_source[:start] + new_text + old_source[end:]
+        self.ast = None
+        if ENGINES[self.engine] is BlockScanner:
+            # Blocks depend on the indentation of every line before, so everything is tokenized again
+            self._tokenize_source()
+            return range(len(self.tokens))
+        offset_delta = len(new_text) - (end - start)
+        line_delta = new_text.count('\n') - old_source.count('\n', start, end)
+
+        # Restart at the beginning of a line that no old token crosses or ends at, which a literal closed by the first
+        # char of the line does.
+        # Unterminated literals and whitespace runs are emitted differently once they reach the end of the source,
+        # so the last token, and whatever precedes a whitespace-only end of the source, is tokenized again too
+        restart = old_source.rfind('\n', 0, start) + 1
+        first = bisect_left(old_tokens, restart, key=_token_start)
+        while first > 0 and (
+            old_tokens[first - 1].end >= restart
+            or first == len(old_tokens)
+            or whitespace_tail_pattern().match(self.source, restart) is not None
+        ):
+            first -= 1
+            restart = old_source.rfind('\n', 0, old_tokens[first].start) + 1
+            first = bisect_left(old_tokens, restart, key=_token_start)
+        if first == 0:
+            restart, line = 0, 1
+        else:
+            line = old_tokens[first - 1].line + old_source.count('\n', old_tokens[first - 1].start, restart)
+
+        # Stop once the new tokens reach a line after the edit, from which the old tokens are the same
+        edit_end = start + len(new_text)
+        new_tokens: List[Token] = []
+        last = len(old_tokens)
+        for token in tokenize_source(self.source, self.engine, restart, line):
+            line_start = self.source.rfind('\n', 0, token.start) + 1
+            if line_start > edit_end and (not new_tokens or new_tokens[-1].end <= line_start):
+                old_line_start = line_start - offset_delta
+                i = bisect_left(old_tokens, old_line_start, key=_token_start)
+                if (
+                    i < len(old_tokens) and old_tokens[i] == token
+                    and old_tokens[i].start == token.start - offset_delta
+                    and (i == 0 or old_tokens[i - 1].end <= old_line_start)
+                ):
+                    last = i
+                    break
+            new_tokens.append(token)
+
+        if self.columnar:
+            old_tokens.splice(first, last, new_tokens, self.source, start, end)
+        else:
+            if not isinstance(old_tokens, TokenList):
+                self.tokens = old_tokens = TokenList(old_tokens)
+            old_tokens.splice(first, last, new_tokens, offset_delta, line_delta)
+        if self.postings is not None:
+            self.postings.splice(first, last, token_type_ids(new_tokens))
+        return range(first, first + len(new_tokens))
+
+    def iter_tokens(self) -> Iterator[Token]:
+        if self.path is None:
+            yield from tokenize_source(self.source, self.engine)
+            return
+        with open(self.path) as file:
+            yield from tokenize_stream(file, self.engine)
 
     def print_tokens(self):
         for token in self.tokens:
             print(repr(token))
 
+    def _load_from_cache(self) -> bool:
+        entry = self.cache.load(self.path, ENGINES[self.engine].variant)
+        if entry is None:
+            return False
+        self.source = entry.source
+        self.tokens = entry.tokens if self.columnar else entry.tokens.to_list()
+        self.ast = [
+            AstNode(type=node_type, source=self.tokens, start=start, end=end) for node_type, start, end in entry.ast
+        ]
+        if self.postings is not None:
+            self.postings = PostingLists.from_tokens(entry.tokens)
+        return True
+
+    def _tokenize_source(self):
+        if self.columnar and self.stats is None and issubclass(ENGINES[self.engine], FastScanner):
+            # The fast and blocks engines fill the columns a block at a time, the fast one without making tokens
+            self.tokens = TokenArray(self.source)
+            for columns in ENGINES[self.engine].from_buffer(self.source).iter_columns():
+                self.tokens.extend_columns(*columns)
+            if self.postings is not None:
+                self.postings = PostingLists.from_tokens(self.tokens)
+            return
+
+        if self.stats is not None:
+            tokens = tokenize_source_with_stats(self.source, self.engine, self.stats)
+        else:
+            tokens = tokenize_source(self.source, self.engine)
+        if self.columnar:
+            self.tokens = TokenArray.from_tokens(tokens, self.source)
+            # The array holds the type ids already, the indices of a type are only searched in them when asked for
+            if self.postings is not None:
+                self.postings = PostingLists.from_tokens(self.tokens)
+        elif self.postings is not None:
+            # Recorded as the tokens are collected, rather than in a pass over them afterwards
+            self.postings = PostingLists()
+            self.tokens = list(self.postings.record(tokens))
+        else:
+            self.tokens = list(tokens)
+        if self.stats is not None:
+            self.stats.count_tokens(token_type_ids(self.tokens))
+
     def _simplify_tokens(self):
-        new_tokens = []
-        token_amount = len(self.tokens)
-        i = 0
-
-        while i < token_amount:
-            token = self.tokens[i]
-
-            # Float literals
-            if token.type == TokenType.INT_LITERAL and i + 2 < token_amount:
-                next_token = self.tokens[i + 1]
-                next_next_token = self.tokens[i + 2]
-                if next_token.type == TokenType.DOT and next_next_token.type == TokenType.INT_LITERAL:
-                    float_value = f"{token.value}.{next_next_token.value}"
-                    new_token = Token(value=float_value, type=TokenType.FLOAT_LITERAL)
-                    new_tokens.append(new_token)
-                    i += 3
-                    continue
+        # Kept for compatibility, the scanners read compound operators and floats whole
+        pass
 
-            # Complex operators
-            if token.type in OPERATOR_TOKENS_WITH_VARIANTS and i + 1 < token_amount:
-                next_token = self.tokens[i + 1]
-
-                # EQ combinations
-                if next_token.type == TokenType.EQ:
-                    new_value = f"{token.value}{next_token.value}"
-                    new_type = get_eq_token_variant(token.type)
-                    new_token = Token(value=new_value, type=new_type)
-                    new_tokens.append(new_token)
-                    i += 2
-                    continue
 
-                # POW
-                if token.type == TokenType.MULT and next_token.type == TokenType.MULT:
-                    new_tokens.append(Token(value=token.value * 2, type=TokenType.POW))
-                    i += 2
-                    continue
+def _token_start(token: Token) -> int:
+    return token.start
 
-            # Ellipsis (...)
-            if token.type == TokenType.DOT and i + 2 < token_amount:
-                next_token = self.tokens[i + 1]
-                next_next_token = self.tokens[i + 2]
-                if next_token.type == TokenType.DOT and next_next_token.type == TokenType.DOT:
-                    new_token = Token(value=token.value * 3, type=TokenType.ELLIPSIS)
-                    new_tokens.append(new_token)
-                    i += 3
-                    continue
 
-            new_tokens.append(self.tokens[i])
-            i += 1
+# Pulls the source from `chunks` only when the buffered part runs out,
+# so memory is bounded by the longest chunk instead of the whole source
+class Scanner:
+    # Engines producing different tokens for the same source have different variants
+    variant: str = ""
+    cursor: int = 0
+    content: str = ""
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self._offset = 0
+
+    def iter_raw_tokens(self) -> Iterator[Token]:
+        while (word_tup := self._read_next_word()) is not None:
+            word, t_type, start, end = word_tup
+            if t_type is None:
+                if munched := self._read_munched(word):
+                    word += munched
+                    end += len(munched)
+                t_type = match_token_type(word)
+            yield Token(value=word, type=t_type, start=start, end=end)
 
-        self.tokens = new_tokens
+    def _read_munched(self, word: str) -> str:
+        # Reads the rest of the longest token starting with `word`, which directly follows it within the chunk.
+        # The next chunk starts with a newline, which nothing is read past
+        content, cursor = self.content, self.cursor
+        if LEXEME_TYPES.get(word) in EQ_TOKEN_VARIANTS:
+            munched = "=" if content.startswith("=", cursor) else ""
+        elif (pattern := _munch_pattern(word)) is not None and (match := pattern.match(content, cursor)) is not None:
+            munched = match.group()
+        else:
+            munched = ""
+        self.cursor += len(munched)
+        return munched
 
-    def _read_next_word(self) -> Optional[Tuple[str, Optional[TokenType]]]:
+    def _read_next_word(self) -> Optional[Tuple[str, Optional[TokenType], int, int]]:
         acc: str = ""
         mode: ReadMode = ReadMode.WORD
         str_literal_start: Optional[str] = None
+        start = end = 0
 
         while (char := self._read_next_char()) is not None:
+            char_class = CHAR_CLASSES[code] if (code := ord(char)) < 256 else CharClass.WORD
             if acc == "":
-                if char in SPACING_CHARS:
+                if char_class is CharClass.SPACING:
                     mode = ReadMode.INDENT
-                elif char in RESTRICTED_CHARS:
+                elif char_class is CharClass.RESTRICTED:
                     mode = ReadMode.RESTRICTED
-                elif char in STR_LITERAL_CHARS:
+                elif char_class is CharClass.STR_LITERAL:
                     mode = ReadMode.STR_LITERAL
                     str_literal_start = char
 
             if mode == ReadMode.INDENT and (
-                char not in SPACING_CHARS
+                char_class is not CharClass.SPACING
                 or (char == '\t' and acc != "")
             ):
                 self.cursor -= 1
-                if acc == "" or (all([c == ' ' for c in acc]) and len(acc) % 4 != 0):
+                if acc == "" or (acc.count(' ') == len(acc) and len(acc) % 4 != 0):
                     acc = ""
                     mode = ReadMode.WORD
                     str_literal_start = None
                     continue
-                return acc, None
+                return acc, None, start, end
 
+            position = self._offset + self.cursor - 1
             if mode == ReadMode.RESTRICTED:
-                return char, None
+                return char, None, position, position + 1
 
             if mode == ReadMode.STR_LITERAL and char is str_literal_start:
                 if acc == "":
                     continue
                 elif acc != "" and not acc.endswith('\\'):
-                    return acc, TokenType.STR_LITERAL
+                    return acc, TokenType.STR_LITERAL, start, position
 
-            if mode == ReadMode.WORD and (char in SPACING_CHARS or char in RESTRICTED_CHARS):
+            if mode == ReadMode.WORD and (char_class is CharClass.SPACING or char_class is CharClass.RESTRICTED):
                 self.cursor -= 1
-                return acc, None
+                return acc, None, start, end
 
             if char != '\n':
+                if acc == "":
+                    start = position
                 acc += char
+                end = position + 1
 
-        return (acc, None) if acc else None
+        return (acc, None, start, end) if acc else None
 
     def _read_next_char(self) -> Optional[str]:
-        if self.cursor >= len(self.content):
-            return None
+        # The buffer is only refilled once fully consumed, so the single-char step back
+        # done by `_read_next_word` never crosses a chunk boundary
+        while self.cursor >= len(self.content):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return None
+            self._offset += len(self.content)
+            self.content = chunk
+            self.cursor = 0
         char = self.content[self.cursor]
         self.cursor += 1
         return char
@@ -157,3 +327,707 @@ class ReadMode(Enum):
     RESTRICTED = "RESTRICTED"
     STR_LITERAL = "STR_LITERAL"
     WORD = "WORD"
+
+
+_SPACING = re.escape(''.join(SPACING_CHARS))
+_RESTRICTED = re.escape(''.join(RESTRICTED_CHARS))
+_STR_LITERAL = re.escape(''.join(STR_LITERAL_CHARS))
+
+# Tokens are read by maximal munch: a word or restricted char is extended by whatever directly follows it and makes
+# a longer token, the "=" of a compound operator, the rest of an ellipsis or the point and digits of a float.
+# Floats only end where a word would, so that e.g. `1.real` stays an integer and an attribute
+_EQ_LEXEMES = sorted((lexeme for lexeme, _, eq_variant in TOKEN_SPEC if eq_variant is not None), key=len, reverse=True)
+
+
+def _munch_alternatives(word_end: str) -> Tuple[str, str]:
+    # Longer tokens starting with a restricted char, and with a char of a word
+    restricted = [re.escape(lexeme + "=") for lexeme in _EQ_LEXEMES if lexeme[0] in RESTRICTED_CHARS]
+    word = [re.escape(lexeme + "=") for lexeme in _EQ_LEXEMES if lexeme[0] not in RESTRICTED_CHARS]
+    return (
+        "|".join((*restricted, re.escape("..."), POINT_DIGITS_FLOAT + word_end)),
+        "|".join((*word, DIGITS_POINT_FLOAT + word_end)),
+    )
+
+
+_WORD_END = rf"(?![^{_SPACING}{_RESTRICTED}])"
+_RESTRICTED_MUNCH, _WORD_MUNCH = _munch_alternatives(_WORD_END)
+# Patterns are only compiled once something needs them, as compiling all of them is a noticeable part of the startup
+# and each engine only uses a few
+
+
+# What the classic engine reads past a point or a decimal integer
+@lru_cache(maxsize=None)
+def point_munch_pattern() -> Pattern[str]:
+    return re.compile(rf"\.\.|\d[\d_]*(?:{EXPONENT})?{_WORD_END}")
+
+
+@lru_cache(maxsize=None)
+def digits_munch_pattern() -> Pattern[str]:
+    return re.compile(rf"\.(?:\d[\d_]*)?(?:{EXPONENT})?{_WORD_END}")
+
+
+@lru_cache(maxsize=None)
+def decimal_int_pattern() -> Pattern[str]:
+    return re.compile(r"-?\d[\d_]*")
+
+
+def _munch_pattern(word: str) -> Optional[Pattern[str]]:
+    if word == ".":
+        return point_munch_pattern()
+    if word[-1:].isdecimal() and decimal_int_pattern().fullmatch(word) is not None:
+        return digits_munch_pattern()
+    return None
+
+
+# The pieces of the pattern tile the scanned text, so that one C-level `findall` splits it and the position of each
+# piece is the sum of the lengths before it. The original text is scanned, so leading spaces are measured where a line
+# starts: a piece per 4 of them makes a tab, the last one also spanning the spaces left over, and fewer are skipped,
+# as if they were converted. The first of these pieces also takes the newlines before it, and other runs of spaces
+# are a single piece. Up to 3 spaces, which are skipped anyway, are a part of the word or restricted char following
+# them. Closed literals are a single piece too, quotes included.
+# A spacing run keeps going over newlines and blank lines which would be left empty, but not into an indentation
+_WORD_START = rf"[^{_SPACING}{_RESTRICTED}{_STR_LITERAL}]"
+# Most words can't be munched, which the first char tells
+_MUNCH_START = re.escape("".join(sorted({lexeme[0] for lexeme in _EQ_LEXEMES if lexeme[0] not in RESTRICTED_CHARS})))
+_WORD_PIECE = (
+    rf"(?:{_RESTRICTED_MUNCH}|[{_RESTRICTED}]|(?=[-\d{_MUNCH_START}])(?:{_WORD_MUNCH})"
+    rf"|{_WORD_START}[^{_SPACING}{_RESTRICTED}]*)"
+)
+
+
+def _closed_literal(quote: str) -> str:
+    # Quotes followed by a word open a literal, closed by the first of its quotes which the last char before isn't
+    # a backslash, not counting newlines and leading spaces too few to make up a tab, which the converted content
+    # doesn't have
+    escaped = rf"(?:\n {{0,3}}(?=[\n{quote}]))*{quote}"
+    return rf"[{_STR_LITERAL}]*{quote}(?={_WORD_START})(?:[^{quote}\\]|\\{escaped}|\\(?!{escaped}))*{quote}"
+
+
+_CLOSED_LITERAL = "|".join(map(_closed_literal, STR_LITERAL_CHARS))
+# A literal that isn't closed is a single piece up to `stop`
+_MASTER_PATTERN = (
+    rf"{_WORD_PIECE}"
+    r"|(?:^|(?<=[\n ]))(?: {4}(?= {4})| {4,7}(?! )| {1,3}(?! ))"
+    rf"| {{1,3}}(?=[^{_SPACING}{_STR_LITERAL}]){_WORD_PIECE}"
+    r"|[ \t] *(?:\n(?: {1,3}(?=\n|\Z))?)*"
+    r"|\n+(?: {4}(?= {4})| {4,7}(?! )| {1,3}(?! ))?"
+    rf"|{_CLOSED_LITERAL}"
+    rf"|[{_STR_LITERAL}]+(?={_WORD_START})(?s:.*)"
+    rf"|[{_STR_LITERAL}]+"
+)
+# Runs of spaces within a line which `master_pattern` can't tell from leading spaces
+_SPACING_RUN = r" {4}(?<=[^\n ] {4}) {0,3}(?=[^ \n])"
+
+
+# Also for bytes, UTF-8 sequences of non-ASCII chars only ever end up inside words
+def _compile(pattern: str, binary: bool) -> Pattern:
+    return re.compile(pattern.encode() if binary else pattern)
+
+
+@lru_cache(maxsize=None)
+def master_pattern(binary: bool = False) -> Pattern:
+    return _compile(_MASTER_PATTERN, binary)
+
+
+@lru_cache(maxsize=None)
+def closed_literal_pattern(binary: bool = False) -> Pattern:
+    return _compile(_CLOSED_LITERAL, binary)
+
+
+@lru_cache(maxsize=None)
+def spacing_run_pattern(binary: bool = False) -> Pattern:
+    return _compile(_SPACING_RUN, binary)
+
+
+Source = Union[str, bytes, bytearray, memoryview, mmap.mmap]
+# The value and type of a token, where it starts within its piece, how long it is, the id of its type and whether
+# a `TokenArray` has to keep its value, see `TokenArray.extend_columns`
+TokenEntry = Tuple[Optional[str], Optional[TokenType], int, int, int, bool]
+_NO_TOKEN: TokenEntry = (None, None, 0, 0, 0, False)
+# The values, type ids, starts and ends of tokens, and the indices among them of the values to keep
+TokenColumns = Tuple[List[str], array, array, array, Iterable[int]]
+
+
+# Columns of tokens spanning the slices of the source their values are, unless their type has a lexeme
+def _token_columns(tokens: List[Token]) -> TokenColumns:
+    values = list(map(itemgetter(0), tokens))
+    t_types = list(map(itemgetter(1), tokens))
+    return (
+        values,
+        array("B", map(TOKEN_TYPE_IDS.__getitem__, t_types)),
+        array("I", map(itemgetter(2), tokens)),
+        array("I", map(itemgetter(3), tokens)),
+        compress(count(), map(ne, values, map(TYPE_LEXEMES.get, t_types, values))),
+    )
+
+
+# Newlines are dropped and the leading spaces of the following lines converted, as `Scanner` sees them
+def _literal_value(text: str) -> str:
+    if "\n" not in text:
+        return text
+    first, *lines = text.split("\n")
+    return first + "".join(convert_leading_spaces_to_tabs(line) for line in lines)
+
+
+def _token_entry(
+    value: str, skip: int, span: int, t_type: Optional[TokenType] = None, text: Optional[str] = None
+) -> TokenEntry:
+    # The type is matched unless given, and `text` is what the source holds where the token is if that's not its value
+    if t_type is None:
+        t_type = match_token_type(value)
+    if t_type in INTERNED_TYPES:
+        value = intern(value)
+    kept = value != TYPE_LEXEMES.get(t_type, value if text is None else text)
+    return value, t_type, skip, span, TOKEN_TYPE_IDS[t_type], kept
+
+
+# The token a piece of `master_pattern` makes, with no type if it makes none. Runs of 4 to 7 spaces are taken for
+# leading spaces. Shared by all scanners, and started over once it holds `limit` pieces, as names are unbounded.
+# Literals longer than `literal_limit` aren't kept, as they hardly ever come up twice
+class _PieceTokens(Dict[Union[str, bytes], TokenEntry]):
+    limit = 1 << 16
+    literal_limit = 1 << 6
+
+    def __missing__(self, piece: Union[str, bytes]) -> TokenEntry:
+        if len(self) >= self.limit:
+            self.clear()
+        text = piece if isinstance(piece, str) else piece.decode("utf-8")
+        if text[0] in STR_LITERAL_CHARS:
+            value = text.lstrip("'\"")
+            if not value:
+                entry = _NO_TOKEN
+            else:
+                skip = len(text) - len(value)
+                entry = _token_entry(
+                    _literal_value(value[:-1]), skip, len(piece) - skip - 1, TokenType.STR_LITERAL, value[:-1]
+                )
+                if len(piece) > self.literal_limit:
+                    return entry
+            self[piece] = entry
+            return entry
+
+        value = text.lstrip(" ")
+        if text[0] == "\n":
+            value = text.lstrip("\n")
+            skip = len(text) - len(value)
+            entry = _token_entry("\t", skip, len(value)) if len(value) >= 4 else _NO_TOKEN
+        elif value[:1] not in ("", "\t", "\n"):
+            skip = len(text) - len(value)
+            entry = _token_entry(value, skip, len(piece) - skip)
+        elif not value and 4 <= len(text) < 8:
+            entry = _token_entry("\t", 0, len(text))
+        else:
+            # Only the part of a spacing run before its first newline is left once newlines are dropped
+            value = text.partition("\n")[0]
+            entry = _token_entry(value, 0, len(value)) if "\t" in value or len(value) % 4 == 0 else _NO_TOKEN
+        self[piece] = entry
+        return entry
+
+
+_PIECE_TOKENS = _PieceTokens()
+
+
+# Produces exactly the same raw words as `Scanner` does over the converted content, including its quirks around
+# empty and unterminated string literals, but works on the original text and splits it with `master_pattern`
+# instead of stepping char by char. Tokens are made in bulk, a block of the source at a time
+class FastScanner:
+    variant: str = ""
+    block_size: int = 1 << 16
+    # Buffers are scanned in blocks doubling up to `block_size`, so that the first tokens come cheap
+    first_block_size: int = 1 << 10
+
+    def __init__(self, chunks: Iterable[str], offset: int = 0, line: int = 1):
+        self._chunks = iter(chunks)
+        self._buffer: Optional[Source] = None
+        self._offset = offset
+        self._line = line
+        self._line_start = offset
+
+    @classmethod
+    def from_buffer(cls, buffer: Source, offset: int = 0, line: int = 1) -> "FastScanner":
+        # Scans the buffer in place from `offset`, which has to be the start of the `line`. Positions in bytes
+        # are offsets in bytes, and only the values of emitted tokens get decoded
+        scanner = cls((), offset, line)
+        scanner._buffer = buffer
+        return scanner
+
+    def iter_raw_tokens(self) -> Iterator[Token]:
+        return chain.from_iterable(self._iter_blocks(self._scan))
+
+    def iter_columns(self) -> Iterator[TokenColumns]:
+        # What `TokenArray.extend_columns` takes, a block at a time, for when the tokens themselves aren't needed.
+        # Lines aren't counted
+        return self._iter_blocks(self._scan_columns)
+
+    def _iter_blocks(self, scan: Callable[[Source, int, int, int, bool], Tuple[Any, int]]) -> Iterator[Any]:
+        # What `scan` makes of one block after another
+        if self._buffer is not None:
+            buffer, pos, size = self._buffer, self._offset, self.first_block_size
+            while pos < len(buffer):
+                stop = min(pos + size, len(buffer))
+                block, end = scan(buffer, pos, stop, 0, stop == len(buffer))
+                yield block
+                # A token longer than a block makes the next one larger
+                if end == pos or size < self.block_size:
+                    size *= 2
+                pos = end
+            return
+
+        # Blocks after the first one start with the char preceding the part left to scan,
+        # so that it can still be told whether that part is at the start of a line
+        carry = ""
+        begin = 0
+        offset = self._offset
+        final = False
+
+        while not final:
+            block = [carry]
+            size = 0
+            while size < self.block_size:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    final = True
+                    break
+                block.append(chunk)
+                size += len(chunk)
+
+            content = ''.join(block)
+            block, pos = scan(content, begin, len(content), offset, final)
+            yield block
+            begin = 1 if pos > 0 else 0
+            carry = content[pos - begin:]
+            offset += pos - begin
+
+    def _scan(self, content: Source, begin: int, stop: int, offset: int, final: bool) -> Tuple[Iterable[Token], int]:
+        entries, starts, pos = self._scan_entries(content, begin, stop, offset, final)
+        ends = map(add, starts, map(itemgetter(3), entries))
+
+        # The tokens of a line are the ones starting within it, so lines are searched for rather than tokens
+        newline = "\n" if isinstance(content, str) else b"\n"
+        segment = self._slice(content, begin, pos)
+        line_starts = list(accumulate(map(add, map(len, segment.split(newline)), repeat(1)), initial=offset + begin))
+        line_starts[0] = self._line_start
+        line_starts.pop()
+        firsts = [0, *map(bisect_left, repeat(starts), islice(line_starts, 1, None)), len(starts)]
+        counts = list(map(sub, islice(firsts, 1, None), firsts))
+        lines = chain.from_iterable(map(repeat, range(self._line, self._line + len(line_starts)), counts))
+        columns = map(sub, starts, chain.from_iterable(map(repeat, line_starts, counts)))
+        self._line += len(line_starts) - 1
+        self._line_start = line_starts[-1]
+
+        tokens = map(
+            tuple.__new__, repeat(Token),
+            zip(map(itemgetter(0), entries), map(itemgetter(1), entries), starts, ends, lines, columns)
+        )
+        return tokens, pos
+
+    def _scan_columns(
+        self, content: Source, begin: int, stop: int, offset: int, final: bool
+    ) -> Tuple[TokenColumns, int]:
+        entries, starts, pos = self._scan_entries(content, begin, stop, offset, final)
+        columns = (
+            list(map(itemgetter(0), entries)),
+            array("B", map(itemgetter(4), entries)),
+            array("I", starts),
+            array("I", map(add, starts, map(itemgetter(3), entries))),
+            compress(count(), map(itemgetter(5), entries)),
+        )
+        return columns, pos
+
+    def _scan_entries(
+        self, content: Source, begin: int, stop: int, offset: int, final: bool
+    ) -> Tuple[List[TokenEntry], List[int], int]:
+        # Scans content[begin:stop], returns the entries of its tokens, where they start and where scanning stopped.
+        # Before the end of the source, the last line is left to be scanned again once more of it is available,
+        # as `stop` might cut a token short
+        if isinstance(content, str):
+            binary, newline, space, quotes = False, "\n", " ", "'\""
+        else:
+            binary, newline, space, quotes = True, b"\n", b" ", b"'\""
+        pieces = master_pattern(binary).findall(content, begin, stop)
+        pos = stop
+        while pieces and not final:
+            last = pieces.pop()
+            pos -= len(last)
+            if newline in last:
+                break
+        entries = list(map(_PIECE_TOKENS.__getitem__, pieces))
+        bounds = list(accumulate(map(len, pieces), initial=offset + begin))
+
+        for run in spacing_run_pattern(binary).finditer(content, begin, stop):
+            if run.start() >= pos:
+                break
+            i = bisect_left(bounds, offset + run.start())
+            if bounds[i] == offset + run.start() and bounds[i + 1] == offset + run.end():
+                value = self._decode(run.group())
+                entries[i] = _token_entry(value, 0, len(value)) if len(value) % 4 == 0 else _NO_TOKEN
+        if final and pieces:
+            last, start = pieces[-1], bounds[-2] - offset
+            # Spacing is kept whole at the end of the source
+            if (
+                last[:1] == space and last.lstrip(space)[:1] in (newline, newline[:0])
+                and start > 0 and content[start - 1:start] not in (newline, space)
+            ):
+                value = self._decode(last).partition("\n")[0]
+                entries[-1] = _token_entry(value, 0, len(value))
+            elif last[:1] in quotes and last.strip(quotes) and closed_literal_pattern(binary).fullmatch(last) is None:
+                entries[-1] = self._unterminated_literal(last, newline, space, quotes)
+
+        t_types = list(map(itemgetter(1), entries))
+        starts = list(map(add, compress(bounds, t_types), compress(map(itemgetter(2), entries), t_types)))
+        return list(compress(entries, t_types)), starts, pos
+
+    @staticmethod
+    def _unterminated_literal(
+        piece: Union[str, bytes], newline: Union[str, bytes], space: Union[str, bytes], quotes: Union[str, bytes]
+    ) -> TokenEntry:
+        # A literal that isn't closed runs to the end of the source, but for the blank lines there, which would be
+        # as empty as the newlines stripped once converted
+        skip = len(piece) - len(piece.lstrip(quotes))
+        segment = piece[skip:]
+        end = len(segment)
+        while (
+            (line_start := segment.rfind(newline, 0, end) + 1) > 0
+            and end - line_start < 4 and not segment[line_start:end].strip(space)
+        ):
+            end = line_start - 1
+        text = FastScanner._decode(segment[:end])
+        return _token_entry(_literal_value(text), skip, end, text=text)
+
+    @staticmethod
+    def _decode(value: Union[str, bytes]) -> str:
+        return value if isinstance(value, str) else value.decode("utf-8")
+
+    @staticmethod
+    def _slice(content: Source, start: int, end: int) -> Union[str, bytes]:
+        segment = content[start:end]
+        return segment.tobytes() if isinstance(segment, memoryview) else segment
+
+
+# Whitespace only matters at the start of a line, where all of it, tabs and form feeds included, is measured in one
+# go. Comments and backslash continued lines are skipped, and quotes only ever start literals.
+# Operators end words too, so that `n//2` or `x**=2` are read like Python reads them. A minus is only a part of
+# a number where a word would start otherwise, as in `x = -1`, which keeps such literals the same as in the other
+# engines
+_OPERATOR_CHARS = "".join(sorted({
+    char for lexeme, _, _ in TOKEN_SPEC for char in lexeme
+    if not char.isalnum() and char not in (*SPACING_CHARS, *RESTRICTED_CHARS, *STR_LITERAL_CHARS)
+}))
+_BLOCK_NAME_CHAR = rf"(?:[^{_SPACING}{_RESTRICTED}{_STR_LITERAL}{re.escape(_OPERATOR_CHARS)}#\\\f]|\\(?!\n))"
+_BLOCK_WORD_END = rf"(?!{_BLOCK_NAME_CHAR})"
+_BLOCK_RESTRICTED_MUNCH, _ = _munch_alternatives(_BLOCK_WORD_END)
+# Every lexeme starting with an operator, along with its "=" variant
+_BLOCK_OPERATORS = "|".join(
+    re.escape(lexeme) for lexeme in sorted(
+        (
+            lexeme for lexeme in LEXEME_TYPES
+            if lexeme[0] in _OPERATOR_CHARS and not lexeme.strip(_OPERATOR_CHARS + "=")
+        ),
+        key=len, reverse=True
+    )
+)
+_BLOCK_NUMBER = (
+    rf"(?:(?<![^{_SPACING}{_RESTRICTED}{_STR_LITERAL}\f])(?=-\d)|(?=\d))"
+    rf"(?:{DIGITS_POINT_FLOAT}{_BLOCK_WORD_END}|-?\d[\d_]*{EXPONENT}{_BLOCK_WORD_END}|-?{_BLOCK_NAME_CHAR}+)"
+)
+_BLOCK_PATTERN = (
+    r"(?P<LEADING>(?:^|(?<=\n))[ \t\f]+)"
+    r"|(?P<SPACING>[ \t\f]+|#[^\n]*)"
+    r"|(?P<CONTINUATION>\\\n)"
+    r"|(?P<NEWLINE>\n)"
+    rf"|(?P<RESTRICTED>{_BLOCK_RESTRICTED_MUNCH}|[{_RESTRICTED}])"
+    r"|(?P<QUOTE>'''|\"\"\"|'|\")"
+    rf"|(?P<WORD>{_BLOCK_NUMBER}|{_BLOCK_OPERATORS}|{_BLOCK_NAME_CHAR}+)"
+)
+
+
+@lru_cache(maxsize=None)
+def block_pattern(binary: bool = False) -> Pattern:
+    return re.compile(_BLOCK_PATTERN.encode() if binary else _BLOCK_PATTERN)
+
+
+# The rest of a literal after its opening quote. Escaped chars never close it, and unless it's triple-quoted
+# it ends with its line even if unterminated
+_LITERAL_PATTERNS = {
+    "'": r"(?:[^'\\\n]|\\.)*(?P<close>')?",
+    '"': r'(?:[^"\\\n]|\\.)*(?P<close>")?',
+    "'''": r"(?:[^'\\]|\\.|'(?!''))*(?P<close>''')?",
+    '"""': r'(?:[^"\\]|\\.|"(?!""))*(?P<close>""")?',
+}
+
+
+@lru_cache(maxsize=None)
+def literal_pattern(quote: Union[str, bytes]) -> Pattern:
+    if isinstance(quote, str):
+        return re.compile(_LITERAL_PATTERNS[quote], re.DOTALL)
+    return re.compile(_LITERAL_PATTERNS[quote.decode()].encode(), re.DOTALL)
+
+
+BRACKET_DEPTHS = {"(": 1, "[": 1, "{": 1, ")": -1, "]": -1, "}": -1}
+TAB_SIZE = 8
+
+
+# Tracks indentation with a stack of widths while scanning the original text, instead of emitting a tab per 4 leading
+# spaces: an INDENT when a logical line is indented deeper than the one before, a DEDENT per level it returns by
+# and a NEWLINE at the end of every logical line. Lines within brackets continue the logical line they're in,
+# and no other whitespace is emitted. Literals are read like Python reads them, so that quotes and brackets
+# within them can't throw the blocks off
+class BlockScanner(FastScanner):
+    variant = "blocks"
+
+    def __init__(self, chunks: Iterable[str], offset: int = 0, line: int = 1):
+        super().__init__(chunks, offset, line)
+        self._widths = [0]
+        self._depth = 0
+        self._in_line = False
+        self._indentation = ""
+        self._end = offset
+
+    def iter_raw_tokens(self) -> Iterator[Token]:
+        return chain.from_iterable(self._iter_token_blocks())
+
+    def iter_columns(self) -> Iterator[TokenColumns]:
+        # Blocks are tracked through the tokens, which are taken apart into columns a block of the source at a time.
+        # The values of INDENT rows and of the empty NEWLINE and DEDENT rows at the end are kept
+        return map(_token_columns, self._iter_token_blocks())
+
+    def _iter_token_blocks(self) -> Iterator[List[Token]]:
+        yield from self._iter_blocks(self._scan)
+        # The end of the source ends the last logical line and every block still open
+        end, column = self._end, self._end - self._line_start
+        tokens = []
+        if self._in_line:
+            tokens.append(Token(value="", type=TokenType.NEWLINE, start=end, end=end, line=self._line, column=column))
+        for _ in self._widths[1:]:
+            tokens.append(Token(value="", type=TokenType.DEDENT, start=end, end=end, line=self._line, column=column))
+        yield tokens
+
+    def _scan(self, content: Source, begin: int, stop: int, offset: int, final: bool) -> Tuple[List[Token], int]:
+        if isinstance(content, str):
+            pattern, newline = block_pattern(), "\n"
+        else:
+            pattern, newline = block_pattern(True), b"\n"
+        piece_tokens = _PIECE_TOKENS
+        tokens: List[Token] = []
+        pos = begin
+        if final:
+            self._end = offset + stop
+        else:
+            # Tokens of the last line might be cut short by `stop`, it's scanned once more of the source is there
+            stop = begin + self._slice(content, begin, stop).rfind(newline) + 1
+
+        while pos < stop:
+            for match in pattern.finditer(content, pos, stop):
+                kind = match.lastgroup
+                start, end = match.span()
+                if kind == "NEWLINE":
+                    if self._in_line and self._depth == 0:
+                        self._in_line = False
+                        tokens.append(Token(
+                            value="\n", type=TokenType.NEWLINE, start=offset + start, end=offset + end,
+                            line=self._line, column=offset + start - self._line_start
+                        ))
+                    self._line += 1
+                    self._line_start = offset + end
+                    self._indentation = ""
+                    continue
+                if end == stop and not final:
+                    return tokens, start
+
+                if kind == "LEADING":
+                    self._indentation = self._decode(match.group())
+                    continue
+                if kind == "SPACING":
+                    continue
+                if kind == "CONTINUATION":
+                    self._line += 1
+                    self._line_start = offset + end
+                    continue
+                if kind == "QUOTE":
+                    pos = end
+                    break
+
+                value = match.group()
+                if not isinstance(value, str):
+                    value = value.decode("utf-8")
+                if kind == "RESTRICTED" and value in BRACKET_DEPTHS:
+                    self._depth = max(self._depth + BRACKET_DEPTHS[value], 0)
+                if not self._in_line:
+                    tokens += self._open_line(offset + start)
+                t_type = piece_tokens[value][1]
+                tokens.append(Token(
+                    value=value, type=t_type, start=offset + start, end=offset + end,
+                    line=self._line, column=offset + start - self._line_start
+                ))
+            else:
+                return tokens, stop
+
+            quote = match.group()
+            literal = literal_pattern(quote).match(content, pos)
+            closed = literal.start("close") != -1
+            end = literal.start("close") if closed else literal.end()
+            if not closed and end == len(content) and not final:
+                return tokens, match.start()
+
+            if not self._in_line:
+                tokens += self._open_line(offset + pos)
+            segment = self._slice(content, pos, end)
+            tokens.append(Token(
+                value=self._decode(segment), type=TokenType.STR_LITERAL, start=offset + pos, end=offset + end,
+                line=self._line, column=offset + pos - self._line_start
+            ))
+            if (newlines := segment.count(newline)) > 0:
+                self._line += newlines
+                self._line_start = offset + pos + segment.rindex(newline) + 1
+            pos = literal.end()
+
+        return tokens, pos
+
+    def _open_line(self, start: int) -> Iterator[Token]:
+        # The first token of a logical line opens a block or closes blocks, depending on the indentation of its line.
+        # A form feed starts measuring it over, as it does for Python
+        self._in_line = True
+        width = 0
+        for char in self._indentation:
+            if char == '\f':
+                width = 0
+            else:
+                width += TAB_SIZE - width % TAB_SIZE if char == '\t' else 1
+
+        widths = self._widths
+        if width > widths[-1]:
+            widths.append(width)
+            yield Token(
+                value=self._indentation, type=TokenType.INDENT, start=self._line_start,
+                end=self._line_start + len(self._indentation), line=self._line, column=0
+            )
+            return
+
+        while width < widths[-1]:
+            widths.pop()
+            yield Token(
+                value="", type=TokenType.DEDENT, start=start, end=start,
+                line=self._line, column=start - self._line_start
+            )
+        if width != widths[-1]:
+            raise IndentationError(f"Unindent does not match any outer indentation level on line {self._line}")
+
+
+ENGINES: Dict[str, Type] = {"classic": Scanner, "fast": FastScanner, "blocks": BlockScanner}
+
+
+@lru_cache(maxsize=None)
+def whitespace_tail_pattern() -> Pattern[str]:
+    return re.compile(r"[ \t\n]*\Z")
+
+
+# Keeps track of how the lines read from the original source were converted, so that offsets of tokens
+# in the converted content can be translated back. Only the lines not yet passed by tokens are kept
+class SourceMap:
+    def __init__(self, offset: int = 0, line: int = 1):
+        # Per line: content offset, original offset, leading spaces and tabs they were converted to
+        self._lines: Deque[Tuple[int, int, int, int]] = deque()
+        self._first_line = line
+        self._offset = offset
+
+    def iter_chunks(self, lines: Iterable[str]) -> Iterator[str]:
+        # Same shape as joining all converted lines with '\n'
+        content_offset = 0
+        original_offset = self._offset
+        for i, line in enumerate(lines):
+            converted = convert_leading_spaces_to_tabs(line)
+            chunk = converted if i == 0 else '\n' + converted
+            spaces = len(line) - len(line.lstrip(' '))
+            self._lines.append((content_offset + len(chunk) - len(converted), original_offset, spaces, spaces // 4))
+            content_offset += len(chunk)
+            original_offset += len(line)
+            yield chunk
+
+    def map_positions(self, tokens: Iterable[Token]) -> Iterator[Token]:
+        lines = self._lines
+        for token in tokens:
+            while len(lines) > 1 and lines[1][0] <= token.start:
+                lines.popleft()
+                self._first_line += 1
+
+            # Only string literals can end on a later line than the one they start on
+            end_line = 0
+            while end_line + 1 < len(lines) and lines[end_line + 1][0] <= token.end:
+                end_line += 1
+
+            start = self._to_original(token.start, lines[0])
+            yield token._replace(
+                start=start,
+                end=self._to_original(token.end, lines[end_line]),
+                line=self._first_line,
+                column=start - lines[0][1]
+            )
+
+    @staticmethod
+    def _to_original(offset: int, line: Tuple[int, int, int, int]) -> int:
+        content_start, original_start, spaces, tabs = line
+        column = offset - content_start
+        if column < tabs:
+            return original_start + column * 4
+        return original_start + spaces + column - tabs
+
+
+def iter_lines(source: str, start: int = 0) -> Iterator[str]:
+    while start < len(source):
+        end = source.find('\n', start) + 1 or len(source)
+        yield source[start:end]
+        start = end
+
+
+def tokenize_stream(file: Iterable[str], engine: str = "classic", offset: int = 0, line: int = 1) -> Iterator[Token]:
+    if issubclass(ENGINES[engine], FastScanner):
+        return ENGINES[engine](file, offset, line).iter_raw_tokens()
+    source_map = SourceMap(offset, line)
+    scanner = ENGINES[engine](source_map.iter_chunks(file))
+    return source_map.map_positions(scanner.iter_raw_tokens())
+
+
+def tokenize_source(source: Source, engine: str = "classic", offset: int = 0, line: int = 1) -> Iterator[Token]:
+    # Tokenizes the source starting from `offset`, which has to be the start of the `line`.
+    # The fast and blocks engines scan it in place, which is the only way buffers of bytes get tokenized
+    if issubclass(ENGINES[engine], FastScanner):
+        return ENGINES[engine].from_buffer(source, offset, line).iter_raw_tokens()
+    if not isinstance(source, str):
+        raise ValueError("Only the fast and blocks engines tokenize bytes")
+    return tokenize_stream(iter_lines(source, offset), engine, offset, line)
+
+
+def tokenize_source_with_stats(source: Source, engine: str, stats: "Stats") -> List[Token]:
+    # The same tokens as `tokenize_source`, but each step runs over the whole source before the next one,
+    # so that they can be timed apart
+    scanner_class = ENGINES[engine]
+    source_map = None
+    with stats.phase("tokenize"):
+        if issubclass(scanner_class, FastScanner):
+            tokens = list(scanner_class.from_buffer(source).iter_raw_tokens())
+        elif not isinstance(source, str):
+            raise ValueError("Only the fast and blocks engines tokenize bytes")
+        else:
+            source_map = SourceMap()
+            tokens = list(scanner_class(source_map.iter_chunks(iter_lines(source))).iter_raw_tokens())
+    if source_map is not None:
+        with stats.phase("map_positions"):
+            tokens = list(source_map.map_positions(tokens))
+    stats.chars_scanned += len(source)
+    stats.peak_tokens = max(stats.peak_tokens, len(tokens))
+    return tokens
+
+
+def tokenize_file(path: str, engine: str = "fast") -> Iterator[Token]:
+    # Tokenizes the file mapped in memory with the fast or blocks engine, without ever reading all of it,
+    # so positions of the tokens are offsets in bytes
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield from tokenize_source(buffer, engine)
+
+
+def simplify_tokens(tokens: Iterable[Token]) -> Iterator[Token]:
+    # Kept for compatibility, the scanners read compound operators, ellipses and floats whole
+    return iter(tokens)
@@ -1,32 +1,318 @@
-from typing import List
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from heapq import merge
+from itertools import accumulate, compress, repeat
+from operator import ge, sub
+from typing import FrozenSet, Iterable, Iterator, List, Optional, Sequence, TYPE_CHECKING
 
-from lib.ast_node import AstNode, AST_PATTERNS
-from lib.token import Token
+from lib.ast_node import AstNode, AstNodeType, AstPatternAutomaton, AST_PATTERNS, PATTERN_AUTOMATON, PATTERN_DISPATCH
+from lib.token import Token, TokenType, TOKEN_TYPES, TOKEN_TYPE_IDS
+from lib.token_array import (
+    PostingLists, has_positions, lazy_type_ids, line_start_indices, semicolon_indices, starts_line, token_type_ids
+)
+from lib.utils import log_progress, phase
+
+if TYPE_CHECKING:
+    from lib.stats import Stats
+
+# Tokens only laying out statements, which are skipped where a statement starts
+LAYOUT_TYPE_IDS = frozenset(TOKEN_TYPE_IDS[token_type] for token_type in (
+    TokenType.NEWLINE, TokenType.INDENT, TokenType.DEDENT
+))
+NEWLINE_ID = TOKEN_TYPE_IDS[TokenType.NEWLINE]
+COLON_ID = TOKEN_TYPE_IDS[TokenType.COLON]
+SEMICOLON_ID = TOKEN_TYPE_IDS[TokenType.SEMICOLON]
+IDENTIFIER_ID = TOKEN_TYPE_IDS[TokenType.IDENTIFIER]
+# Only prefixes a statement, which is matched from the token after it, e.g. `async def f():`
+ASYNC_ID = TOKEN_TYPE_IDS[TokenType.ASYNC]
+OPENING_BRACKETS = (TokenType.OPEN_PAREN, TokenType.OPEN_BRACKET, TokenType.OPEN_BRACE)
+CLOSING_BRACKETS = (TokenType.CLOSE_PAREN, TokenType.CLOSE_BRACKET, TokenType.CLOSE_BRACE)
+OPENING_BRACKET_IDS = frozenset(TOKEN_TYPE_IDS[token_type] for token_type in OPENING_BRACKETS)
+CLOSING_BRACKET_IDS = frozenset(TOKEN_TYPE_IDS[token_type] for token_type in CLOSING_BRACKETS)
+# Keywords starting the headers of compound statements no pattern matches, after which a statement may follow
+# on the same line, e.g. `if x: y = 1`
+COMPOUND_HEADER_IDS = frozenset(TOKEN_TYPE_IDS[token_type] for token_type in (
+    TokenType.IF, TokenType.ELIF, TokenType.ELSE, TokenType.FOR, TokenType.WHILE, TokenType.TRY, TokenType.EXCEPT,
+    TokenType.FINALLY, TokenType.WITH
+))
+# Maps the type ids of opening and closing brackets to two bytes and all others to zero,
+# so that the change of depth over a line takes two searches
+OPEN_BRACKET, CLOSE_BRACKET = 1, 2
+BRACKET_TABLE = bytes(
+    OPEN_BRACKET if token_type in OPENING_BRACKETS else CLOSE_BRACKET if token_type in CLOSING_BRACKETS else 0
+    for token_type in TOKEN_TYPES
+).ljust(256, b"\0")
 
 
 class Parser:
-    ast: List[AstNode] = []
-    tokens: List[Token] = []
+    tokens: Sequence[Token]
+    # Match attempts skipped because the pattern can't start with the token at that position
+    avoided_match_attempts: int
+    # Token ranges of the statements no pattern matched at, for diagnostics
+    unparsed: List[range]
+    stats: Optional["Stats"]
+    # Indices of the tokens per type, which `iter_nodes` finds the positions to match at in
+    postings: Optional[PostingLists]
+    # Leaves parsing to the first access of `ast`, `find` and `iter_nodes` only match where they need to until then
+    lazy: bool
+
+    # Statements are told apart by the lines of the tokens. Tokens built by hand without positions, which all end
+    # at offset 0, are matched at every token instead, and parsed in full by `iter_nodes` even when lazy
+
+    # Without tokens nothing gets parsed until `reset` is called with them,
+    # which allows reusing a single instance for any number of token sequences
+    # `ast` can be given along with the tokens when it's already known, e.g. loaded from a cache,
+    # and `postings` when the lexer recorded them
+    def __init__(
+        self,
+        tokens: Optional[Sequence[Token]] = None,
+        ast: Optional[List[AstNode]] = None,
+        stats: Optional["Stats"] = None,
+        postings: Optional[PostingLists] = None,
+        lazy: bool = False
+    ):
+        self._ast: Optional[List[AstNode]] = []
+        self.tokens = []
+        self.avoided_match_attempts = 0
+        self.unparsed = []
+        self.stats = stats
+        self.postings = None
+        self.lazy = lazy
+        if tokens is not None:
+            self.reset(tokens, ast, postings)
 
-    def __init__(self, tokens: List[Token]):
+    def reset(
+        self, tokens: Sequence[Token], ast: Optional[List[AstNode]] = None, postings: Optional[PostingLists] = None
+    ):
+        # Replaces all state of the previous tokens, nothing of it is kept referenced
         self.tokens = tokens
-        self.parse()
+        self.avoided_match_attempts = 0
+        self.unparsed = []
+        self.postings = postings
+        if ast is not None:
+            self._ast = ast
+        elif self.lazy:
+            self._ast = None
+        else:
+            self.parse()
+
+    @property
+    def ast(self) -> List[AstNode]:
+        if self._ast is None:
+            self.parse()
+        return self._ast
 
     def print_ast(self):
         for node in self.ast:
             print(repr(node))
 
     def parse(self):
-        print(f"Parsing tokens...")
+        log_progress(__name__, "Parsing tokens...")
+        with phase(self.stats, "parse"):
+            self._parse()
+
+    def find(self, node_type: AstNodeType) -> List[AstNode]:
+        return list(self.iter_nodes((node_type,)))
+
+    def iter_nodes(self, types: Optional[Iterable[AstNodeType]] = None) -> Iterator[AstNode]:
+        # Nodes of the given types in the order of their tokens, the same ones the AST holds.
+        # Until it's parsed, they're only matched at the tokens their patterns start with, found in the posting lists
+        types = frozenset(types) if types is not None else frozenset(AstNodeType)
+        if self._ast is None and not has_positions(self.tokens):
+            self.parse()
+        if self._ast is not None:
+            return (node for node in self._ast if node.type in types)
+        if self.postings is None:
+            self.postings = PostingLists.from_tokens(self.tokens)
+        return self._match_candidates(types)
+
+    def _match_candidates(self, types: FrozenSet[AstNodeType]) -> Iterator[AstNode]:
+        automaton = PATTERN_AUTOMATON.ensure_compiled()
+        first = {token_type for pattern in AST_PATTERNS if pattern.type in types for token_type in pattern.first}
+        statements = _StatementLocator(self.tokens, self.postings)
+        for i in merge(*(self.postings[token_type] for token_type in first)):
+            if not statements.is_attempted(i, automaton):
+                continue
+            result = automaton.match(statements.type_ids, i)
+            if result is not None and result[0].type in types:
+                yield AstNode(type=result[0].type, source=self.tokens, start=i, end=i + result[1])
+
+    def _parse(self):
+        self._ast = []
+        self.unparsed = []
 
         # TODO: Multiple parsing passes
+        # All patterns are matched at once by a single automaton over the type ids of the tokens.
+        # Statements are what patterns describe, so they are only attempted where one starts,
+        # anything left of a statement, or a whole one nothing matched, is skipped in a single step
+        type_ids = bytes(token_type_ids(self.tokens))
+        automaton = PATTERN_AUTOMATON.ensure_compiled()
+        starts = automaton.transitions[0]
+        avoided = [len(AST_PATTERNS) - len(PATTERN_DISPATCH[token_type]) for token_type in TOKEN_TYPES]
+        attempted = [] if self.stats is not None else None
+        avoided_match_attempts = 0
+        lines = self._statement_starts(type_ids)
         i = 0
-        while i < len(self.tokens):
-            token_slice = self.tokens[i:]
-            for pattern_class in AST_PATTERNS:
-                ast_node = pattern_class(token_slice).match()
-                if ast_node:
-                    self.ast.append(ast_node)
-                    i += len(ast_node.tokens) - 1
+        for start, end in zip(lines, lines[1:] + [len(type_ids)]):
+            # Already past the start when a match ran beyond the end of its statement
+            if i < start:
+                i = start
+            while i < end:
+                type_id = type_ids[i]
+                if type_id in LAYOUT_TYPE_IDS:
+                    i += 1
+                    continue
+                avoided_match_attempts += avoided[type_id]
+                if attempted is not None:
+                    attempted.append(type_id)
+                if type_id == ASYNC_ID:
+                    i += 1
+                    continue
+                if type_id in COMPOUND_HEADER_IDS:
+                    header_end = _header_end(type_ids, i, end)
+                    if header_end != -1:
+                        self.unparsed.append(range(i, header_end))
+                        i = header_end
+                        continue
+                # Not even attempted when no pattern starts with this token
+                result = automaton.match(type_ids, i) if starts[type_id] >= 0 else None
+                if result is None:
+                    while type_ids[end - 1] in LAYOUT_TYPE_IDS:
+                        end -= 1
+                    self.unparsed.append(range(i, end))
+                    break
+                pattern_class, length = result
+                if self.stats is not None:
+                    hits = self.stats.pattern_hits
+                    hits[pattern_class.__name__] = hits.get(pattern_class.__name__, 0) + 1
+                self._ast.append(AstNode(type=pattern_class.type, source=self.tokens, start=i, end=i + length))
+                i += length
+                # Another statement may follow the header of a compound one on the same line, e.g. `class A: pass`
+                if type_ids[i - 1] != COLON_ID:
                     break
-            i += 1
\ No newline at end of file
+        self.avoided_match_attempts = avoided_match_attempts
+
+        if attempted is not None:
+            self._count_pattern_attempts(attempted)
+
+    def _statement_starts(self, type_ids: bytes) -> List[int]:
+        if not has_positions(self.tokens):
+            return list(range(len(type_ids)))
+        separator_starts = _separator_starts(self.tokens, type_ids)
+        if not separator_starts:
+            return self._line_starts(type_ids)
+        return sorted({*self._line_starts(type_ids), *separator_starts})
+
+    def _line_starts(self, type_ids: bytes) -> List[int]:
+        # Logical lines are ended by NEWLINE tokens when the lexer emits them (the blocks engine),
+        # otherwise by the end of a physical line outside of any brackets
+        newline = type_ids.find(NEWLINE_ID)
+        if newline != -1:
+            line_starts = [0]
+            while newline != -1 and newline + 1 < len(type_ids):
+                line_starts.append(newline + 1)
+                newline = type_ids.find(NEWLINE_ID, newline + 1)
+            return line_starts
+
+        # The depth before every line is summed up from the brackets counted per line, all of it in C
+        physical_line_starts = line_start_indices(self.tokens)
+        line_ends = physical_line_starts[1:] + [len(type_ids)]
+        brackets = type_ids.translate(BRACKET_TABLE)
+        opened = map(brackets.count, repeat(OPEN_BRACKET), physical_line_starts, line_ends)
+        closed = map(brackets.count, repeat(CLOSE_BRACKET), physical_line_starts, line_ends)
+        depths = accumulate(map(sub, opened, closed), initial=0)
+        # Lines after unbalanced closing brackets still start statements
+        return list(compress(physical_line_starts, map(ge, repeat(0), depths)))
+
+    def _count_pattern_attempts(self, attempted: Sequence[int]):
+        # Every pattern able to start with a token is attempted where a statement starts with it.
+        # Only the type ids are collected in the matching loop, which is once per statement
+        attempted = Counter(attempted)
+        for pattern in AST_PATTERNS:
+            name = pattern.__name__
+            attempts = sum(attempted[TOKEN_TYPE_IDS[token_type]] for token_type in pattern.first)
+            self.stats.pattern_attempts[name] = self.stats.pattern_attempts.get(name, 0) + attempts
+
+
+def _separator_starts(tokens: Sequence[Token], type_ids: Sequence[int]) -> List[int]:
+    # Statements separated by semicolons start after SEMICOLON tokens (the blocks engine), otherwise at the words
+    # the semicolons are glued to, or after them when they end the word
+    starts = []
+    for i in semicolon_indices(tokens):
+        if type_ids[i] == SEMICOLON_ID:
+            starts.append(i + 1)
+        elif type_ids[i] == IDENTIFIER_ID:
+            starts.append(i + 1 if tokens[i].value.endswith(";") else i)
+    return [start for start in starts if start < len(type_ids)]
+
+
+def _header_end(type_ids: Sequence[int], start: int, stop: int) -> int:
+    # Index after the colon ending the header of the compound statement at `start`, the first one outside of brackets,
+    # or -1 when it doesn't end before `stop`
+    depth = 0
+    for i in range(start, stop):
+        type_id = type_ids[i]
+        if type_id in OPENING_BRACKET_IDS:
+            depth += 1
+        elif type_id in CLOSING_BRACKET_IDS:
+            depth -= 1
+        elif type_id == COLON_ID and depth <= 0:
+            return i + 1
+    return -1
+
+
+# Tells whether parsing all tokens would attempt a match at a token, looking only at the tokens of its line.
+# Logical lines start after NEWLINE tokens, or else at physical lines outside of brackets, and statements after
+# semicolons too, as in `_statement_starts`.
+# Matches running past the end of their line aren't accounted for, which no valid statement the patterns match does
+class _StatementLocator:
+    def __init__(self, tokens: Sequence[Token], postings: PostingLists):
+        self.tokens = tokens
+        self.type_ids = lazy_type_ids(tokens)
+        self.newlines = postings[TokenType.NEWLINE]
+        self.opening = [postings[token_type] for token_type in OPENING_BRACKETS]
+        self.closing = [postings[token_type] for token_type in CLOSING_BRACKETS]
+        self.separator_starts = _separator_starts(tokens, self.type_ids)
+
+    def depth_before(self, i: int) -> int:
+        return sum(bisect_left(indices, i) for indices in self.opening) - sum(
+            bisect_left(indices, i) for indices in self.closing
+        )
+
+    def statement_start(self, i: int) -> int:
+        start = self.line_start(i)
+        k = bisect_right(self.separator_starts, i)
+        return max(start, self.separator_starts[k - 1]) if k else start
+
+    def line_start(self, i: int) -> int:
+        if self.newlines:
+            k = bisect_left(self.newlines, i)
+            return self.newlines[k - 1] + 1 if k else 0
+        while True:
+            while i > 0 and not starts_line(self.tokens, i):
+                i -= 1
+            if i == 0 or self.depth_before(i) <= 0:
+                return i
+            i -= 1
+
+    def is_attempted(self, i: int, automaton: AstPatternAutomaton) -> bool:
+        # Follows the statements from the start of the line the way `_parse` does, which is only further than
+        # the layout tokens when headers of compound statements come before on the same line
+        type_ids = self.type_ids
+        j = self.statement_start(i)
+        while True:
+            while j < i and (type_ids[j] in LAYOUT_TYPE_IDS or type_ids[j] == ASYNC_ID):
+                j += 1
+            if j >= i:
+                return j == i
+            if type_ids[j] in COMPOUND_HEADER_IDS:
+                j = _header_end(type_ids, j, i)
+                if j == -1:
+                    return False
+                continue
+            result = automaton.match(type_ids, j)
+            if result is None:
+                return False
+            j += result[1]
+            if type_ids[j - 1] != COLON_ID:
+                return False
@@ -0,0 +1,123 @@
+from typing import Dict, Optional
+import json
+import os
+import socketserver
+import threading
+
+from lib.cache import ResultCache
+from lib.client import DEFAULT_SOCKET_PATH, OUTPUTS, is_running
+from lib.lexer import ENGINES, Lexer
+from lib.parser import Parser
+from lib.stats import Stats
+from lib.token import Token
+
+
+# Serves the protocol described in lib.client
+def token_to_json(token: Token) -> dict:
+    return {
+        "type": token.type.name, "value": token.value,
+        "start": token.start, "end": token.end, "line": token.line, "column": token.column,
+    }
+
+
+class RequestHandler:
+    default_engine: str
+
+    # Results are kept in a cache per engine for as long as the handler lives, which is what keeps a daemon warm
+    def __init__(self, default_engine: str = "classic", caches: Optional[Dict[str, ResultCache]] = None):
+        self.default_engine = default_engine
+        self._caches: Dict[str, ResultCache] = caches if caches is not None else {}
+        self._lock = threading.Lock()
+
+    def handle(self, request: dict) -> dict:
+        try:
+            return {"ok": True, **self._handle(request)}
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}" if str(e) else type(e).__name__}
+
+    def _handle(self, request: dict) -> dict:
+        if "command" in request:
+            if request["command"] not in ("ping", "shutdown"):
+                raise ValueError(f"Unknown command '{request['command']}'")
+            return {}
+
+        engine = request.get("engine") or self.default_engine
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown lexer engine '{engine}', available: {', '.join(ENGINES)}")
+        outputs = request.get("output", ["ast"])
+        unknown = [output for output in outputs if output not in OUTPUTS]
+        if unknown:
+            raise ValueError(f"Unknown output '{unknown[0]}', available: {', '.join(OUTPUTS)}")
+        path, source = request.get("path"), request.get("source")
+        if (path is None) == (source is None):
+            raise ValueError("Either a path or a source has to be given")
+
+        # Timings only mean something for a run which actually happens, so stats are never taken from the cache
+        if "stats" in outputs:
+            stats = Stats()
+            if path is not None:
+                lexer = Lexer(path, engine=engine, stats=stats)
+            else:
+                lexer = Lexer(engine=engine, stats=stats)
+                lexer.reset(source)
+            tokens = lexer.tokens
+            ast = Parser(tokens, stats=stats).ast
+        else:
+            stats = None
+            result = self._cache(engine).get_ast(path, source)
+            tokens, ast = result.tokens, result.ast
+
+        response = {}
+        if "tokens" in outputs:
+            response["tokens"] = [token_to_json(token) for token in tokens]
+        if "ast" in outputs:
+            response["ast"] = [{"type": node.type.name, "start": node.start, "end": node.end} for node in ast]
+        if stats is not None:
+            response["stats"] = stats.to_json()
+        return response
+
+    def _cache(self, engine: str) -> ResultCache:
+        with self._lock:
+            if engine not in self._caches:
+                self._caches[engine] = ResultCache(engine=engine)
+            return self._caches[engine]
+
+
+class _ConnectionHandler(socketserver.StreamRequestHandler):
+    server: "Server"
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                response = {"ok": False, "error": f"Invalid request: {e}"}
+                request = {}
+            else:
+                response = self.server.handler.handle(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+            if request.get("command") == "shutdown":
+                # Shutting down waits for the serving loop, which has to be done from another thread
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+# Every connection gets a thread of its own, they all share the warm caches of a single handler
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    handler: RequestHandler
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, handler: Optional[RequestHandler] = None):
+        if os.path.exists(socket_path):
+            if is_running(socket_path):
+                raise FileExistsError(f"A server is already listening on {socket_path}")
+            # Left over by a server which didn't shut down cleanly
+            os.unlink(socket_path)
+        self.handler = handler if handler is not None else RequestHandler()
+        super().__init__(socket_path, _ConnectionHandler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
@@ -0,0 +1,103 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator
+import contextlib
+import json
+import time
+
+from lib.token import TOKEN_TYPES
+
+
+@dataclass
+class PhaseTiming:
+    calls: int = 0
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+
+
+# Collected only when passed to a Lexer or Parser. Everything is counted once per phase, from the tokens and nodes
+# it produced, so the scanning and matching loops run the same with and without stats
+@dataclass
+class Stats:
+    phases: Dict[str, PhaseTiming] = field(default_factory=dict)
+    chars_scanned: int = 0
+    tokens_emitted: Dict[str, int] = field(default_factory=Counter)
+    # Largest list of tokens held at once
+    peak_tokens: int = 0
+    pattern_attempts: Dict[str, int] = field(default_factory=Counter)
+    pattern_hits: Dict[str, int] = field(default_factory=Counter)
+
+    @property
+    def pattern_failures(self) -> Dict[str, int]:
+        return {name: attempts - self.pattern_hits.get(name, 0) for name, attempts in self.pattern_attempts.items()}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[PhaseTiming]:
+        timing = self.phases.setdefault(name, PhaseTiming())
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield timing
+        finally:
+            timing.calls += 1
+            timing.wall_time += time.perf_counter() - wall_start
+            timing.cpu_time += time.process_time() - cpu_start
+
+    def count_tokens(self, type_ids: Iterable[int]):
+        for type_id, count in Counter(type_ids).items():
+            name = TOKEN_TYPES[type_id].name
+            self.tokens_emitted[name] = self.tokens_emitted.get(name, 0) + count
+
+    def merge(self, other: "Stats"):
+        # Adds up the stats of another run, e.g. of a worker process
+        for name, timing in other.phases.items():
+            own = self.phases.setdefault(name, PhaseTiming())
+            own.calls += timing.calls
+            own.wall_time += timing.wall_time
+            own.cpu_time += timing.cpu_time
+        self.chars_scanned += other.chars_scanned
+        self.peak_tokens = max(self.peak_tokens, other.peak_tokens)
+        for counts, other_counts in (
+            (self.tokens_emitted, other.tokens_emitted),
+            (self.pattern_attempts, other.pattern_attempts),
+            (self.pattern_hits, other.pattern_hits),
+        ):
+            for name, count in other_counts.items():
+                counts[name] = counts.get(name, 0) + count
+
+    def to_json(self) -> dict:
+        return {
+            "phases": {
+                name: {"calls": timing.calls, "wall_time": timing.wall_time, "cpu_time": timing.cpu_time}
+                for name, timing in self.phases.items()
+            },
+            "chars_scanned": self.chars_scanned,
+            "tokens_emitted": dict(sorted(self.tokens_emitted.items())),
+            "peak_tokens": self.peak_tokens,
+            "pattern_attempts": dict(sorted(self.pattern_attempts.items())),
+            "pattern_hits": dict(sorted(self.pattern_hits.items())),
+            "pattern_failures": dict(sorted(self.pattern_failures.items())),
+        }
+
+    def write_json(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_json(), file, indent=2)
+
+    def __str__(self) -> str:
+        lines = ["Phases:"]
+        for name, timing in self.phases.items():
+            lines.append(
+                f"  {name:<10} {timing.calls:>6} calls {timing.wall_time * 1000:10.2f} ms wall "
+                f"{timing.cpu_time * 1000:10.2f} ms cpu"
+            )
+        lines.append(f"Chars scanned: {self.chars_scanned}")
+        lines.append(f"Tokens emitted: {sum(self.tokens_emitted.values())}")
+        for name, count in sorted(self.tokens_emitted.items(), key=lambda item: (-item[1], item[0])):
+            lines.append(f"  {name:<16} {count:>10}")
+        lines.append(f"Peak tokens: {self.peak_tokens}")
+        lines.append("Patterns:")
+        failures = self.pattern_failures
+        for name, attempts in sorted(self.pattern_attempts.items()):
+            hits = self.pattern_hits.get(name, 0)
+            lines.append(f"  {name:<24} {attempts:>8} attempts {hits:>8} hits {failures[name]:>8} failures")
+        return "\n".join(lines)
@@ -0,0 +1,228 @@
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+import os
+import pickle
+
+from lib.ast_node import AstNode, AstNodeType
+from lib.disk_cache import DiskCache
+from lib.lexer import Lexer
+from lib.parser import Parser
+from lib.token import Token, TokenType
+from lib.utils import discover_files, write_atomically
+
+# Bump whenever what gets stored per file changes, index files of other versions are rebuilt
+INDEX_VERSION = 2
+DEFINITION_TYPES = (AstNodeType.CLASS, AstNodeType.DEF, AstNodeType.ASSIGNMENT)
+
+
+class Symbol(NamedTuple):
+    name: str
+    kind: AstNodeType
+    path: str
+    line: int
+    column: int
+
+
+class FileEntry(NamedTuple):
+    # Stat data of the file when it got indexed, it's only indexed again once that changes
+    mtime_ns: int
+    size: int
+    symbols: Tuple[Symbol, ...]
+    # Dotted names of the modules the file imports
+    imports: Tuple[str, ...]
+    # Why the file couldn't be indexed, it's tried again once it changes
+    error: Optional[str] = None
+
+
+def _name_token(node: AstNode) -> Token:
+    # Classes and defs are named by the identifier after their keyword, assignments by their first token
+    return node.tokens[0] if node.type == AstNodeType.ASSIGNMENT else node.tokens[1]
+
+
+def imported_module(node: AstNode, package: str = "") -> str:
+    # `from a.b import c` imports `a.b` and `import a.b` imports `a.b`. Relative imports are resolved against
+    # the `package` of the file, `from . import c` in `a/b.py` imports `a`, and kept relative without one or
+    # when they climb above it
+    tokens = node.tokens
+    if tokens[0].type != TokenType.FROM:
+        return "".join(token.value for token in islice(tokens, 1, None))
+    end = next(i for i, token in enumerate(tokens) if token.type == TokenType.IMPORT)
+    name = "".join(token.value for token in islice(tokens, 1, end))
+    dots = len(name) - len(name.lstrip("."))
+    parts = package.split(".") if package else []
+    if not dots or dots > len(parts):
+        return name
+    base = ".".join(parts[:len(parts) - dots + 1])
+    return ".".join(part for part in (base, name[dots:]) if part)
+
+
+def index_entries(
+    path: str, ast: Sequence[AstNode], package: str = ""
+) -> Tuple[Tuple[Symbol, ...], Tuple[str, ...]]:
+    symbols = []
+    imports = {}
+    for node in ast:
+        if node.type == AstNodeType.IMPORT:
+            imports[imported_module(node, package)] = None
+        elif node.type in DEFINITION_TYPES:
+            token = _name_token(node)
+            symbols.append(Symbol(token.value, node.type, path, token.line, token.column))
+    return tuple(symbols), tuple(imports)
+
+
+def module_name(path: str, root: str) -> str:
+    # `root/pkg/mod.py` is `pkg.mod`, and `root/pkg/__init__.py` is `pkg`
+    parts = os.path.splitext(os.path.relpath(path, root))[0].split(os.sep)
+    if parts[-1] == "__init__" and len(parts) > 1:
+        parts.pop()
+    return ".".join(parts)
+
+
+def package_name(path: str, root: str) -> str:
+    # The package relative imports of the file are resolved against, which a package's `__init__.py` is itself
+    module = module_name(path, root)
+    return module if os.path.basename(path) == "__init__.py" else module.rpartition(".")[0]
+
+
+# Definitions of classes, defs and assignments of every file by name, and the modules every file imports.
+# Files are indexed again on their own when their stat data changes: their old entries are taken out of the maps
+# and the new ones put in, nothing else gets touched. Names are sorted for completing prefixes on first use,
+# and kept sorted from then on, so that indexing a whole project doesn't insert every name into a sorted list
+class SymbolIndex:
+    root: str
+    engine: str
+    cache: Optional[DiskCache]
+
+    def __init__(self, root: str = ".", engine: str = "classic", cache: Optional[DiskCache] = None):
+        self.root = os.path.abspath(root)
+        self.engine = engine
+        self.cache = cache
+        self._files: Dict[str, FileEntry] = {}
+        # name -> path -> definitions, so that a file's definitions of a name are taken out at once
+        self._definitions: Dict[str, Dict[str, List[Symbol]]] = {}
+        self._names: Optional[List[str]] = None
+        self._importers: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(entry.symbols) for entry in self._files.values())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._definitions
+
+    @property
+    def files(self) -> List[str]:
+        return sorted(self._files)
+
+    @property
+    def errors(self) -> Dict[str, str]:
+        # Files which couldn't be indexed, with why
+        return {path: entry.error for path, entry in sorted(self._files.items()) if entry.error is not None}
+
+    def find(self, name: str) -> List[Symbol]:
+        return [symbol for symbols in self._definitions.get(name, {}).values() for symbol in symbols]
+
+    def complete(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        # Names starting with `prefix` in sorted order, found by bisecting the sorted names
+        if self._names is None:
+            self._names = sorted(self._definitions)
+        names = []
+        for name in islice(self._names, bisect_left(self._names, prefix), None):
+            if not name.startswith(prefix) or (limit is not None and len(names) >= limit):
+                break
+            names.append(name)
+        return names
+
+    def imports(self, path: str) -> List[str]:
+        entry = self._files.get(os.path.abspath(path))
+        return list(entry.imports) if entry is not None else []
+
+    def importers(self, module: str) -> List[str]:
+        return sorted(self._importers.get(module, ()))
+
+    def import_graph(self) -> Dict[str, Set[str]]:
+        # Module of every file to the modules it imports, whether they're part of the project or not
+        return {module_name(path, self.root): set(entry.imports) for path, entry in self._files.items()}
+
+    def update_file(self, path: str) -> bool:
+        # Indexes the file again if it changed since it got indexed, and drops it if it's gone.
+        # Returns whether anything changed
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return self.remove_file(path)
+        entry = self._files.get(path)
+        if entry is not None and (entry.mtime_ns, entry.size) == (st.st_mtime_ns, st.st_size):
+            return False
+
+        # A file failing to be read, tokenized or parsed is recorded with its error, the others are still indexed
+        try:
+            lexer = Lexer(path, engine=self.engine, cache=self.cache)
+            parser = Parser(lexer.tokens, ast=lexer.ast)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            self.add_file(path, FileEntry(st.st_mtime_ns, st.st_size, (), (), error))
+            return True
+        symbols, imports = index_entries(path, parser.ast, package_name(path, self.root))
+        self.add_file(path, FileEntry(st.st_mtime_ns, st.st_size, symbols, imports))
+        return True
+
+    def add_file(self, path: str, entry: FileEntry):
+        # Replaces whatever got indexed for the file before
+        path = os.path.abspath(path)
+        self.remove_file(path)
+        self._files[path] = entry
+        for symbol in entry.symbols:
+            by_path = self._definitions.get(symbol.name)
+            if by_path is None:
+                by_path = self._definitions[symbol.name] = {}
+                if self._names is not None:
+                    insort(self._names, symbol.name)
+            by_path.setdefault(path, []).append(symbol)
+        for module in entry.imports:
+            self._importers.setdefault(module, set()).add(path)
+
+    def remove_file(self, path: str) -> bool:
+        path = os.path.abspath(path)
+        entry = self._files.pop(path, None)
+        if entry is None:
+            return False
+        for name in {symbol.name for symbol in entry.symbols}:
+            by_path = self._definitions[name]
+            del by_path[path]
+            if not by_path:
+                del self._definitions[name]
+                if self._names is not None:
+                    del self._names[bisect_left(self._names, name)]
+        for module in entry.imports:
+            importers = self._importers[module]
+            importers.discard(path)
+            if not importers:
+                del self._importers[module]
+        return True
+
+    def refresh(self, paths: Iterable[str]) -> int:
+        # Brings the index up to date with the .py files found in `paths`, files indexed before but not found
+        # anymore are dropped. Returns the number of files indexed again or dropped
+        found = {os.path.abspath(path) for path in discover_files(paths)}
+        changed = sum(self.remove_file(path) for path in set(self._files) - found)
+        return changed + sum(self.update_file(path) for path in sorted(found))
+
+    def save(self, path: str):
+        # Only the entries of the files are stored, the maps are built from them again when loading
+        data = {"version": INDEX_VERSION, "root": self.root, "engine": self.engine, "files": self._files}
+        write_atomically(path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def load(cls, path: str, cache: Optional[DiskCache] = None) -> "SymbolIndex":
+        with open(path, "rb") as file:
+            data = pickle.load(file)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(
+                f"{path} has version {data.get('version')} of the index, only {INDEX_VERSION} is supported"
+            )
+        index = cls(data["root"], data["engine"], cache)
+        for file_path, entry in data["files"].items():
+            index.add_file(file_path, entry)
+        return index
@@ -1,8 +1,7 @@
-from dataclasses import dataclass
 from enum import Enum
-from typing import Optional
-
-import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Pattern, Tuple
+from sys import intern
 
 
 # TODO: Complete the list
@@ -25,6 +24,7 @@ class TokenType(Enum):
     COLON_EQ = "COLON_EQ"
     COMMA = "COMMA"
     CONTINUE = "CONTINUE"
+    DEDENT = "DEDENT"
     DEF = "DEF"
     DEL = "DEL"
     DIV = "DIV"
@@ -60,6 +60,7 @@ class TokenType(Enum):
     MINUS_EQ = "MINUS_EQ"
     MULT = "MULT"
     MULT_EQ = "MULT_EQ"
+    NEWLINE = "NEWLINE"
     NONE = "NONE"
     NONLOCAL = "NONLOCAL"
     NOT = "NOT"
@@ -81,120 +82,216 @@ class TokenType(Enum):
     WITH = "WITH"
     QUOT = "QUOT"
     YIELD = "YIELD"
+    # Added after the others, so that the ids of the types stored in caches and binary files stay the same
+    FLOOR_DIV = "FLOOR_DIV"
+    FLOOR_DIV_EQ = "FLOOR_DIV_EQ"
+    LSHIFT = "LSHIFT"
+    LSHIFT_EQ = "LSHIFT_EQ"
+    MOD = "MOD"
+    MOD_EQ = "MOD_EQ"
+    POW_EQ = "POW_EQ"
+    RSHIFT = "RSHIFT"
+    RSHIFT_EQ = "RSHIFT_EQ"
+    AT_EQ = "AT_EQ"
+    BIN_AND_EQ = "BIN_AND_EQ"
+    BIN_NOT = "BIN_NOT"
+    BIN_OR_EQ = "BIN_OR_EQ"
+    BIN_XOR = "BIN_XOR"
+    BIN_XOR_EQ = "BIN_XOR_EQ"
+    SEMICOLON = "SEMICOLON"
     # TODO: F-string and B-string (f"", b"")
     # TODO: Hash (comment)
     # TODO: Docstring (""")
     # TODO: Decorators (@)
-    # TODO: Binary literals (0b101111, 0B010101)
-    # TODO: Octal literals (0o123)
-    # TODO: Hex literals (0x123)
 
 
-@dataclass
-class Token:
+# Small integer ids of the token types, for storing them in arrays and indexing tables by them
+TOKEN_TYPES: List[TokenType] = list(TokenType)
+TOKEN_TYPE_IDS: Dict[TokenType, int] = {token_type: i for i, token_type in enumerate(TOKEN_TYPES)}
+
+
+class _TokenFields(NamedTuple):
     value: str
     type: TokenType
+    # Position of the value in the source, not taken into account when comparing tokens
+    start: int = 0
+    end: int = 0
+    line: int = 1
+    column: int = 0
 
 
-def match_token_type(v: str):
-    if v == "and": return TokenType.AND
-    elif v == "'": return TokenType.APOS
-    elif v == "->": return TokenType.ARROW
-    elif v == 'as': return TokenType.AS
-    elif v == 'assert': return TokenType.ASSERT
-    elif v == "async": return TokenType.ASYNC
-    elif v == '@': return TokenType.AT
-    elif v == "&": return TokenType.BIN_AND
-    elif v == "|": return TokenType.BIN_OR
-    elif v == "break": return TokenType.BREAK
-    elif v == "class": return TokenType.CLASS
-    elif v == "}": return TokenType.CLOSE_BRACE
-    elif v == "]": return TokenType.CLOSE_BRACKET
-    elif v == ")": return TokenType.CLOSE_PAREN
-    elif v == ":": return TokenType.COLON
-    elif v == ":=": return TokenType.COLON_EQ
-    elif v == ",": return TokenType.COMMA
-    elif v == "continue": return TokenType.CONTINUE
-    elif v == "def": return TokenType.DEF
-    elif v == 'del': return TokenType.DEL
-    elif v == "/": return TokenType.DIV
-    elif v == "/=": return TokenType.DIV_EQ
-    elif v == ".": return TokenType.DOT
-    elif v == "elif": return TokenType.ELIF
-    elif v == "...": return TokenType.ELLIPSIS
-    elif v == "else": return TokenType.ELSE
-    elif v == "=": return TokenType.EQ
-    elif v == "==": return TokenType.EQ_DOUBLE
-    elif v == "except": return TokenType.EXCEPT
-    elif v == "!": return TokenType.EXCLAMATION
-    elif v == "!=": return TokenType.EXCLAMATION_EQ
-    elif v == 'false': return TokenType.FALSE
-    elif v == 'finally': return TokenType.FINALLY
-    elif v == "for": return TokenType.FOR
-    elif v == "from": return TokenType.FROM
-    elif v == "global": return TokenType.GLOBAL
-    elif v == ">": return TokenType.GT
-    elif v == ">=": return TokenType.GT_EQ
-    elif v == "if": return TokenType.IF
-    elif v == "import": return TokenType.IMPORT
-    elif v == "in": return TokenType.IN
-    elif v == '\t': return TokenType.INDENT
-    elif v == "is": return TokenType.IS
-    elif v == "lambda": return TokenType.LAMBDA
-    elif v == "<": return TokenType.LT
-    elif v == "<=": return TokenType.LT_EQ
-    elif v == "-": return TokenType.MINUS
-    elif v == "-=": return TokenType.MINUS_EQ
-    elif v == "*": return TokenType.MULT
-    elif v == "*=": return TokenType.MULT_EQ
-    elif v == 'None': return TokenType.NONE
-    elif v == 'nonlocal': return TokenType.NONLOCAL
-    elif v == "not": return TokenType.NOT
-    elif v == "{": return TokenType.OPEN_BRACE
-    elif v == "[": return TokenType.OPEN_BRACKET
-    elif v == "(": return TokenType.OPEN_PAREN
-    elif v == "or": return TokenType.OR
-    elif v == "pass": return TokenType.PASS
-    elif v == "**": return TokenType.POW
-    elif v == "+": return TokenType.PLUS
-    elif v == "+=": return TokenType.PLUS_EQ
-    elif v == "raise": return TokenType.RAISE
-    elif v == "return": return TokenType.RETURN
-    elif v == "self": return TokenType.SELF
-    elif v == 'True': return TokenType.TRUE
-    elif v == 'try': return TokenType.TRY
-    elif v == "while": return TokenType.WHILE
-    elif v == "with": return TokenType.WITH
-    elif v == '\"': return TokenType.QUOT
-    elif v == 'yield': return TokenType.YIELD
+# An immutable record without an instance dict, which large trees hold millions of. Identifier, keyword and operator
+# values are interned, so all occurrences of `self` or `import` share a single string, the one in TYPE_LEXEMES.
+# Tokens equal and hash by value and type only, as a tuple they'd take their positions into account too
+class Token(_TokenFields):
+    __slots__ = ()
 
-    # STR_LITERAL is identified on the Lexer level
-    # FLOAT_LITERAL is derived from two INT_LITERAL and one DOT on the Lexer level
-    # Complex operands like MULT_EQ, PLUS_EQ etc. may not get detected upon initial tokenization
+    def __new__(cls, value: str, type: TokenType, start: int = 0, end: int = 0, line: int = 1, column: int = 0):
+        if type in INTERNED_TYPES:
+            value = intern(value)
+        return tuple.__new__(cls, (value, type, start, end, line, column))
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self[0] == other[0] and self[1] is other[1]
+
+    def __ne__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self[0] != other[0] or self[1] is not other[1]
+
+    def __hash__(self) -> int:
+        return hash((self[0], self[1]))
+
+    def __repr__(self) -> str:
+        return f"Token(value={self.value!r}, type={self.type!r})"
+
+
+class CharClass(Enum):
+    RESTRICTED = "RESTRICTED"
+    SPACING = "SPACING"
+    STR_LITERAL = "STR_LITERAL"
+    WORD = "WORD"
+
+
+# Every fixed lexeme the Lexer can emit, along with the variant it turns into when directly followed by "=".
+# Both the lexeme lookup and the "=" variants the scanners read in one go are derived from this spec
+TOKEN_SPEC: List[Tuple[str, TokenType, Optional[TokenType]]] = [
+    ("and", TokenType.AND, None),
+    ("'", TokenType.APOS, None),
+    ("->", TokenType.ARROW, None),
+    ("as", TokenType.AS, None),
+    ("assert", TokenType.ASSERT, None),
+    ("async", TokenType.ASYNC, None),
+    ("@", TokenType.AT, TokenType.AT_EQ),
+    ("&", TokenType.BIN_AND, TokenType.BIN_AND_EQ),
+    ("~", TokenType.BIN_NOT, None),
+    ("|", TokenType.BIN_OR, TokenType.BIN_OR_EQ),
+    ("^", TokenType.BIN_XOR, TokenType.BIN_XOR_EQ),
+    ("break", TokenType.BREAK, None),
+    ("class", TokenType.CLASS, None),
+    ("}", TokenType.CLOSE_BRACE, None),
+    ("]", TokenType.CLOSE_BRACKET, None),
+    (")", TokenType.CLOSE_PAREN, None),
+    (":", TokenType.COLON, TokenType.COLON_EQ),
+    (",", TokenType.COMMA, None),
+    ("continue", TokenType.CONTINUE, None),
+    ("def", TokenType.DEF, None),
+    ("del", TokenType.DEL, None),
+    ("/", TokenType.DIV, TokenType.DIV_EQ),
+    ("//", TokenType.FLOOR_DIV, TokenType.FLOOR_DIV_EQ),
+    (".", TokenType.DOT, None),
+    ("elif", TokenType.ELIF, None),
+    ("...", TokenType.ELLIPSIS, None),
+    ("else", TokenType.ELSE, None),
+    ("=", TokenType.EQ, TokenType.EQ_DOUBLE),
+    ("except", TokenType.EXCEPT, None),
+    ("!", TokenType.EXCLAMATION, TokenType.EXCLAMATION_EQ),
+    ("false", TokenType.FALSE, None),
+    ("finally", TokenType.FINALLY, None),
+    ("for", TokenType.FOR, None),
+    ("from", TokenType.FROM, None),
+    ("global", TokenType.GLOBAL, None),
+    (">", TokenType.GT, TokenType.GT_EQ),
+    (">>", TokenType.RSHIFT, TokenType.RSHIFT_EQ),
+    ("if", TokenType.IF, None),
+    ("import", TokenType.IMPORT, None),
+    ("in", TokenType.IN, None),
+    ("\t", TokenType.INDENT, None),
+    ("is", TokenType.IS, None),
+    ("lambda", TokenType.LAMBDA, None),
+    ("<", TokenType.LT, TokenType.LT_EQ),
+    ("<<", TokenType.LSHIFT, TokenType.LSHIFT_EQ),
+    ("-", TokenType.MINUS, TokenType.MINUS_EQ),
+    ("%", TokenType.MOD, TokenType.MOD_EQ),
+    ("*", TokenType.MULT, TokenType.MULT_EQ),
+    ("None", TokenType.NONE, None),
+    ("nonlocal", TokenType.NONLOCAL, None),
+    ("not", TokenType.NOT, None),
+    ("{", TokenType.OPEN_BRACE, None),
+    ("[", TokenType.OPEN_BRACKET, None),
+    ("(", TokenType.OPEN_PAREN, None),
+    ("or", TokenType.OR, None),
+    ("pass", TokenType.PASS, None),
+    ("**", TokenType.POW, TokenType.POW_EQ),
+    ("+", TokenType.PLUS, TokenType.PLUS_EQ),
+    ("raise", TokenType.RAISE, None),
+    ("return", TokenType.RETURN, None),
+    ("self", TokenType.SELF, None),
+    (";", TokenType.SEMICOLON, None),
+    ("True", TokenType.TRUE, None),
+    ("try", TokenType.TRY, None),
+    ("while", TokenType.WHILE, None),
+    ("with", TokenType.WITH, None),
+    ("\"", TokenType.QUOT, None),
+    ("yield", TokenType.YIELD, None),
+]
+
+LEXEME_TYPES: Dict[str, TokenType] = {intern(lexeme): token_type for lexeme, token_type, _ in TOKEN_SPEC}
+LEXEME_TYPES.update({
+    intern(lexeme + "="): eq_variant for lexeme, _, eq_variant in TOKEN_SPEC if eq_variant is not None
+})
+# The canonical value of every fixed lexeme, shared by all of its tokens
+TYPE_LEXEMES: Dict[TokenType, str] = {token_type: lexeme for lexeme, token_type in LEXEME_TYPES.items()}
+EQ_TOKEN_VARIANTS: Dict[TokenType, TokenType] = {
+    token_type: eq_variant for _, token_type, eq_variant in TOKEN_SPEC if eq_variant is not None
+}
+
+# Types of the tokens whose values get interned, any other value is either unique enough or may be large
+INTERNED_TYPES: FrozenSet[TokenType] = frozenset((TokenType.IDENTIFIER, *TYPE_LEXEMES))
+
+_DIGITS = r"\d[\d_]*"
+EXPONENT = rf"[eE][+-]?{_DIGITS}"
+# Floats with a point, which the scanners read in one go even though a point on its own is a token too.
+# The digits before the point end with a digit, like the integers the classic engine reads a point after
+DIGITS_POINT_FLOAT = rf"-?\d(?:[\d_]*\d)?\.(?:{_DIGITS})?(?:{EXPONENT})?"
+POINT_DIGITS_FLOAT = rf"\.{_DIGITS}(?:{EXPONENT})?"
+
+
+# The patterns of literals are only compiled once the first word that could be a number is classified
+@lru_cache(maxsize=None)
+def literal_patterns() -> Tuple[Pattern[str], Pattern[str], Pattern[str]]:
+    import re
 
     # TODO: Verify if tokenization of negative integers should be done here or on the Lexer level
-    if re.search("^(-|)(\d|_)+$", v) is not None:
-        return TokenType.INT_LITERAL
+    int_literal = re.compile(r"(-|)(\d|_)+")
+    prefixed_int = re.compile(r"-?0(?:[xX][0-9a-fA-F_]+|[oO][0-7_]+|[bB][01_]+)")
+    float_literal = re.compile(rf"{DIGITS_POINT_FLOAT}|{POINT_DIGITS_FLOAT}|-?{_DIGITS}{EXPONENT}")
+    return int_literal, prefixed_int, float_literal
+
+
+def match_token_type(v: str) -> TokenType:
+    # STR_LITERAL is identified on the Lexer level
+    token_type = LEXEME_TYPES.get(v)
+    if token_type is not None:
+        return token_type
+
+    # Most words are identifiers, so the patterns only run for words that could start a number
+    if v and (v[0] in "-_." or v[0].isdecimal()):
+        int_literal, prefixed_int, float_literal = literal_patterns()
+        if int_literal.fullmatch(v) is not None or prefixed_int.fullmatch(v) is not None:
+            return TokenType.INT_LITERAL
+        if float_literal.fullmatch(v) is not None:
+            return TokenType.FLOAT_LITERAL
     return TokenType.IDENTIFIER
 
 
-OPERATOR_TOKENS_WITH_VARIANTS = [
-    TokenType.PLUS, TokenType.MINUS, TokenType.MULT, TokenType.DIV,
-    TokenType.LT, TokenType.GT, TokenType.EQ, TokenType.COLON, TokenType.EXCLAMATION
-]
+OPERATOR_TOKENS_WITH_VARIANTS = list(EQ_TOKEN_VARIANTS)
 def get_eq_token_variant(t: TokenType) -> Optional[TokenType]:
-    if t == TokenType.PLUS: return TokenType.PLUS_EQ
-    elif t == TokenType.MINUS: return TokenType.MINUS_EQ
-    elif t == TokenType.MULT: return TokenType.MULT_EQ
-    elif t == TokenType.DIV: return TokenType.DIV_EQ
-    elif t == TokenType.LT: return TokenType.LT_EQ
-    elif t == TokenType.GT: return TokenType.GT_EQ
-    elif t == TokenType.EQ: return TokenType.EQ_DOUBLE
-    elif t == TokenType.COLON: return TokenType.COLON_EQ
-    elif t == TokenType.EXCLAMATION: return TokenType.EXCLAMATION_EQ
-    return None
+    return EQ_TOKEN_VARIANTS.get(t)
 
 
 SPACING_CHARS = ['\t', '\n', ' ']
 RESTRICTED_CHARS = [":", "(", ")", "[", "]", "{", "}", "=", ",", "."]
-STR_LITERAL_CHARS = ["\"", "'"]
\ No newline at end of file
+STR_LITERAL_CHARS = ["\"", "'"]
+
+# Indexed by the code of a char, anything outside of Latin-1 is a part of a word
+CHAR_CLASSES: List[CharClass] = [
+    CharClass.SPACING if chr(code) in SPACING_CHARS
+    else CharClass.RESTRICTED if chr(code) in RESTRICTED_CHARS
+    else CharClass.STR_LITERAL if chr(code) in STR_LITERAL_CHARS
+    else CharClass.WORD
+    for code in range(256)
+]
+
@@ -0,0 +1,512 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from itertools import chain, compress, count, islice, repeat
+from operator import add, attrgetter, contains, ne
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union, overload
+
+from lib.token import Token, TokenType, TOKEN_TYPES, TOKEN_TYPE_IDS, TYPE_LEXEMES
+
+
+# Columnar storage of tokens: a type id and the start and end offsets of the value in `source` per token.
+# Values of keywords, operators and indents are known from their type, others are sliced from `source`
+# on demand. Only values which are neither (e.g. string literals spanning multiple lines) are kept in `overrides`.
+# Slicing returns views sharing the same columns, and `Token` objects are only created when accessed.
+# Edits splice the columns in place. Offsets of the tokens after the last edit, and of the lines after it, are
+# stored as they were before it and shifted where they're read, see `_move_gap`, so views taken before an edit
+# don't survive it, like the nodes parsed from them
+class TokenArray(Sequence):
+    source: str
+    types: array
+    starts: array
+    ends: array
+    overrides: Dict[int, str]
+    # Tokens from `_gap` on, and line starts from `_line_gap` on, are stored that many chars short
+    _gap: int = 0
+    _shift: int = 0
+    _line_gap: int = 0
+    _line_shift: int = 0
+
+    def __init__(self, source: str):
+        self.source = source
+        self.types = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.overrides = {}
+        self._offset = 0
+        self._length: Optional[int] = None
+        self._line_starts: Optional[array] = None
+
+    @classmethod
+    def from_tokens(cls, tokens: Iterable[Token], source: str) -> "TokenArray":
+        token_array = cls(source)
+        token_array.extend(tokens)
+        return token_array
+
+    def append(self, token: Token):
+        if self._length is not None:
+            raise TypeError("Can't append to a view of a TokenArray")
+
+        self._close_gap()
+        self._set_override(len(self.types), token)
+        self.types.append(TOKEN_TYPE_IDS[token.type])
+        self.starts.append(token.start)
+        self.ends.append(token.end)
+
+    def extend(self, tokens: Iterable[Token]):
+        for token in tokens:
+            self.append(token)
+
+    def extend_columns(
+        self, values: Sequence[str], type_ids: Iterable[int], starts: Iterable[int], ends: Iterable[int],
+        overridden: Iterable[int]
+    ):
+        # Appends tokens given column by column, along with the indices among them of the values `_value_at`
+        # wouldn't come up with, so that tokens don't have to be made to fill the columns
+        if self._length is not None:
+            raise TypeError("Can't append to a view of a TokenArray")
+        self._close_gap()
+        first = len(self.types)
+        self.types.extend(type_ids)
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+        for i in overridden:
+            self.overrides[first + i] = values[i]
+
+    def _close_gap(self):
+        # Shifts the offsets after the last edit back in place before tokens get appended after them
+        if self._shift:
+            self._gap, self._shift = _move_gap((self.starts, self.ends), self._gap, self._shift, len(self.types))
+            self._gap, self._shift = len(self.types), 0
+
+    def splice(self, first: int, last: int, tokens: Sequence[Token], source: str, start: int, end: int):
+        # Replaces the tokens in [first, last) with `tokens` after source[start:end] got replaced, which made `source`.
+        # Only the edited part of the columns and of the line index is written
+        if self._length is not None:
+            raise TypeError("Can't splice a view of a TokenArray")
+        shift = len(source) - len(self.source)
+        self._gap, self._shift = _move_gap((self.starts, self.ends), self._gap, self._shift, last)
+        self.types[first:last] = token_type_ids(tokens)
+        self.starts[first:last] = array('I', map(attrgetter("start"), tokens))
+        self.ends[first:last] = array('I', map(attrgetter("end"), tokens))
+        self._gap, self._shift = first + len(tokens), self._shift + shift
+
+        count_delta = len(tokens) - (last - first)
+        if self.overrides and (count_delta or any(first <= i < last for i in self.overrides)):
+            self.overrides = {
+                i + count_delta if i >= last else i: value for i, value in self.overrides.items()
+                if not first <= i < last
+            }
+        self.source = source
+        for i, token in enumerate(tokens, first):
+            self._set_override(i, token)
+
+        line_starts = self._line_starts
+        if line_starts is not None:
+            new_end = end + shift
+            line_starts_of_edit = array('I')
+            i = source.find('\n', start, new_end)
+            while i != -1:
+                line_starts_of_edit.append(i + 1)
+                i = source.find('\n', i + 1, new_end)
+            # Lines starting after the old start of the edit up to its old end are the ones it replaced
+            first_line = _bisect_shifted(line_starts, self._line_gap, self._line_shift, start, right=True)
+            last_line = _bisect_shifted(line_starts, self._line_gap, self._line_shift, end, right=True)
+            self._line_gap, self._line_shift = _move_gap(
+                (line_starts,), self._line_gap, self._line_shift, last_line
+            )
+            line_starts[first_line:last_line] = line_starts_of_edit
+            self._line_gap, self._line_shift = first_line + len(line_starts_of_edit), self._line_shift + shift
+
+    def type_at(self, i: int) -> TokenType:
+        return TOKEN_TYPES[self.types[self._absolute_index(i)]]
+
+    def value_at(self, i: int) -> str:
+        return self._value_at(self._absolute_index(i))
+
+    def type_ids(self) -> memoryview:
+        return memoryview(self.types)[self._offset:self._offset + len(self)]
+
+    def indices_of(self, token_type: TokenType) -> List[int]:
+        type_id = TOKEN_TYPE_IDS[token_type]
+        stop = self._offset + len(self)
+        indices = []
+        i = self._offset
+        try:
+            while True:
+                i = self.types.index(type_id, i, stop)
+                indices.append(i - self._offset)
+                i += 1
+        except ValueError:
+            return indices
+
+    def count_of(self, token_type: TokenType) -> int:
+        return len(self.indices_of(token_type))
+
+    def line_start_indices(self) -> List[int]:
+        # A token starts a line when there's a line break between the end of the one before and its start,
+        # which holds for tokens after a multiline string too. Counted per token, but all of it in C
+        offset, stop = self._offset, self._offset + len(self)
+        if offset == stop:
+            return []
+        breaks = map(
+            self.source.count, repeat('\n'), self._offsets(self.ends, offset, stop - 1),
+            self._offsets(self.starts, offset + 1, stop)
+        )
+        return [0, *compress(range(1, stop - offset), breaks)]
+
+    def starts_line(self, i: int) -> bool:
+        # Same test as `line_start_indices`, for a single token
+        i = self._absolute_index(i)
+        if i == self._offset:
+            return True
+        end = self.ends[i - 1] + (self._shift if i - 1 >= self._gap else 0)
+        start = self.starts[i] + (self._shift if i >= self._gap else 0)
+        return self.source.find('\n', end, start) != -1
+
+    def semicolon_indices(self) -> List[int]:
+        # Same as the module function, from the semicolons in `source` instead of the values of all tokens
+        offset, stop = self._offset, self._offset + len(self)
+        indices = []
+        i = -1
+        while (i := self.source.find(';', i + 1)) != -1:
+            k = _bisect_shifted(self.starts, self._gap, self._shift, i, right=True) - 1
+            if not offset <= k < stop or i >= self.ends[k] + (self._shift if k >= self._gap else 0):
+                continue
+            if not indices or indices[-1] != k - offset:
+                indices.append(k - offset)
+        return indices
+
+    def __len__(self) -> int:
+        return len(self.types) - self._offset if self._length is None else self._length
+
+    @overload
+    def __getitem__(self, i: int) -> Token: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> "TokenArray": ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Token, "TokenArray"]:
+        if isinstance(i, slice):
+            return self._view(i)
+
+        i = self._absolute_index(i)
+        start, end = self.starts[i], self.ends[i]
+        if i >= self._gap:
+            start += self._shift
+            end += self._shift
+        line_starts = self._get_line_starts()
+        line = _bisect_shifted(line_starts, self._line_gap, self._line_shift, start, right=True)
+        line_start = line_starts[line - 1] + (self._line_shift if line - 1 >= self._line_gap else 0)
+        return Token(
+            value=self._value_at(i),
+            type=TOKEN_TYPES[self.types[i]],
+            start=start,
+            end=end,
+            line=line,
+            column=start - line_start
+        )
+
+    def __iter__(self) -> Iterator[Token]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (TokenArray, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def to_list(self) -> List[Token]:
+        return list(self)
+
+    def __getstate__(self) -> dict:
+        # The line index is cheaper to build again than to store, and offsets are stored shifted
+        state = self.__dict__.copy()
+        state.update(
+            starts=self._offsets(self.starts, 0, len(self.starts)), ends=self._offsets(self.ends, 0, len(self.ends)),
+            _gap=0, _shift=0, _line_starts=None, _line_gap=0, _line_shift=0
+        )
+        return state
+
+    def _view(self, s: slice) -> "TokenArray":
+        start, stop, step = s.indices(len(self))
+        if step != 1:
+            return TokenArray.from_tokens((self[i] for i in range(start, stop, step)), self.source)
+
+        view = TokenArray.__new__(TokenArray)
+        view.source = self.source
+        view.types = self.types
+        view.starts = self.starts
+        view.ends = self.ends
+        view.overrides = self.overrides
+        view._line_starts = self._get_line_starts()
+        view._gap, view._shift = self._gap, self._shift
+        view._line_gap, view._line_shift = self._line_gap, self._line_shift
+        view._offset = self._offset + start
+        view._length = max(stop - start, 0)
+        return view
+
+    def _value_at(self, i: int) -> str:
+        value = self.overrides.get(i)
+        if value is None:
+            value = TYPE_LEXEMES.get(TOKEN_TYPES[self.types[i]])
+        if value is None:
+            shift = self._shift if i >= self._gap else 0
+            value = self.source[self.starts[i] + shift:self.ends[i] + shift]
+        return value
+
+    def _set_override(self, i: int, token: Token):
+        # Same lookup as `_value_at`, values it wouldn't come up with are kept as overrides
+        lexeme = TYPE_LEXEMES.get(token.type)
+        if (lexeme if lexeme is not None else self.source[token.start:token.end]) != token.value:
+            self.overrides[i] = token.value
+
+    def _offsets(self, column: array, start: int, stop: int) -> array:
+        # Offsets in [start, stop) of the starts or ends, shifted where they're stored short
+        gap = min(max(self._gap, start), stop)
+        if not self._shift or gap == stop:
+            return column[start:stop]
+        return column[start:gap] + _shifted(column, gap, stop, self._shift)
+
+    def _get_line_starts(self) -> array:
+        # Built on first use, lines and columns of tokens are derived from it instead of being stored
+        if self._line_starts is None:
+            self._line_gap = self._line_shift = 0
+            self._line_starts = array('I', [0])
+            i = -1
+            while (i := self.source.find('\n', i + 1)) != -1:
+                self._line_starts.append(i + 1)
+        return self._line_starts
+
+    def _absolute_index(self, i: int) -> int:
+        length = len(self)
+        if i < 0:
+            i += length
+        if not 0 <= i < length:
+            raise IndexError("TokenArray index out of range")
+        return self._offset + i
+
+
+# Tokens of a list which got edited. The ones after the last edit are kept as they were before it and shifted where
+# they're read, so that an edit only writes the tokens between it and the one before
+class TokenList(Sequence):
+    def __init__(self, tokens: List[Token]):
+        self._tokens = tokens
+        self._gap = len(tokens)
+        self._offset_shift = 0
+        self._line_shift = 0
+
+    def splice(self, first: int, last: int, tokens: Sequence[Token], offset_shift: int, line_shift: int):
+        # Replaces the tokens in [first, last) with `tokens` from an edit which moved everything after it by
+        # `offset_shift` chars and `line_shift` lines
+        stored = self._tokens
+        if not self._offset_shift and not self._line_shift:
+            pass
+        elif last >= self._gap:
+            stored[self._gap:last] = map(self._shift, stored[self._gap:last])
+        else:
+            stored[last:self._gap] = map(self._unshift, stored[last:self._gap])
+        stored[first:last] = tokens
+        self._gap = first + len(tokens)
+        self._offset_shift += offset_shift
+        self._line_shift += line_shift
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    @overload
+    def __getitem__(self, i: int) -> Token: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[Token]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Token, List[Token]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        token = self._tokens[i]
+        if (i if i >= 0 else i + len(self._tokens)) < self._gap:
+            return token
+        return self._shift(token)
+
+    def __iter__(self) -> Iterator[Token]:
+        return chain(islice(self._tokens, self._gap), map(self._shift, islice(self._tokens, self._gap, None)))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (TokenList, TokenArray, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+    def to_list(self) -> List[Token]:
+        return list(self)
+
+    def _shift(self, token: Token) -> Token:
+        value, token_type, start, end, line, column = token
+        return tuple.__new__(Token, (
+            value, token_type, start + self._offset_shift, end + self._offset_shift, line + self._line_shift, column
+        ))
+
+    def _unshift(self, token: Token) -> Token:
+        value, token_type, start, end, line, column = token
+        return tuple.__new__(Token, (
+            value, token_type, start - self._offset_shift, end - self._offset_shift, line - self._line_shift, column
+        ))
+
+
+def _shifted(column: array, start: int, stop: int, shift: int) -> array:
+    # One pass in C rather than a token at a time
+    return array(column.typecode, map(add, column[start:stop], repeat(shift)))
+
+
+def _move_gap(columns: Tuple[array, ...], gap: int, shift: int, to: int) -> Tuple[int, int]:
+    # Sorted columns store their items from `gap` on `shift` short, which lets an edit shift everything after it
+    # without touching it. Moves the gap to `to` by writing only the items in between, and returns it along with
+    # the shift. Moving it back would store items below the shift as negative numbers, which unsigned columns can't
+    # hold, so then the shift is applied to every item after the gap instead
+    if not shift:
+        return to, 0
+    if to >= gap:
+        for column in columns:
+            column[gap:to] = _shifted(column, gap, to, shift)
+        return to, shift
+    if shift <= 0 or columns[0][to] >= shift:
+        for column in columns:
+            column[to:gap] = _shifted(column, to, gap, -shift)
+        return to, shift
+    for column in columns:
+        column[gap:] = _shifted(column, gap, len(column), shift)
+    return to, 0
+
+
+def _bisect_shifted(column: array, gap: int, shift: int, x: int, right: bool = False) -> int:
+    # Bisects the sorted items of a column as they are, not as they're stored
+    bisect = bisect_right if right else bisect_left
+    if gap < len(column) and bisect((column[gap] + shift,), x):
+        return bisect(column, x - shift, gap)
+    return bisect(column, x, 0, gap)
+
+
+def token_type_ids(tokens: Sequence[Token]) -> Sequence[int]:
+    if isinstance(tokens, TokenArray):
+        return tokens.type_ids()
+    return array('B', (TOKEN_TYPE_IDS[token.type] for token in tokens))
+
+
+def line_start_indices(tokens: Sequence[Token]) -> List[int]:
+    # Indices of the first token on every line holding the start of one
+    if isinstance(tokens, TokenArray):
+        return tokens.line_start_indices()
+    if not tokens:
+        return []
+    lines = list(map(attrgetter("line"), tokens))
+    return [0, *compress(range(1, len(lines)), map(ne, lines[1:], lines))]
+
+
+def starts_line(tokens: Sequence[Token], i: int) -> bool:
+    # Whether `line_start_indices` includes `i`, without looking at any other line
+    if isinstance(tokens, TokenArray):
+        return tokens.starts_line(i)
+    return i == 0 or tokens[i - 1].line != tokens[i].line
+
+
+def semicolon_indices(tokens: Sequence[Token]) -> List[int]:
+    # Indices of the tokens holding a semicolon, split out or glued to a word
+    if isinstance(tokens, TokenArray):
+        return tokens.semicolon_indices()
+    return list(compress(count(), map(contains, map(attrgetter("value"), tokens), repeat(";"))))
+
+
+def has_positions(tokens: Sequence[Token]) -> bool:
+    # Tokens built by hand without any are all left at offset 0, which lexed tokens only ever end at in an empty source
+    if isinstance(tokens, TokenArray) or not tokens:
+        return True
+    return tokens[-1].end > 0
+
+
+# Type ids of a list of tokens looked up where they're read, for matching at a few positions without converting all
+class _LazyTypeIds:
+    __slots__ = ("tokens",)
+
+    def __init__(self, tokens: Sequence[Token]):
+        self.tokens = tokens
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def __getitem__(self, i: int) -> int:
+        return TOKEN_TYPE_IDS[self.tokens[i].type]
+
+
+def lazy_type_ids(tokens: Sequence[Token]) -> Sequence[int]:
+    if isinstance(tokens, TokenArray):
+        return tokens.type_ids()
+    return _LazyTypeIds(tokens)
+
+
+# Sorted indices of the tokens of every type, so that the tokens of a few types are found without looking at the others.
+# Recorded while the tokens are produced, or else found in their type ids the first time a type is asked for
+class PostingLists:
+    def __init__(self, type_ids: Optional[bytes] = None):
+        self._type_ids = type_ids
+        self._lists: Dict[int, array] = {}
+        # Per list, where its indices start to be stored short since the last edit and by how much
+        self._gaps: Dict[int, Tuple[int, int]] = {}
+
+    @classmethod
+    def from_tokens(cls, tokens: Sequence[Token]) -> "PostingLists":
+        return cls(bytes(token_type_ids(tokens)))
+
+    def record(self, tokens: Iterable[Token]) -> Iterator[Token]:
+        # Passes the tokens through, adding the index of each to the list of its type
+        lists = [array('I') for _ in TOKEN_TYPES]
+        self._type_ids = None
+        self._lists = dict(enumerate(lists))
+        self._gaps = {}
+        appends = [indices.append for indices in lists]
+        type_ids = TOKEN_TYPE_IDS
+        for i, token in enumerate(tokens):
+            appends[type_ids[token.type]](i)
+            yield token
+
+    def splice(self, first: int, last: int, type_ids: Sequence[int]):
+        # Follows the tokens in [first, last) being replaced with tokens of `type_ids`. Lists are only written around
+        # the edit, the indices after it get shifted once the list is asked for
+        count_delta = len(type_ids) - (last - first)
+        if self._type_ids is not None:
+            if not isinstance(self._type_ids, bytearray):
+                self._type_ids = bytearray(self._type_ids)
+            self._type_ids[first:last] = bytes(type_ids)
+        new_indices: Dict[int, array] = {}
+        for i, type_id in enumerate(type_ids, first):
+            new_indices.setdefault(type_id, array('I')).append(i)
+        for type_id, indices in self._lists.items():
+            gap, shift = self._gaps.get(type_id, (len(indices), 0))
+            start = _bisect_shifted(indices, gap, shift, first)
+            stop = _bisect_shifted(indices, gap, shift, last)
+            gap, shift = _move_gap((indices,), gap, shift, stop)
+            inserted = new_indices.get(type_id, ())
+            indices[start:stop] = array('I', inserted)
+            self._gaps[type_id] = (start + len(inserted), shift + count_delta)
+
+    def __getitem__(self, token_type: TokenType) -> array:
+        type_id = TOKEN_TYPE_IDS[token_type]
+        indices = self._lists.get(type_id)
+        if type_id in self._gaps:
+            gap, shift = self._gaps.pop(type_id)
+            _move_gap((indices,), gap, shift, len(indices))
+        if indices is None:
+            indices = self._lists[type_id] = array('I')
+            if self._type_ids is not None:
+                i = self._type_ids.find(type_id)
+                while i != -1:
+                    indices.append(i)
+                    i = self._type_ids.find(type_id, i + 1)
+        return indices
+
+    def count(self, token_type: TokenType) -> int:
+        return len(self[token_type])
@@ -1,4 +1,72 @@
+from typing import ContextManager, Iterable, List, Optional, TYPE_CHECKING
+import contextlib
+import glob
+import mmap
+import os
+import pathlib
+import sys
+
+if TYPE_CHECKING:
+    from lib.stats import Stats
+
+
 def convert_leading_spaces_to_tabs(line: str, tab_width: int = 4) -> str:
     leading_spaces = len(line) - len(line.lstrip(' '))
     tabs = '\t' * (leading_spaces // tab_width)
-    return tabs + line.lstrip(' ')
\ No newline at end of file
+    return tabs + line.lstrip(' ')
+
+
+def read_source(path: str) -> str:
+    # Decoded straight from the file mapped in memory, so the source is the only copy of it ever made
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer, memoryview(buffer) as view:
+            source = str(view, "utf-8")
+    # Same newlines as reading the file in text mode
+    if '\r' in source:
+        source = source.replace('\r\n', '\n').replace('\r', '\n')
+    return source
+
+
+def log_progress(name: str, message: str):
+    # Progress is only logged at INFO, which goes nowhere until logging gets configured, and that can't happen
+    # before something imports it. So unless it's been imported, it isn't imported just for this
+    logging = sys.modules.get("logging")
+    if logging is not None:
+        logging.getLogger(name).info(message)
+
+
+def phase(stats: Optional["Stats"], name: str) -> ContextManager:
+    # Times `name` into `stats` when there are any, without importing them when there aren't
+    return stats.phase(name) if stats is not None else contextlib.nullcontext()
+
+
+def discover_files(paths: Iterable[str]) -> List[str]:
+    # Directories are searched recursively for .py files, globs are expanded ("**" matches any depth)
+    # and anything else is passed on as is, so that invalid paths end up as failed results
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(p.as_posix() for p in pathlib.Path(path).rglob("*.py") if p.is_file()))
+        elif glob.has_magic(path):
+            matches = sorted(glob.glob(path, recursive=True))
+            files.extend(discover_files(match for match in matches if os.path.isdir(match) or match.endswith(".py")))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def write_atomically(path: str, data: bytes):
+    # Written next to its destination and renamed, so that readers never see a partially written file.
+    # Only the caches and the index write files, so the lexer and parser don't import tempfile
+    import tempfile
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
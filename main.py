@@ -1,19 +1,215 @@
+from typing import Optional, TYPE_CHECKING
+import argparse
+import os
 import sys
 
-from lib.lexer import Lexer
-from lib.parser import Parser
+if TYPE_CHECKING:
+    from lib.stats import Stats
+
+# Every mode imports only what it needs when it runs, so that e.g. a client never loads the lexer
+
+
+def parse_args() -> argparse.Namespace:
+    arg_parser = argparse.ArgumentParser(description="Tokenize and parse Python scripts")
+    arg_parser.add_argument("paths", nargs="*", help="scripts, directories or globs of scripts")
+    arg_parser.add_argument("-j", "--workers", type=int, help="number of worker processes, all CPUs by default")
+    arg_parser.add_argument("--unordered", action="store_true", help="print results as soon as they're done")
+    arg_parser.add_argument("--engine", default="classic", help="lexer engine, classic, fast or blocks")
+    arg_parser.add_argument("-o", "--output", help="file to write the tokens and AST of a single script to, in binary")
+    arg_parser.add_argument("--cache-dir", help="directory to keep tokens and ASTs of unchanged scripts in")
+    arg_parser.add_argument(
+        "--cache-size", type=int, help="size limit of the cache in MB, 512 by default"
+    )
+    arg_parser.add_argument("--stats", action="store_true", help="print timings of every phase and counters")
+    arg_parser.add_argument("--stats-json", help="file to write the timings and counters to, in JSON")
+    arg_parser.add_argument("-q", "--quiet", action="store_true", help="don't print progress")
+    arg_parser.add_argument("--serve", action="store_true", help="keep serving requests on a Unix socket")
+    arg_parser.add_argument(
+        "--client", action="store_true", help="send the scripts to the server and print its JSON responses"
+    )
+    arg_parser.add_argument(
+        "--socket", help="path of the socket of the server, one in the directory for temporary files by default"
+    )
+    arg_parser.add_argument(
+        "--index", help="file to keep a symbol index of the scripts in, only changed scripts get indexed again"
+    )
+    arg_parser.add_argument("--find", help="name to look up in the index, or a prefix ending with * to complete")
+    arg_parser.add_argument(
+        "--emit", default="ast", help="comma separated outputs the client asks for, of tokens, ast and stats"
+    )
+    return arg_parser.parse_args()
 
 
 def main():
-    if not len(sys.argv) > 1:
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        return
+    if args.client:
+        run_client(args)
+        return
+    if args.index is not None:
+        run_index(args)
+        return
+    if not args.paths:
         print("Provide the script to be parsed")
         return
 
-    file_path = sys.argv[1]
+    stats = None
+    if args.stats or args.stats_json is not None:
+        from lib.stats import Stats
+
+        stats = Stats()
+    # A single script prints its AST, anything else gets processed in batch
+    if len(args.paths) == 1 and os.path.isfile(args.paths[0]):
+        from lib.lexer import Lexer
+        from lib.parser import Parser
+
+        # Progress is logged, and only shown for a single script, as workers would interleave it.
+        # Nothing gets logged unless logging is imported, see `log_progress`
+        if not args.quiet:
+            import logging
+
+            logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+        cache = None
+        if args.cache_dir is not None:
+            from lib.disk_cache import DiskCache
+
+            cache = DiskCache(args.cache_dir, cache_size(args))
+        lexer = Lexer(args.paths[0], engine=args.engine, cache=cache, stats=stats)
+        parser = Parser(lexer.tokens, ast=lexer.ast, stats=stats)
+        if args.output is not None:
+            from lib.binary_format import write_file
+
+            write_file(args.output, lexer.tokens, parser.ast)
+        else:
+            parser.print_ast()
+        report_stats(args, stats)
+        return
+
+    from lib.batch import BatchSummary, process_tree
+
+    summary = BatchSummary()
+    results = process_tree(
+        args.paths, workers=args.workers, ordered=not args.unordered, engine=args.engine,
+        cache_dir=args.cache_dir, cache_size=cache_size(args), collect_stats=stats is not None
+    )
+    for result in results:
+        summary.add(result)
+        if result.stats is not None:
+            stats.merge(result.stats)
+        if result.error is not None:
+            print(f"{result.path}: {result.error}")
+        else:
+            print(f"{result.path}: {result.tokens} tokens, {result.nodes} nodes")
+    print(summary)
+    report_stats(args, stats)
+
+
+def serve(args: argparse.Namespace):
+    from lib.server import RequestHandler, Server
+
+    path = socket_path(args)
+    try:
+        server = Server(path, RequestHandler(args.engine))
+    except FileExistsError as error:
+        print(error)
+        return
+    print(f"Listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def run_client(args: argparse.Namespace):
+    import json
+    from lib.client import Client, file_requests
+    from lib.utils import discover_files
+
+    # Without a running server the requests are handled in this process instead, with the same responses
+    requests = file_requests(discover_files(args.paths), args.emit.split(","), args.engine)
+    try:
+        client = Client(socket_path(args))
+    except OSError:
+        from lib.server import RequestHandler
+
+        handler = RequestHandler(args.engine)
+        for request in requests:
+            print(json.dumps(handler.handle(request)))
+        return
+    with client:
+        for request in requests:
+            print(json.dumps(client.request(request)))
+
+
+def run_index(args: argparse.Namespace):
+    from lib.symbols import SymbolIndex
+    from lib.utils import discover_files
+
+    # An index of another version is built again from scratch
+    try:
+        index = SymbolIndex.load(args.index)
+    except (FileNotFoundError, ValueError):
+        index = SymbolIndex(engine=args.engine)
+    if index.engine != args.engine and not args.paths:
+        print(f"{args.index} was built with the {index.engine} engine, not {args.engine}")
+    if args.paths:
+        # Modules are named, and relative imports resolved, from the directory holding all the scripts and their
+        # packages
+        files = discover_files(args.paths)
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in files]) if files else "."
+        while os.path.isfile(os.path.join(root, "__init__.py")) and os.path.dirname(root) != root:
+            root = os.path.dirname(root)
+        # Other engines may tokenize the scripts differently, so nothing of an index built with one is kept
+        if index.engine != args.engine:
+            print(f"{args.index} was built with the {index.engine} engine, building it again with {args.engine}")
+            index = SymbolIndex(root, engine=args.engine)
+        elif index.root != os.path.abspath(root):
+            if index.files:
+                print(f"{args.index} was built for {index.root}, building it again for {os.path.abspath(root)}")
+            index = SymbolIndex(root, engine=args.engine)
+        changed = index.refresh(files)
+        index.save(args.index)
+        for path, error in index.errors.items():
+            print(f"{path}: {error}")
+        print(
+            f"{changed} files indexed again, {len(index.files)} files with {len(index)} symbols "
+            f"({len(index.errors)} failed)"
+        )
+    if args.find is None:
+        return
+    if args.find.endswith("*"):
+        for name in index.complete(args.find[:-1]):
+            print(name)
+        return
+    for symbol in index.find(args.find):
+        print(f"{symbol.path}:{symbol.line}: {symbol.kind.name} {symbol.name}")
+    for path in index.importers(args.find):
+        print(f"{path}: imports {args.find}")
+
+
+def cache_size(args: argparse.Namespace) -> int:
+    from lib.disk_cache import DEFAULT_MAX_SIZE
+
+    return args.cache_size * 2 ** 20 if args.cache_size is not None else DEFAULT_MAX_SIZE
+
 
-    lexer = Lexer(file_path)
-    parser = Parser(lexer.tokens)
-    parser.print_ast()
+def socket_path(args: argparse.Namespace) -> str:
+    from lib.client import DEFAULT_SOCKET_PATH
+
+    return args.socket if args.socket is not None else DEFAULT_SOCKET_PATH
+
+
+def report_stats(args: argparse.Namespace, stats: Optional["Stats"]):
+    if stats is None:
+        return
+    if args.stats:
+        print(stats)
+    if args.stats_json is not None:
+        stats.write_json(args.stats_json)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,136 @@
+from benchmarks.corpus import generate
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from lib import aio
+from lib.lexer import Lexer
+from lib.parser import Parser
+import asyncio
+import pathlib
+import pytest
+import threading
+import time
+from typing import List
+
+SOURCES = [f"import module_{i}\nx_{i}: int = {i}\n\ndef f_{i}():\n    return '''a\nb'''\n" for i in range(12)]
+
+
+@pytest.fixture
+def scripts(tmp_path: pathlib.Path) -> List[str]:
+    paths = []
+    for i, source in enumerate(SOURCES):
+        path = tmp_path / f"script_{i}.py"
+        path.write_text(source)
+        paths.append(path.as_posix())
+    return paths
+
+
+def assert_parsed(result, path: str) -> None:
+    tokens = Lexer(path).tokens
+    assert result.path == path
+    assert list(result.tokens) == tokens
+    assert [(t.start, t.end, t.line) for t in result.tokens] == [(t.start, t.end, t.line) for t in tokens]
+    assert list(result.ast) == Parser(tokens).ast
+
+
+class TestParseFile:
+    def test_matches_lexer_and_parser(self, scripts: List[str]) -> None:
+        assert_parsed(asyncio.run(aio.parse_file(scripts[0])), scripts[0])
+
+    def test_runs_on_process_executor(self, scripts: List[str]) -> None:
+        async def parse():
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                return await aio.parse_file(scripts[0], executor=executor)
+
+        assert_parsed(asyncio.run(parse()), scripts[0])
+
+    def test_stops_tokenizing_once_cancelled(self) -> None:
+        cancelled = threading.Event()
+        cancelled.set()
+        with pytest.raises(CancelledError):
+            aio._parse_source(generate(64 * 1024), None, "fast", cancelled)
+
+    def test_cancelling_frees_executor(self, tmp_path: pathlib.Path) -> None:
+        path = tmp_path / "big.py"
+        path.write_text(generate(512 * 1024))
+        start = time.perf_counter()
+        aio._parse_source(path.read_text(), None, "fast")
+        full_time = time.perf_counter() - start
+
+        async def cancel() -> float:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                task = asyncio.ensure_future(aio.parse_file(path.as_posix(), "fast", executor))
+                await asyncio.sleep(full_time / 10)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+                # Only runs once the cancelled file let go of the single thread
+                cancelled = time.perf_counter()
+                await asyncio.get_running_loop().run_in_executor(executor, lambda: None)
+                return time.perf_counter() - cancelled
+
+        assert asyncio.run(cancel()) < full_time / 2
+
+
+class TestIterTokens:
+    @pytest.mark.parametrize("engine", ("classic", "fast", "blocks"))
+    def test_yields_tokens_of_lexer(self, scripts: List[str], engine: str) -> None:
+        async def collect():
+            return [token async for token in aio.iter_tokens(scripts[0], engine, batch_size=2)]
+
+        tokens = asyncio.run(collect())
+        expected = Lexer(scripts[0], engine=engine).tokens
+        assert tokens == expected
+        assert [(t.start, t.end, t.line, t.column) for t in tokens] == [
+            (t.start, t.end, t.line, t.column) for t in expected
+        ]
+
+    def test_rejects_process_executor(self, scripts: List[str]) -> None:
+        async def collect():
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                return [token async for token in aio.iter_tokens(scripts[0], executor=executor)]
+
+        with pytest.raises(ValueError):
+            asyncio.run(collect())
+
+
+class TestParseMany:
+    @pytest.mark.parametrize("executor", (None, "thread", "process"))
+    def test_parses_every_file(self, scripts: List[str], executor) -> None:
+        async def collect():
+            return [result async for result in aio.parse_many(scripts, concurrency=3, executor=executor)]
+
+        results = asyncio.run(collect())
+        assert sorted(result.path for result in results) == sorted(scripts)
+        for result in results:
+            assert_parsed(result, result.path)
+
+    def test_takes_no_more_paths_than_results_are_taken(self, scripts: List[str]) -> None:
+        taken = []
+
+        async def paths():
+            for path in scripts:
+                taken.append(path)
+                yield path
+
+        async def first():
+            results = aio.parse_many(paths(), concurrency=2)
+            await results.__anext__()
+            await asyncio.sleep(0.05)
+            count = len(taken)
+            await results.aclose()
+            return count
+
+        assert asyncio.run(first()) == 3
+
+    def test_error_cancels_remaining_files(self, scripts: List[str], tmp_path: pathlib.Path) -> None:
+        async def collect():
+            return [result async for result in aio.parse_many([(tmp_path / "missing.py").as_posix(), *scripts])]
+
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(collect())
+
+    def test_rejects_unknown_executor(self, scripts: List[str]) -> None:
+        async def collect():
+            return [result async for result in aio.parse_many(scripts, executor="fiber")]
+
+        with pytest.raises(ValueError):
+            asyncio.run(collect())
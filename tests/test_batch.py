@@ -0,0 +1,60 @@
+from lib.batch import BatchSummary, discover_files, process_tree
+import pathlib
+import pytest
+
+
+@pytest.fixture
+def tree(tmp_path: pathlib.Path) -> pathlib.Path:
+    (tmp_path / "pkg" / "sub").mkdir(parents=True)
+    (tmp_path / "pkg" / "a.py").write_text("import sys\nx = 1\n")
+    (tmp_path / "pkg" / "sub" / "b.py").write_text("class Foo:\n    y = 2\n")
+    (tmp_path / "pkg" / "sub" / "notes.txt").write_text("not python")
+    (tmp_path / "c.py").write_text("def f():\n    return None\n")
+    return tmp_path
+
+
+class TestDiscoverFiles:
+    def test_finds_files_in_directories_recursively(self, tree: pathlib.Path) -> None:
+        assert discover_files([(tree / "pkg").as_posix()]) == [
+            (tree / "pkg" / "a.py").as_posix(),
+            (tree / "pkg" / "sub" / "b.py").as_posix(),
+        ]
+
+    def test_expands_globs(self, tree: pathlib.Path) -> None:
+        assert discover_files([(tree / "**" / "b*").as_posix(), (tree / "*.py").as_posix()]) == [
+            (tree / "pkg" / "sub" / "b.py").as_posix(),
+            (tree / "c.py").as_posix(),
+        ]
+
+    def test_keeps_files_once(self, tree: pathlib.Path) -> None:
+        path = (tree / "c.py").as_posix()
+        assert discover_files([path, tree.as_posix(), path]).count(path) == 1
+
+
+class TestProcessTree:
+    @pytest.mark.parametrize("workers", (1, 2))
+    def test_results_are_ordered(self, tree: pathlib.Path, workers: int) -> None:
+        paths = [tree.as_posix()]
+        results = list(process_tree(paths, workers=workers, chunk_size=1))
+        assert [result.path for result in results] == discover_files(paths)
+        assert [(result.tokens, result.nodes) for result in results] == [(8, 1), (5, 2), (7, 2)]
+
+    def test_unordered_results_cover_all_files(self, tree: pathlib.Path) -> None:
+        paths = [tree.as_posix()]
+        results = process_tree(paths, workers=2, ordered=False, chunk_size=1)
+        assert sorted(result.path for result in results) == sorted(discover_files(paths))
+
+    @pytest.mark.parametrize("workers", (1, 2))
+    def test_isolates_errors(self, tree: pathlib.Path, workers: int) -> None:
+        missing = (tree / "missing.py").as_posix()
+        results = list(process_tree([missing, tree.as_posix()], workers=workers))
+        assert results[0].path == missing
+        assert results[0].error == f"FileNotFoundError: {missing} doesn't lead to a file"
+        assert all(result.error is None for result in results[1:])
+
+    def test_summary(self, tree: pathlib.Path) -> None:
+        summary = BatchSummary()
+        for result in process_tree([tree.as_posix(), (tree / "pkg" / "sub" / "notes.txt").as_posix()], workers=1):
+            summary.add(result)
+        assert (summary.files, summary.failed, summary.tokens, summary.nodes) == (4, 1, 20, 5)
+        assert summary.wall_time > 0
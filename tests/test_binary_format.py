@@ -0,0 +1,103 @@
+from lib.ast_node import AstNode, AstNodeType
+from lib.binary_format import BinaryReader, BinaryWriter, write_file
+from lib.lexer import Lexer
+from lib.parser import Parser
+from lib.token import Token, TokenType
+import io
+import pathlib
+import pytest
+
+base_path = pathlib.Path(__file__).parent.resolve() / "test_data"
+CODE_FILE_PATH = (base_path / "parser_test_data.py").as_posix()
+
+
+def positions(tokens):
+    return [(token.start, token.end, token.line, token.column) for token in tokens]
+
+
+@pytest.fixture(scope="module", params=(False, True), ids=("list", "columnar"))
+def lexer(request) -> Lexer:
+    return Lexer(CODE_FILE_PATH, columnar=request.param)
+
+
+@pytest.fixture
+def written(tmp_path: pathlib.Path, lexer: Lexer):
+    path = (tmp_path / "tokens.bin").as_posix()
+    parser = Parser(lexer.tokens)
+    write_file(path, lexer.tokens, parser.ast)
+    with BinaryReader(path) as reader:
+        yield reader, lexer, parser
+
+
+class TestRoundTrip:
+    def test_tokens(self, written) -> None:
+        reader, lexer, _ = written
+        assert len(reader) == len(lexer.tokens)
+        assert list(reader) == list(lexer.tokens)
+        assert positions(reader) == positions(lexer.tokens)
+
+    def test_nodes(self, written) -> None:
+        reader, _, parser = written
+        assert reader.node_count == len(parser.ast)
+        assert reader.nodes() == parser.ast
+        assert [(node.start, node.end) for node in reader.nodes()] == [(node.start, node.end) for node in parser.ast]
+
+    def test_strings_are_deduplicated(self, written) -> None:
+        reader, lexer, _ = written
+        assert reader.string_count == len({token.value for token in lexer.tokens})
+
+    def test_multi_line_and_non_ascii_values(self, tmp_path: pathlib.Path) -> None:
+        path = tmp_path / "script.py"
+        path.write_text("x = 'zażółć'\ny = \"\"\"a\nb\"\"\"\nz = 1\n", encoding="utf-8")
+        lexer = Lexer(path.as_posix())
+        write_file((tmp_path / "tokens.bin").as_posix(), lexer.tokens)
+        with BinaryReader((tmp_path / "tokens.bin").as_posix()) as reader:
+            assert list(reader) == lexer.tokens
+            assert positions(reader) == positions(lexer.tokens)
+
+
+class TestRandomAccess:
+    @pytest.mark.parametrize("i", (0, 7, -1))
+    def test_nth_token(self, written, i: int) -> None:
+        reader, lexer, _ = written
+        assert reader[i] == lexer.tokens[i]
+        assert positions([reader[i]]) == positions([lexer.tokens[i]])
+        assert (reader.type_at(i), reader.value_at(i)) == (lexer.tokens[i].type, lexer.tokens[i].value)
+
+    def test_slice(self, written) -> None:
+        reader, lexer, _ = written
+        assert reader[3:9] == list(lexer.tokens[3:9])
+
+    def test_out_of_range(self, written) -> None:
+        reader, _, _ = written
+        with pytest.raises(IndexError):
+            reader[len(reader)]
+        with pytest.raises(IndexError):
+            reader.node(reader.node_count)
+
+
+class TestWriter:
+    def test_streams_tokens_before_closing(self) -> None:
+        file = io.BytesIO()
+        writer = BinaryWriter(file)
+        writer.write_token(Token(value='x', type=TokenType.IDENTIFIER))
+        size = len(file.getvalue())
+        writer.write_token(Token(value='x', type=TokenType.IDENTIFIER, start=4, end=5))
+        assert len(file.getvalue()) > size
+        writer.close()
+
+    def test_rejects_node_out_of_range(self) -> None:
+        tokens = [Token(value='import', type=TokenType.IMPORT), Token(value='sys', type=TokenType.IDENTIFIER)]
+        with BinaryWriter(io.BytesIO()) as writer:
+            writer.write_token(tokens[0])
+            with pytest.raises(ValueError):
+                writer.write_node(AstNode(type=AstNodeType.IMPORT, source=tokens, start=0, end=2))
+
+
+class TestReader:
+    @pytest.mark.parametrize("content", (b"", b"not a token file at all, but long enough for a header" * 2))
+    def test_rejects_other_files(self, tmp_path: pathlib.Path, content: bytes) -> None:
+        path = tmp_path / "other.bin"
+        path.write_bytes(content)
+        with pytest.raises(ValueError):
+            BinaryReader(path.as_posix())
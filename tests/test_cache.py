@@ -0,0 +1,95 @@
+from lib.cache import ResultCache
+from lib.lexer import Lexer
+from lib.parser import Parser
+import os
+import pathlib
+import pytest
+
+SOURCE = "import sys\nx = 1\n"
+
+
+@pytest.fixture
+def cache() -> ResultCache:
+    return ResultCache()
+
+
+@pytest.fixture
+def script(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "script.py"
+    path.write_text(SOURCE)
+    return path
+
+
+def sources(count: int):
+    return [f"x_{i} = {i}\n" for i in range(count)]
+
+
+class TestResultCache:
+    def test_result_matches_lexer_and_parser(self, cache: ResultCache, script: pathlib.Path) -> None:
+        result = cache.get_ast(script)
+        lexer = Lexer(script.as_posix())
+        assert result.path == script.as_posix()
+        assert result.source == SOURCE
+        assert result.tokens == lexer.tokens
+        assert list(result.ast) == Parser(lexer.tokens).ast
+
+    @pytest.mark.parametrize("get_args", (
+        lambda path: {"path": path.as_posix()}, lambda path: {"path": path}, lambda path: {"source": SOURCE}
+    ))
+    def test_hits_same_result(self, cache: ResultCache, script: pathlib.Path, get_args) -> None:
+        result = cache.get_ast(**get_args(script))
+        assert cache.get_ast(**get_args(script)) is result
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_rejects_missing_path(self, cache: ResultCache, tmp_path: pathlib.Path) -> None:
+        missing = (tmp_path / "does_not_exist.py").as_posix()
+        with pytest.raises(FileNotFoundError, match=missing):
+            cache.get_ast(missing)
+        assert cache.misses == 0
+
+    def test_takes_either_a_path_or_a_source(self, cache: ResultCache, script: pathlib.Path) -> None:
+        with pytest.raises(ValueError):
+            cache.get_ast()
+        with pytest.raises(ValueError):
+            cache.get_ast(script, source=SOURCE)
+        assert cache.get_ast(source=script.as_posix()).source == script.as_posix()
+
+    def test_changed_file_misses(self, cache: ResultCache, script: pathlib.Path) -> None:
+        cache.get_ast(script)
+        script.write_text("import os\n")
+        os.utime(script, ns=(0, 0))
+        assert [token.value for token in cache.get_ast(script).tokens] == ["import", "os"]
+        assert cache.misses == 2
+
+    def test_evicts_least_recently_used(self) -> None:
+        cache = ResultCache(max_entries=2)
+        first, second, third = sources(3)
+        cache.get_ast(source=first)
+        cache.get_ast(source=second)
+        cache.get_ast(source=first)
+        cache.get_ast(source=third)
+        assert (len(cache), cache.evictions) == (2, 1)
+        cache.get_ast(source=first)
+        cache.get_ast(source=second)
+        assert (cache.hits, cache.misses) == (2, 4)
+
+    def test_bounds_retained_tokens(self) -> None:
+        # Every source has 3 tokens
+        cache = ResultCache(max_tokens=7)
+        for source in sources(3):
+            cache.get_ast(source=source)
+        assert (len(cache), cache.tokens, cache.evictions) == (2, 6, 1)
+
+    def test_does_not_keep_too_big_result(self) -> None:
+        cache = ResultCache(max_tokens=2)
+        assert len(cache.get_ast(source=SOURCE).tokens) == 5
+        assert (len(cache), cache.evictions) == (0, 0)
+
+    def test_shared_result_cannot_be_changed(self, cache: ResultCache) -> None:
+        result = cache.get_ast(source=SOURCE)
+        with pytest.raises(TypeError):
+            result.tokens.append(result.tokens[0])
+        with pytest.raises(AttributeError):
+            result.tokens[0].value = "changed"
+        assert cache.get_ast(source=SOURCE).tokens[0].value == "import"
+        assert result.ast[0].tokens[0].value == "import"
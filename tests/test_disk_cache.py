@@ -0,0 +1,114 @@
+from lib import disk_cache
+from lib.disk_cache import DiskCache
+from lib.lexer import Lexer
+from lib.parser import Parser
+from lib.token import TokenType
+import os
+import pathlib
+import pytest
+
+SOURCE = "import sys\n\nclass Foo(Bar):\n    x: int = 1\n    text = 'a'\n"
+# Old enough for the stat data to be trusted
+MTIME = 1_000_000_000
+
+
+@pytest.fixture
+def script(tmp_path: pathlib.Path) -> str:
+    path = tmp_path / "script.py"
+    path.write_text(SOURCE)
+    os.utime(path, (MTIME, MTIME))
+    return path.as_posix()
+
+
+@pytest.fixture
+def cache(tmp_path: pathlib.Path) -> DiskCache:
+    return DiskCache((tmp_path / "cache").as_posix())
+
+
+def write(path: str, source: str, mtime: int = MTIME) -> None:
+    pathlib.Path(path).write_text(source)
+    os.utime(path, (mtime, mtime))
+
+
+class TestDiskCache:
+    @pytest.mark.parametrize("columnar", (False, True))
+    def test_warm_lexer_matches_cold_lexer(self, script: str, cache: DiskCache, columnar: bool) -> None:
+        cold = Lexer(script, columnar=columnar, cache=cache)
+        assert cache.lookup(script) is not None
+        warm = Lexer(script, columnar=columnar, cache=cache)
+        assert warm.source == SOURCE
+        assert warm.tokens == Lexer(script).tokens
+        assert [(token.line, token.column) for token in warm.tokens] == [
+            (token.line, token.column) for token in cold.tokens
+        ]
+        assert warm.ast == cold.ast == Parser(warm.tokens).ast
+        assert all(node.source is warm.tokens for node in warm.ast)
+
+    def test_record_holds_counts(self, script: str, cache: DiskCache) -> None:
+        lexer = Lexer(script, cache=cache)
+        record = cache.lookup(script)
+        assert (record.tokens, record.nodes) == (len(lexer.tokens), len(lexer.ast))
+
+    def test_engines_with_other_tokens_are_stored_apart(self, script: str, cache: DiskCache) -> None:
+        classic = Lexer(script, cache=cache)
+        assert cache.lookup(script, "blocks") is None
+        blocks = Lexer(script, engine="blocks", cache=cache)
+        assert TokenType.NEWLINE in [token.type for token in blocks.tokens]
+        assert Lexer(script, engine="fast", cache=cache).tokens == classic.tokens
+        assert Lexer(script, engine="blocks", cache=cache).tokens == blocks.tokens
+        assert cache.lookup(script, "blocks").tokens == len(blocks.tokens)
+
+    def test_changed_content_misses(self, script: str, cache: DiskCache) -> None:
+        Lexer(script, cache=cache)
+        write(script, "import os\n", MTIME + 1)
+        assert cache.lookup(script) is None
+        assert cache.load(script) is None
+        assert [token.value for token in Lexer(script, cache=cache).tokens] == ["import", "os"]
+
+    def test_changed_stat_with_same_content_hits(self, script: str, cache: DiskCache) -> None:
+        Lexer(script, cache=cache)
+        write(script, SOURCE, MTIME + 1)
+        assert cache.lookup(script) is None
+        assert cache.load(script) is not None
+        # The record is written again for the new stat data
+        assert cache.lookup(script) is not None
+
+    def test_recently_modified_file_has_no_record(self, script: str, cache: DiskCache) -> None:
+        os.utime(script)
+        Lexer(script, cache=cache)
+        assert cache.lookup(script) is None
+        assert cache.load(script) is not None
+
+    def test_other_format_version_misses(self, script: str, cache: DiskCache, monkeypatch) -> None:
+        Lexer(script, cache=cache)
+        monkeypatch.setattr(disk_cache, "FORMAT_VERSION", disk_cache.FORMAT_VERSION + 1)
+        assert DiskCache(os.path.dirname(cache.directory)).load(script) is None
+
+    def test_corrupted_entry_misses(self, script: str, cache: DiskCache) -> None:
+        Lexer(script, cache=cache)
+        for name in os.listdir(os.path.join(cache.directory, "objects")):
+            with open(os.path.join(cache.directory, "objects", name), "wb") as file:
+                file.write(b"\x80\x05")
+        assert cache.load(script) is None
+        assert Lexer(script, cache=cache).tokens == Lexer(script).tokens
+
+    def test_prune_evicts_least_recently_used(self, tmp_path: pathlib.Path, cache: DiskCache) -> None:
+        scripts = []
+        for i in range(3):
+            path = (tmp_path / f"script_{i}.py").as_posix()
+            write(path, f"x = {i}\n")
+            Lexer(path, cache=cache)
+            # Script i was last used at MTIME + i
+            for file_path in (cache._object_path(DiskCache.hash_source(f"x = {i}\n")), cache._record_path(path)):
+                os.utime(file_path, (MTIME + i, MTIME + i))
+            scripts.append(path)
+        # Used again now, which leaves script 1 as the least recently used one
+        cache.load(scripts[0])
+
+        sizes = [
+            entry.stat().st_size
+            for directory in ("objects", "paths") for entry in os.scandir(os.path.join(cache.directory, directory))
+        ]
+        cache.max_size = sum(sizes) - os.path.getsize(cache._object_path(DiskCache.hash_source("x = 1\n")))
+        cache.prune()
+        assert [cache.load(path) is not None for path in scripts] == [True, False, True]
@@ -1,9 +1,17 @@
-from typing import List
+from typing import List, Union
 
-from lib.lexer import Lexer
-from lib.token import TokenType, Token
+from lib import lexer as lexer_module
+from lib.lexer import FastScanner, Lexer, tokenize_file, tokenize_source, tokenize_stream
+from lib.token import TokenType, Token, TOKEN_SPEC, TYPE_LEXEMES, match_token_type, get_eq_token_variant
+from lib.token_array import TokenArray
+from lib.utils import read_source
+import io
 import pathlib
+import pickle
 import pytest
+import time
+import tokenize
+import tracemalloc
 
 base_path = pathlib.Path(__file__).parent.resolve() / "test_data"
 CODE_FILE_PATH = (base_path / "lexer_test_data.py").as_posix()
@@ -129,3 +137,435 @@ class TestCounts:
             lexer=lexer_of_code_file,
             expected_token=Token(value=float_value, type=TokenType.FLOAT_LITERAL),
         )
+
+
+class TestStreaming:
+    def test_stream_matches_token_list(self, lexer_of_code_file: Lexer) -> None:
+        with open(CODE_FILE_PATH) as file:
+            assert list(tokenize_stream(file)) == lexer_of_code_file.tokens
+
+    def test_iter_tokens_matches_token_list(self, lexer_of_code_file: Lexer) -> None:
+        assert list(lexer_of_code_file.iter_tokens()) == lexer_of_code_file.tokens
+
+    def test_merges_tokens_across_lines(self) -> None:
+        tokens = tokenize_stream(io.StringIO("x = 2.5\ny = ...\nz **= 3\n"))
+        assert [token.type for token in tokens] == [
+            TokenType.IDENTIFIER, TokenType.EQ, TokenType.FLOAT_LITERAL,
+            TokenType.IDENTIFIER, TokenType.EQ, TokenType.ELLIPSIS,
+            TokenType.IDENTIFIER, TokenType.POW_EQ, TokenType.INT_LITERAL,
+        ]
+
+
+class TestReset:
+    def test_reset_matches_new_lexer(self, lexer_of_code_file: Lexer) -> None:
+        lexer = Lexer()
+        assert lexer.tokens == []
+        lexer.reset(lexer_of_code_file.source)
+        assert lexer.tokens == lexer_of_code_file.tokens
+        assert list(lexer.iter_tokens()) == lexer_of_code_file.tokens
+
+    def test_reset_replaces_previous_tokens(self) -> None:
+        lexer = Lexer(columnar=True)
+        lexer.reset("x = 1\n")
+        lexer.reset("import sys\n")
+        assert [token.value for token in lexer.tokens] == ["import", "sys"]
+
+    def test_instances_dont_share_tokens(self, lexer_of_code_file: Lexer) -> None:
+        assert Lexer().tokens is not Lexer().tokens
+        assert Lexer(CODE_FILE_PATH).tokens == lexer_of_code_file.tokens
+
+
+class TestPostings:
+    @pytest.mark.parametrize("columnar", (False, True))
+    def test_records_indices_per_type(self, lexer_of_code_file: Lexer, columnar: bool) -> None:
+        lexer = Lexer(CODE_FILE_PATH, columnar=columnar, postings=True)
+        assert lexer.tokens == lexer_of_code_file.tokens
+        for token_type in (TokenType.CLASS, TokenType.DEF, TokenType.IDENTIFIER, TokenType.ELLIPSIS):
+            expected = [i for i, token in enumerate(lexer.tokens) if token.type == token_type]
+            assert list(lexer.postings[token_type]) == expected
+
+    def test_records_nothing_unless_asked(self) -> None:
+        assert Lexer(CODE_FILE_PATH).postings is None
+
+    def test_follows_edits(self, tmp_path: pathlib.Path) -> None:
+        path = tmp_path / "edited.py"
+        path.write_text("x = 1\nclass A:\n    pass\n")
+        lexer = Lexer(path.as_posix(), postings=True)
+        assert list(lexer.postings[TokenType.CLASS]) == [3]
+        lexer.apply_edit(0, 0, "import sys\n")
+        assert list(lexer.postings[TokenType.CLASS]) == [5]
+
+
+class TestFastEngine:
+    def test_matches_classic_engine(self, lexer_of_code_file: Lexer) -> None:
+        assert Lexer(CODE_FILE_PATH, engine="fast").tokens == lexer_of_code_file.tokens
+
+    @pytest.mark.parametrize("source", (
+        'x = ""\nprint("a" + \'b\')\n',
+        '"""Doc\n    string"""\n',
+        '"escaped \\" quote" \'unterminated\n',
+        'a  \t b\n        c  \n  \t',
+        "s = '(' + ''",
+        'x = "a\\\n  " + b  \n  \n      ',
+        '"first\n  \n  "',
+        "x = 'a\\\n  ' + 'b\\\n    ' + \"c\"\n",
+        "'\\\\' + 'it\\'s'",
+        "x = 1    # four\ny =     2\n\n    \n",
+        "x = 1_. + 1_.5 + -1_.e5 + 1__0. + 1_0.5\n",
+    ))
+    def test_matches_classic_engine_on_edge_cases(self, source: str) -> None:
+        classic = list(tokenize_stream(io.StringIO(source), engine="classic"))
+        for fast in (tokenize_stream(io.StringIO(source), engine="fast"), tokenize_source(source, engine="fast")):
+            assert [
+                (token, token.start, token.end, token.line, token.column) for token in fast
+            ] == [(token, token.start, token.end, token.line, token.column) for token in classic]
+
+    def test_same_tokens_from_small_blocks(self, lexer_of_code_file: Lexer, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(FastScanner, "first_block_size", 7)
+        monkeypatch.setattr(FastScanner, "block_size", 64)
+        source = pathlib.Path(CODE_FILE_PATH).read_text()
+        expected = [(token, token.start, token.end, token.line, token.column) for token in lexer_of_code_file.tokens]
+        chunks = [source[:50], source[50:]]
+        for tokens in (tokenize_source(source, engine="fast"), FastScanner(chunks).iter_raw_tokens()):
+            assert [(token, token.start, token.end, token.line, token.column) for token in tokens] == expected
+
+    def test_fills_columns_without_tokens(self, lexer_of_code_file: Lexer) -> None:
+        tokens = Lexer(CODE_FILE_PATH, engine="fast", columnar=True).tokens
+        assert [(token.value, token.start, token.end, token.line, token.column) for token in tokens] == [
+            (token.value, token.start, token.end, token.line, token.column) for token in lexer_of_code_file.tokens
+        ]
+
+    def test_bounds_shared_piece_cache(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(lexer_module._PieceTokens, "limit", 8)
+        list(tokenize_source(" ".join(f"name_{i}" for i in range(100)), engine="fast"))
+        assert len(lexer_module._PIECE_TOKENS) <= 8
+
+    @pytest.mark.parametrize("wrap", (bytes, bytearray, memoryview))
+    def test_scans_bytes_in_place(self, lexer_of_code_file: Lexer, wrap) -> None:
+        buffer = wrap(pathlib.Path(CODE_FILE_PATH).read_bytes())
+        assert list(tokenize_source(buffer, engine="fast")) == lexer_of_code_file.tokens
+
+    def test_positions_in_bytes_are_byte_offsets(self) -> None:
+        buffer = "é = 'ü'\nx = 1\n".encode()
+        tokens = list(tokenize_source(buffer, engine="fast"))
+        assert [token.value for token in tokens] == ["é", "=", "ü", "x", "=", "1"]
+        assert [buffer[token.start:token.end].decode() for token in tokens] == ["é", "=", "ü", "x", "=", "1"]
+        assert (tokens[3].line, tokens[3].column) == (2, 0)
+
+    def test_classic_engine_rejects_bytes(self) -> None:
+        with pytest.raises(ValueError):
+            list(tokenize_source(b"x = 1\n"))
+
+    def test_tokenizes_mapped_file(self, lexer_of_code_file: Lexer, tmp_path: pathlib.Path) -> None:
+        assert list(tokenize_file(CODE_FILE_PATH)) == lexer_of_code_file.tokens
+        (tmp_path / "empty.py").write_text("")
+        assert list(tokenize_file((tmp_path / "empty.py").as_posix())) == []
+
+    def test_rejects_unknown_engine(self) -> None:
+        with pytest.raises(ValueError, match="Unknown lexer engine 'turbo'"):
+            Lexer(CODE_FILE_PATH, engine="turbo")
+
+    def test_explains_rejected_paths(self, tmp_path: pathlib.Path, capsys: pytest.CaptureFixture) -> None:
+        missing = (tmp_path / "missing.py").as_posix()
+        with pytest.raises(FileNotFoundError, match=missing):
+            Lexer(missing)
+        (tmp_path / "notes.txt").write_text("x = 1\n")
+        with pytest.raises(ValueError, match="is not a Python file"):
+            Lexer((tmp_path / "notes.txt").as_posix())
+        assert capsys.readouterr().out == ""
+
+
+BLOCK_TOKEN_TYPES = (TokenType.INDENT, TokenType.DEDENT, TokenType.NEWLINE)
+
+
+def block_tokens(source: Union[str, bytes]) -> List[str]:
+    return [
+        token.value if token.type not in BLOCK_TOKEN_TYPES else token.type.name
+        for token in tokenize_source(source, engine="blocks")
+    ]
+
+
+class TestBlocksEngine:
+    def test_opens_and_closes_blocks(self) -> None:
+        assert block_tokens("class A:\n  def f():\n\tpass\n\n  x = 1\ny\n") == [
+            "class", "A", ":", "NEWLINE",
+            "INDENT", "def", "f", "(", ")", ":", "NEWLINE",
+            "INDENT", "pass", "NEWLINE",
+            "DEDENT", "x", "=", "1", "NEWLINE",
+            "DEDENT", "y", "NEWLINE",
+        ]
+
+    def test_closes_blocks_at_end_of_source(self) -> None:
+        assert block_tokens("if x:\n    if y:\n        z") == [
+            "if", "x", ":", "NEWLINE", "INDENT", "if", "y", ":", "NEWLINE", "INDENT", "z", "NEWLINE", "DEDENT", "DEDENT"
+        ]
+
+    def test_continues_lines_within_brackets(self) -> None:
+        assert block_tokens("x = (1,\n  2)\ny = [\n]\nz = 1 + \\\n      2\n") == [
+            "x", "=", "(", "1", ",", "2", ")", "NEWLINE",
+            "y", "=", "[", "]", "NEWLINE",
+            "z", "=", "1", "+", "2", "NEWLINE",
+        ]
+
+    def test_skips_comments_and_reads_whole_literals(self) -> None:
+        source = 'def f():\n    """Doc \'(\' "string"\n"""\n# comment (\n    return "a\\"b" + \'\'  # )\n'
+        assert block_tokens(source) == [
+            "def", "f", "(", ")", ":", "NEWLINE",
+            "INDENT", "Doc \'(\' \"string\"\n", "NEWLINE",
+            "return", 'a\\"b', "+", "", "NEWLINE",
+            "DEDENT",
+        ]
+
+    def test_treats_form_feeds_as_whitespace(self) -> None:
+        # Like Python, a form feed in the indentation starts measuring it over
+        source = "\fdef f():\n    pass\n\f\nx = 1\fif y:\n    \f  z\n"
+        assert block_tokens(source) == [
+            "def", "f", "(", ")", ":", "NEWLINE", "INDENT", "pass", "NEWLINE",
+            "DEDENT", "x", "=", "1", "if", "y", ":", "NEWLINE", "INDENT", "z", "NEWLINE", "DEDENT",
+        ]
+        assert block_tokens(source.encode()) == block_tokens(source)
+
+    def test_rejects_misaligned_dedent(self) -> None:
+        with pytest.raises(IndentationError):
+            list(tokenize_source("if x:\n    y\n  z\n", engine="blocks"))
+
+    def test_matches_python_tokenizer(self) -> None:
+        source = pathlib.Path(CODE_FILE_PATH).read_text()
+        expected = [
+            token.type for token in tokenize.generate_tokens(io.StringIO(source).readline)
+            if token.type in (tokenize.INDENT, tokenize.DEDENT, tokenize.NEWLINE)
+        ]
+        names = {
+            TokenType.INDENT: tokenize.INDENT, TokenType.DEDENT: tokenize.DEDENT, TokenType.NEWLINE: tokenize.NEWLINE
+        }
+        assert [
+            names[token.type] for token in tokenize_source(source, engine="blocks") if token.type in BLOCK_TOKEN_TYPES
+        ] == expected
+
+    def test_same_tokens_from_every_input(self) -> None:
+        source = pathlib.Path(CODE_FILE_PATH).read_text()
+        expected = positions(tokenize_source(source, engine="blocks"))
+        assert positions(tokenize_stream(io.StringIO(source), engine="blocks")) == expected
+        assert positions(tokenize_source(source.encode(), engine="blocks")) == expected
+
+    @pytest.mark.parametrize("source", (pathlib.Path(CODE_FILE_PATH).read_text(), "if x:\n    if y:\n        z"))
+    def test_fills_columns_with_block_rows(self, source: str) -> None:
+        lexer = Lexer(engine="blocks", columnar=True)
+        lexer.reset(source)
+        assert isinstance(lexer.tokens, TokenArray)
+        assert positions(lexer.tokens) == positions(tokenize_source(source, engine="blocks"))
+
+    def test_apply_edit_matches_full_tokenization(self) -> None:
+        lexer = Lexer(engine="blocks")
+        lexer.reset("if x:\n    y = 1\nz = 2\n")
+        start = lexer.source.index("z")
+        lexer.apply_edit(start, start, "    ")
+        assert positions(lexer.tokens) == positions(tokenize_source(lexer.source, engine="blocks"))
+        assert [token.type for token in lexer.tokens].count(TokenType.DEDENT) == 1
+
+
+class TestReadSource:
+    def test_reads_a_single_copy(self, tmp_path: pathlib.Path) -> None:
+        path = tmp_path / "big.py"
+        path.write_text("x = 1\n" * 200_000)
+        tracemalloc.start()
+        try:
+            source = read_source(path.as_posix())
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert source == path.read_text()
+        assert peak < 1.1 * len(source)
+
+    def test_translates_newlines_like_text_mode(self, tmp_path: pathlib.Path) -> None:
+        path = tmp_path / "script.py"
+        path.write_bytes(b"x = 1\r\ny = 2\rz = 3\n")
+        assert read_source(path.as_posix()) == "x = 1\ny = 2\nz = 3\n"
+
+
+class TestClassification:
+    def test_matches_every_lexeme_and_variant_of_spec(self) -> None:
+        for lexeme, token_type, eq_variant in TOKEN_SPEC:
+            assert match_token_type(lexeme) == token_type
+            assert get_eq_token_variant(token_type) == eq_variant
+            if eq_variant is not None:
+                assert match_token_type(lexeme + "=") == eq_variant
+
+    @pytest.mark.parametrize("value, token_type", (
+        ("-2", TokenType.INT_LITERAL),
+        ("3_0", TokenType.INT_LITERAL),
+        ("_private", TokenType.IDENTIFIER),
+        ("x1", TokenType.IDENTIFIER),
+        ("0x1f", TokenType.INT_LITERAL),
+        ("0o17", TokenType.INT_LITERAL),
+        ("0B1_0", TokenType.INT_LITERAL),
+        ("1e-5", TokenType.FLOAT_LITERAL),
+        ("1.", TokenType.FLOAT_LITERAL),
+        ("1.e5", TokenType.FLOAT_LITERAL),
+    ))
+    def test_matches_int_literals_and_identifiers(self, value: str, token_type: TokenType) -> None:
+        assert match_token_type(value) == token_type
+
+
+MUNCH_SOURCE = "a //= b // c ** 2\nx **= 1e5 % .5\ny = 0x1F << 0b101\nz = 1.5e-3 + 2. - -2.5\nf(...) -> 1.real\n"
+
+
+class TestMaximalMunch:
+    @pytest.mark.parametrize("engine", ("classic", "fast", "blocks"))
+    def test_reads_compound_operators_and_numbers_whole(self, engine: str) -> None:
+        tokens = [token for token in tokenize_source(MUNCH_SOURCE, engine) if token.type != TokenType.NEWLINE]
+        assert [(token.value, token.type) for token in tokens] == [
+            ("a", TokenType.IDENTIFIER), ("//=", TokenType.FLOOR_DIV_EQ), ("b", TokenType.IDENTIFIER),
+            ("//", TokenType.FLOOR_DIV), ("c", TokenType.IDENTIFIER), ("**", TokenType.POW),
+            ("2", TokenType.INT_LITERAL),
+            ("x", TokenType.IDENTIFIER), ("**=", TokenType.POW_EQ), ("1e5", TokenType.FLOAT_LITERAL),
+            ("%", TokenType.MOD), (".5", TokenType.FLOAT_LITERAL),
+            ("y", TokenType.IDENTIFIER), ("=", TokenType.EQ), ("0x1F", TokenType.INT_LITERAL),
+            ("<<", TokenType.LSHIFT), ("0b101", TokenType.INT_LITERAL),
+            ("z", TokenType.IDENTIFIER), ("=", TokenType.EQ), ("1.5e-3", TokenType.FLOAT_LITERAL),
+            ("+", TokenType.PLUS), ("2.", TokenType.FLOAT_LITERAL), ("-", TokenType.MINUS),
+            ("-2.5", TokenType.FLOAT_LITERAL),
+            ("f", TokenType.IDENTIFIER), ("(", TokenType.OPEN_PAREN), ("...", TokenType.ELLIPSIS),
+            (")", TokenType.CLOSE_PAREN), ("->", TokenType.ARROW),
+            ("1", TokenType.INT_LITERAL), (".", TokenType.DOT), ("real", TokenType.IDENTIFIER),
+        ]
+        assert all(MUNCH_SOURCE[token.start:token.end] == token.value for token in tokens)
+
+    def test_engines_agree_on_positions(self) -> None:
+        classic = [(token, token.start, token.end, token.line, token.column) for token in tokenize_source(MUNCH_SOURCE)]
+        assert [
+            (token, token.start, token.end, token.line, token.column) for token in tokenize_source(MUNCH_SOURCE, "fast")
+        ] == classic
+
+    @pytest.mark.parametrize("source, values", (
+        ("n//2", ["n", "//", "2"]),
+        ("(lo+hi)//2", ["(", "lo", "+", "hi", ")", "//", "2"]),
+        ("x//=2", ["x", "//=", "2"]),
+        ("a!=b", ["a", "!=", "b"]),
+        ("x**=2;y|=~z^1", ["x", "**=", "2", ";", "y", "|=", "~", "z", "^", "1"]),
+        ("f(-1,x-1)", ["f", "(", "-1", ",", "x", "-", "1", ")"]),
+        ("a.b+1.5e-3*c", ["a", ".", "b", "+", "1.5e-3", "*", "c"]),
+        ("0x1e-5<x1e-5", ["0x1e", "-", "5", "<", "x1e", "-", "5"]),
+    ))
+    def test_blocks_engine_splits_unspaced_operators(self, source: str, values: List[str]) -> None:
+        tokens = [token for token in tokenize_source(source, "blocks") if token.type != TokenType.NEWLINE]
+        assert [token.value for token in tokens] == values
+        assert all(token.type != TokenType.IDENTIFIER or token.value.isidentifier() for token in tokens)
+        assert all(source[token.start:token.end] == token.value for token in tokens)
+
+    @pytest.mark.parametrize("engine", ("classic", "fast"))
+    def test_does_not_join_separated_tokens(self, engine: str) -> None:
+        assert [token.type for token in tokenize_source("1 . 5 * = 2", engine)] == [
+            TokenType.INT_LITERAL, TokenType.DOT, TokenType.INT_LITERAL, TokenType.MULT, TokenType.EQ,
+            TokenType.INT_LITERAL,
+        ]
+
+
+class TestTokenRecord:
+    def test_is_immutable_and_hashable_by_value_and_type(self) -> None:
+        token = Token("x", TokenType.IDENTIFIER, 4, 5, 2, 0)
+        with pytest.raises(AttributeError):
+            token.value = "y"
+        assert not hasattr(token, "__dict__")
+        assert token == Token("x", TokenType.IDENTIFIER) and token != Token("x", TokenType.STR_LITERAL)
+        assert len({token, Token("x", TokenType.IDENTIFIER, 10, 11, 3, 4), Token("y", TokenType.IDENTIFIER)}) == 2
+        assert pickle.loads(pickle.dumps(token)) == token
+
+    @pytest.mark.parametrize("engine", ("classic", "fast", "blocks"))
+    def test_shares_values_of_identifiers_and_keywords(self, engine: str) -> None:
+        tokens = list(tokenize_source("import os\nimport sys\nos = sys ** 2\nos.path\n", engine))
+        imports = [token for token in tokens if token.type == TokenType.IMPORT]
+        assert all(token.value is TYPE_LEXEMES[TokenType.IMPORT] for token in imports)
+        names = [token.value for token in tokens if token.value == "os"]
+        assert len(names) == 3 and all(name is names[0] for name in names)
+        power = next(token for token in tokens if token.type == TokenType.POW)
+        assert power.value is TYPE_LEXEMES[TokenType.POW]
+
+
+class TestPositions:
+    def test_tracks_lines_and_columns(self, lexer_of_code_file: Lexer) -> None:
+        foo = next(token for token in lexer_of_code_file.tokens if token.value == 'Foo')
+        assert (foo.line, foo.column) == (7, 8)
+        minus_two = next(token for token in lexer_of_code_file.tokens if token.value == '-2')
+        assert (minus_two.line, minus_two.column) == (9, 13)
+
+    def test_offsets_point_at_values_in_source(self, lexer_of_code_file: Lexer) -> None:
+        source = lexer_of_code_file.source
+        for token in lexer_of_code_file.tokens:
+            if token.type != TokenType.INDENT:
+                assert source[token.start:token.end] == token.value
+
+
+def positions(tokens):
+    return [(token.value, token.type, token.start, token.end, token.line, token.column) for token in tokens]
+
+
+class TestApplyEdit:
+    @pytest.fixture
+    def lexer(self, tmp_path: pathlib.Path) -> Lexer:
+        path = tmp_path / "edited.py"
+        path.write_text(pathlib.Path(CODE_FILE_PATH).read_text())
+        return Lexer(path.as_posix())
+
+    @pytest.mark.parametrize("old_text, new_text", (
+        ("msg: str", "message: str"),
+        ("temp = self.a + 3", "temp = self.a += 3.5"),
+        ("pass\n", "pass\n\n    x = 1\n"),
+        ("\"I'm screaming!\"", "\"I'm\n screaming!"),
+        ("\"Adam \\\" night\"", ""),
+    ))
+    def test_matches_full_tokenization(self, lexer: Lexer, old_text: str, new_text: str) -> None:
+        start = lexer.source.index(old_text)
+        lexer.apply_edit(start, start + len(old_text), new_text)
+        assert positions(lexer.tokens) == positions(tokenize_source(lexer.source))
+
+    @pytest.mark.parametrize("columnar", (False, True))
+    def test_follows_edits_back_and_forth(self, columnar: bool) -> None:
+        lexer = Lexer(columnar=columnar, postings=True)
+        lexer.reset(pathlib.Path(CODE_FILE_PATH).read_text())
+        # Every edit lands before or after the one before it, some of them far away
+        for old_text, new_text in (
+            ("print(msg)", "print(msg, msg)\n        return"),
+            ("import sys", "import os\nimport sys"),
+            ("lambda x: 20", "None"),
+            ("class Bar(Foo):", "class Bar(Foo, object):  # comment"),
+            ("temp = self.a + 3", "temp = '''\n'''"),
+            ("random_num = bar(", "random_num = bar(\n        5,"),
+            ("\n\n", "\n"),
+        ):
+            start = lexer.source.index(old_text)
+            lexer.apply_edit(start, start + len(old_text), new_text)
+            expected = list(tokenize_source(lexer.source))
+            assert positions(lexer.tokens) == positions(expected)
+            assert positions(lexer.tokens[5:40]) == positions(expected[5:40])
+            for token_type in (TokenType.IDENTIFIER, TokenType.CLASS, TokenType.OPEN_PAREN):
+                assert list(lexer.postings[token_type]) == [
+                    i for i, token in enumerate(expected) if token.type == token_type
+                ]
+
+    @pytest.mark.parametrize("columnar", (False, True))
+    def test_edits_take_time_of_edited_line(self, columnar: bool) -> None:
+        # Tokens after the edit are neither tokenized again nor rewritten, so that an edit of a large file takes
+        # a tiny part of tokenizing all of it
+        source = pathlib.Path(CODE_FILE_PATH).read_text() * 200
+        lexer = Lexer(engine="fast", columnar=columnar, postings=True)
+        start = time.process_time()
+        lexer.reset(source)
+        full_time = time.process_time() - start
+
+        # Typing in the middle of the file, only the tokens between consecutive edits get moved
+        position = lexer.source.index("greeting", len(source) // 2)
+        edit_times = []
+        for i in range(5):
+            start = time.process_time()
+            lexer.apply_edit(position + i, position + i, "x")
+            edit_times.append(time.process_time() - start)
+        assert min(edit_times) < full_time / 100
+        assert positions(lexer.tokens) == positions(tokenize_source(lexer.source, "fast"))
+
+    def test_re_tokenizes_only_edited_line(self, lexer: Lexer) -> None:
+        start = lexer.source.index("greeting(self")
+        changed = lexer.apply_edit(start, start + len("greeting"), "greet")
+        assert [token.value for token in lexer.tokens[changed.start:changed.stop]] == [
+            '\t', 'def', 'greet', '(', 'self', ',', 'msg', ':', 'str', ')', ':'
+        ]
@@ -1,9 +1,14 @@
-from lib.ast_node import AstNode, AstNodeType
-from lib.lexer import Lexer
+from lib.ast_node import (
+    AstNode, AstNodeType, AstPattern, AstPatternChoice, AstPatternElement, AstPatternGroup, AstClassPattern,
+    AstImportPattern, AstPatternAutomaton, AST_PATTERNS, PATTERN_AUTOMATON, PATTERN_DISPATCH
+)
+from lib.lexer import ENGINES, Lexer, tokenize_source
 from lib.parser import Parser
-from lib.token import TokenType, Token
+from lib.token import TokenType, Token, TOKEN_TYPE_IDS
 import pathlib
+import pickle
 import pytest
+from typing import List
 
 base_path = pathlib.Path(__file__).parent.resolve() / "test_data"
 CODE_FILE_PATH = (base_path / "parser_test_data.py").as_posix()
@@ -94,4 +99,319 @@ class TestImport:
                 Token(value='import', type=TokenType.IMPORT),
                 Token(value='List', type=TokenType.IDENTIFIER),
             ])
-        )
\ No newline at end of file
+        )
+
+class TestImportFrom:
+    def test_identifies_import_from_dotted_module(self) -> None:
+        parser = Parser(list(tokenize_source("from os.path import join\n")))
+        assert [len(node.tokens) for node in parser.ast] == [6]
+
+    @pytest.mark.parametrize("source, length", (
+        ("import os.path\n", 4),
+        ("from . import x\n", 4),
+        ("from ..pkg.mod import x\n", 8),
+        ("from ... import x\n", 4),
+    ))
+    def test_identifies_dotted_and_relative_imports(self, source: str, length: int) -> None:
+        parser = Parser(list(tokenize_source(source)))
+        assert [(node.type, len(node.tokens)) for node in parser.ast] == [(AstNodeType.IMPORT, length)]
+
+
+class TestAssignment:
+    def test_does_not_identify_typed_argument(self, parser_of_code_file: Parser) -> None:
+        assert AstNode(type=AstNodeType.ASSIGNMENT, tokens=[
+            Token(value='x', type=TokenType.IDENTIFIER),
+            Token(value=':', type=TokenType.COLON),
+            Token(value='int', type=TokenType.IDENTIFIER),
+            Token(value=',', type=TokenType.COMMA),
+            Token(value='y', type=TokenType.IDENTIFIER),
+        ]) not in parser_of_code_file.ast
+
+
+class TestStatements:
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_does_not_match_inside_statements(self, engine: str) -> None:
+        parser = Parser(list(tokenize_source("call(key=1)\n", engine)))
+        assert parser.ast == []
+        assert parser.unparsed == [range(0, 6)]
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_skips_statements_spanning_lines_at_once(self, engine: str) -> None:
+        tokens = list(tokenize_source("call(\n    x=1,\n    y=2,\n)\nz = 3\n", engine))
+        parser = Parser(tokens)
+        assert [[token.value for token in node.tokens] for node in parser.ast] == [["z", "=", "3"]]
+        assert len(parser.unparsed) == 1
+        assert [tokens[i].value for i in parser.unparsed[0]][-1] == ")"
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_matches_statement_after_compound_header(self, engine: str) -> None:
+        parser = Parser(list(tokenize_source("class A: x = 1\n", engine)))
+        assert [node.type for node in parser.ast] == [AstNodeType.CLASS, AstNodeType.ASSIGNMENT]
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    @pytest.mark.parametrize("source, expected", (
+        ("if x: y = 2\n", [["y", "=", "2"]]),
+        ("if x:\n    pass\nelif x: y = 3\nelse: y = 4\n", [["y", "=", "3"], ["y", "=", "4"]]),
+        ("try: import foo\nexcept ImportError: foo = None\nfinally: z = 1\n", [
+            ["import", "foo"], ["foo", "=", "None"], ["z", "=", "1"]
+        ]),
+        ("with f: import a\nfor a in b: c = 1\n", [["import", "a"], ["c", "=", "1"]]),
+        ("while f(x=1): d = 2\nif e[1:2]: g = 3\n", [["d", "=", "2"], ["g", "=", "3"]]),
+        ("if (a and\n        b): h = 4\n", [["h", "=", "4"]]),
+    ))
+    def test_matches_statement_after_header_on_same_line(self, engine: str, source: str, expected) -> None:
+        tokens = list(tokenize_source(source, engine))
+        parser = Parser(tokens)
+        assert [[token.value for token in node.tokens] for node in parser.ast] == expected
+        assert Parser(tokens, lazy=True).find(AstNodeType.ASSIGNMENT) == [
+            node for node in parser.ast if node.type == AstNodeType.ASSIGNMENT
+        ]
+        assert Parser(tokens, lazy=True).find(AstNodeType.IMPORT) == [
+            node for node in parser.ast if node.type == AstNodeType.IMPORT
+        ]
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    @pytest.mark.parametrize("columnar", (False, True))
+    def test_matches_def_after_async(self, engine: str, columnar: bool) -> None:
+        lexer = Lexer(engine=engine, columnar=columnar)
+        lexer.reset("async def f():\n    pass\nasync with a: b = 1\n")
+        parser = Parser(lexer.tokens)
+        assert [[token.value for token in node.tokens] for node in parser.ast] == [
+            ["def", "f", "(", ")", ":"], ["b", "=", "1"]
+        ]
+        assert list(Parser(lexer.tokens, lazy=True).iter_nodes()) == parser.ast
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    @pytest.mark.parametrize("columnar", (False, True))
+    def test_matches_statements_after_semicolons(self, engine: str, columnar: bool) -> None:
+        lexer = Lexer(engine=engine, columnar=columnar)
+        lexer.reset("import os; import sys\nx = 1; y = 2\ncall(); z = 3\n")
+        parser = Parser(lexer.tokens)
+        assert [node.type for node in parser.ast] == [AstNodeType.IMPORT] * 2 + [AstNodeType.ASSIGNMENT] * 3
+        assert [node.tokens[-1].value.rstrip(";") for node in parser.ast] == ["os", "sys", "1", "2", "3"]
+        assert list(Parser(lexer.tokens, lazy=True).iter_nodes()) == parser.ast
+
+    def test_matches_at_every_token_without_positions(self) -> None:
+        tokens = [
+            Token("x", TokenType.IDENTIFIER), Token("=", TokenType.EQ), Token("1", TokenType.INT_LITERAL),
+            Token("y", TokenType.IDENTIFIER), Token("=", TokenType.EQ), Token("2", TokenType.INT_LITERAL)
+        ]
+        parser = Parser(tokens)
+        assert [(node.start, node.end) for node in parser.ast] == [(0, 3), (3, 6)]
+        assert list(Parser(tokens, lazy=True).iter_nodes()) == parser.ast
+
+    def test_forgets_unparsed_statements_on_reset(self) -> None:
+        parser = Parser(list(tokenize_source("call()\n")))
+        parser.reset(list(tokenize_source("x = 1\n")))
+        assert parser.unparsed == []
+
+
+class TestFind:
+    @pytest.mark.parametrize("engine", ENGINES)
+    @pytest.mark.parametrize("columnar", (False, True))
+    def test_finds_nodes_of_full_parse(self, engine: str, columnar: bool) -> None:
+        lexer = Lexer(CODE_FILE_PATH, engine=engine, columnar=columnar, postings=True)
+        ast = Parser(lexer.tokens).ast
+        for node_type in AstNodeType:
+            expected = [node for node in ast if node.type == node_type]
+            assert Parser(lexer.tokens, postings=lexer.postings, lazy=True).find(node_type) == expected
+            assert Parser(lexer.tokens, lazy=True).find(node_type) == expected
+        nodes = Parser(lexer.tokens, postings=lexer.postings, lazy=True).iter_nodes()
+        assert [(node.start, node.end) for node in nodes] == [(node.start, node.end) for node in ast]
+
+    @pytest.mark.parametrize("engine", ENGINES)
+    def test_finds_only_where_statements_start(self, engine: str) -> None:
+        source = "call(x = 1)\nclass A: class B: x = 1\nf(\n    y = 2)\nfoo.bar = 3\n"
+        parser = Parser(list(tokenize_source(source, engine)), lazy=True)
+        assert [node.tokens[1].value for node in parser.find(AstNodeType.CLASS)] == ["A", "B"]
+        assert [node.tokens[0].value for node in parser.find(AstNodeType.ASSIGNMENT)] == ["x"]
+
+    def test_matches_only_at_tokens_patterns_of_types_start_with(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        lexer = Lexer(CODE_FILE_PATH, postings=True)
+        automaton = PATTERN_AUTOMATON.ensure_compiled()
+        starts = []
+        match = automaton.match
+
+        def recording_match(type_ids, start=0):
+            starts.append(start)
+            return match(type_ids, start)
+
+        monkeypatch.setattr(automaton, "match", recording_match)
+        parser = Parser(lexer.tokens, postings=lexer.postings, lazy=True)
+        classes = parser.find(AstNodeType.CLASS)
+        assert classes
+        assert set(starts) <= set(lexer.postings[TokenType.CLASS])
+
+    def test_parses_on_first_access_of_ast(self) -> None:
+        tokens = list(tokenize_source("import sys\nx = 1\n"))
+        parser = Parser(tokens, lazy=True)
+        assert [node.type for node in parser.find(AstNodeType.IMPORT)] == [AstNodeType.IMPORT]
+        assert parser.ast == Parser(tokens).ast
+        assert parser.find(AstNodeType.ASSIGNMENT) == [parser.ast[1]]
+        parser.reset(list(tokenize_source("class A:\n    pass\n")))
+        assert [node.type for node in parser.ast] == [AstNodeType.CLASS]
+
+    def test_filters_parsed_ast(self, parser_of_code_file: Parser) -> None:
+        types = (AstNodeType.DEF, AstNodeType.IMPORT)
+        assert list(parser_of_code_file.iter_nodes(types)) == [
+            node for node in parser_of_code_file.ast if node.type in types
+        ]
+
+
+class TestNodeRecord:
+    def test_is_immutable_and_hashable_by_type_and_tokens(self, parser_of_code_file: Parser) -> None:
+        node = parser_of_code_file.ast[0]
+        with pytest.raises(AttributeError):
+            node.type = AstNodeType.DEF
+        assert not hasattr(node, "__dict__")
+        copy = AstNode(list(node.tokens), node.type)
+        assert node == copy and hash(node) == hash(copy)
+        assert len({node, copy, parser_of_code_file.ast[1]}) == 2
+        assert pickle.loads(pickle.dumps(node)) == node
+
+
+class TestReset:
+    def test_reset_matches_new_parser(self, parser_of_code_file: Parser) -> None:
+        parser = Parser()
+        assert parser.ast == []
+        parser.reset(parser_of_code_file.tokens)
+        assert parser.ast == parser_of_code_file.ast
+
+    def test_reset_replaces_previous_ast(self, parser_of_code_file: Parser) -> None:
+        parser = Parser(parser_of_code_file.tokens)
+        parser.reset([Token(value='import', type=TokenType.IMPORT), Token(value='sys', type=TokenType.IDENTIFIER)])
+        assert [node.type for node in parser.ast] == [AstNodeType.IMPORT]
+
+    def test_instances_dont_share_ast(self, parser_of_code_file: Parser) -> None:
+        assert Parser(parser_of_code_file.tokens).ast == parser_of_code_file.ast
+
+
+class TestPatternCursor:
+    def test_node_is_a_range_of_the_shared_tokens(self) -> None:
+        tokens = [
+            Token(value='x', type=TokenType.IDENTIFIER),
+            Token(value='import', type=TokenType.IMPORT),
+            Token(value='sys', type=TokenType.IDENTIFIER),
+        ]
+        pattern = AstImportPattern(tokens, start=1)
+        node = pattern.match()
+        assert node.source is tokens
+        assert (node.start, node.end) == (1, 3)
+        assert node.tokens == tokens[1:]
+
+    def test_does_not_fail_on_incomplete_statement_at_end(self) -> None:
+        tokens = [Token(value='class', type=TokenType.CLASS), Token(value='Foo', type=TokenType.IDENTIFIER)]
+        assert AstClassPattern(tokens).match() is None
+
+    def test_reuses_pattern_by_resetting_cursor(self) -> None:
+        tokens = list(tokenize_source("import os\nimport sys\n"))
+        pattern = AstImportPattern(tokens)
+        assert [token.value for token in pattern.match().tokens] == ["import", "os"]
+        pattern.reset_cursor(2)
+        assert [token.value for token in pattern.match().tokens] == ["import", "sys"]
+        pattern.reset_cursor()
+        assert pattern.start == 2
+
+    def test_match_reads_only_tokens_it_steps_over(self) -> None:
+        reads = []
+
+        class CountingTokens(list):
+            def __getitem__(self, i):
+                reads.append(i)
+                return super().__getitem__(i)
+
+        tokens = CountingTokens(tokenize_source("x = 1\n" * 10_000 + "class A(B):\n"))
+        start = len(tokens) - 6
+        node = AstClassPattern(tokens, start).match()
+        assert (node.start, node.end) == (start, len(tokens))
+        assert len(reads) <= len(node)
+
+
+@pytest.fixture
+def restore_patterns():
+    patterns = list(AST_PATTERNS)
+    dispatch = {token_type: list(candidates) for token_type, candidates in PATTERN_DISPATCH.items()}
+    yield
+    AST_PATTERNS[:] = patterns
+    PATTERN_DISPATCH.update(dispatch)
+    PATTERN_AUTOMATON.compile(AST_PATTERNS)
+
+
+class TestPatternDispatch:
+    def test_dispatches_on_first_token(self) -> None:
+        assert PATTERN_DISPATCH[TokenType.CLASS] == [AstClassPattern]
+        assert PATTERN_DISPATCH[TokenType.FROM] == PATTERN_DISPATCH[TokenType.IMPORT] == [AstImportPattern]
+        assert PATTERN_DISPATCH[TokenType.COLON] == []
+
+    @pytest.mark.usefixtures("restore_patterns")
+    def test_new_patterns_extend_the_index(self) -> None:
+        class AstReturnPattern(AstPattern):
+            type = AstNodeType.ASSIGNMENT
+            elements = (AstPatternElement(TokenType.RETURN), AstPatternElement(TokenType.IDENTIFIER))
+
+        assert AST_PATTERNS[-1] is AstReturnPattern
+        assert AstReturnPattern.first == (TokenType.RETURN,)
+        assert PATTERN_DISPATCH[TokenType.RETURN] == [AstReturnPattern]
+
+    def test_counts_avoided_attempts(self) -> None:
+        tokens = [
+            Token(value='import', type=TokenType.IMPORT),
+            Token(value='sys', type=TokenType.IDENTIFIER),
+            Token(value=':', type=TokenType.COLON, line=2),
+        ]
+        parser = Parser(tokens)
+        # The import is matched by the only candidate, the colon starting the next line has no candidates at all
+        assert parser.avoided_match_attempts == 2 * (len(AST_PATTERNS) - 1) + 1
+
+
+def type_ids(*token_types: TokenType) -> List[int]:
+    return [TOKEN_TYPE_IDS[token_type] for token_type in token_types]
+
+
+class AstPatternExample(AstPattern):
+    type = AstNodeType.ASSIGNMENT
+    # Not registered, the elements are only set on the class for compiling its automaton
+    elements = ()
+
+
+class TestPatternAutomaton:
+    @pytest.fixture
+    def automaton(self) -> AstPatternAutomaton:
+        # IDENTIFIER (DOT IDENTIFIER)* (EQ | COLON_EQ) (INT_LITERAL | STR_LITERAL)+
+        AstPatternExample.elements = (
+            AstPatternElement(TokenType.IDENTIFIER),
+            AstPatternGroup((AstPatternElement(TokenType.DOT), AstPatternElement(TokenType.IDENTIFIER)),
+                            optional=True, repeated=True),
+            AstPatternChoice((AstPatternElement(TokenType.EQ), AstPatternElement(TokenType.COLON_EQ))),
+            AstPatternElement((TokenType.INT_LITERAL, TokenType.STR_LITERAL), repeated=True),
+        )
+        yield AstPatternAutomaton([AstPatternExample])
+        AstPatternExample.elements = ()
+
+    @pytest.mark.parametrize("token_types,length", (
+        ((TokenType.IDENTIFIER, TokenType.EQ, TokenType.INT_LITERAL), 3),
+        ((TokenType.IDENTIFIER, TokenType.DOT, TokenType.IDENTIFIER, TokenType.COLON_EQ, TokenType.STR_LITERAL), 5),
+        ((TokenType.IDENTIFIER, TokenType.EQ, TokenType.INT_LITERAL, TokenType.STR_LITERAL, TokenType.COLON), 4),
+    ))
+    def test_matches_longest(self, automaton: AstPatternAutomaton, token_types, length: int) -> None:
+        assert automaton.match(type_ids(*token_types)) == (AstPatternExample, length)
+
+    @pytest.mark.parametrize("token_types", (
+        (TokenType.IDENTIFIER, TokenType.EQ),
+        (TokenType.IDENTIFIER, TokenType.DOT, TokenType.EQ, TokenType.INT_LITERAL),
+        (TokenType.EQ, TokenType.INT_LITERAL),
+    ))
+    def test_does_not_match(self, automaton: AstPatternAutomaton, token_types) -> None:
+        assert automaton.match(type_ids(*token_types)) is None
+
+    def test_matches_from_start(self, automaton: AstPatternAutomaton) -> None:
+        ids = type_ids(TokenType.COLON, TokenType.IDENTIFIER, TokenType.EQ, TokenType.INT_LITERAL)
+        assert automaton.match(ids, 1) == (AstPatternExample, 3)
+
+    def test_rejects_pattern_matching_nothing(self) -> None:
+        AstPatternExample.elements = (AstPatternElement(TokenType.IDENTIFIER, optional=True),)
+        try:
+            with pytest.raises(ValueError):
+                AstPatternAutomaton([AstPatternExample])
+        finally:
+            AstPatternExample.elements = ()
@@ -0,0 +1,125 @@
+from lib.lexer import Lexer
+from lib.parser import Parser
+from lib.client import Client, file_requests, is_running
+from lib.server import RequestHandler, Server
+import pathlib
+import pytest
+import tempfile
+import threading
+from typing import Iterator
+
+SOURCE = "import sys\nx = 1\n"
+# How long shutting down a server can take
+POLL_INTERVAL = 0.01
+
+
+@pytest.fixture
+def socket_path() -> Iterator[str]:
+    # Paths of Unix sockets are limited to about a hundred chars, which those of `tmp_path` can exceed
+    with tempfile.TemporaryDirectory() as directory:
+        yield f"{directory}/server.sock"
+
+
+@pytest.fixture
+def server(socket_path: str) -> Iterator[Server]:
+    server = Server(socket_path)
+    thread = threading.Thread(target=server.serve_forever, args=(POLL_INTERVAL,))
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+@pytest.fixture
+def script(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "script.py"
+    path.write_text(SOURCE)
+    return path
+
+
+class TestServer:
+    def test_serves_tokens_and_ast_of_file(self, server: Server, socket_path: str, script: pathlib.Path) -> None:
+        tokens = Lexer(script.as_posix()).tokens
+        ast = Parser(tokens).ast
+        with Client(socket_path) as client:
+            request = next(file_requests([script.as_posix()], ["tokens", "ast"]))
+            response = client.request(request)
+            assert client.request(request) == response
+        assert response["ok"]
+        assert [(token["type"], token["value"], token["start"], token["line"]) for token in response["tokens"]] == [
+            (token.type.name, token.value, token.start, token.line) for token in tokens
+        ]
+        assert [(node["type"], node["start"], node["end"]) for node in response["ast"]] == [
+            (node.type.name, node.start, node.end) for node in ast
+        ]
+        assert server.handler._caches["classic"].hits == 1
+
+    def test_serves_stats_of_source(self, server: Server, socket_path: str) -> None:
+        with Client(socket_path) as client:
+            response = client.request({"source": SOURCE, "output": ["stats"], "engine": "fast"})
+        assert response["ok"] and set(response) == {"ok", "stats"}
+        assert response["stats"]["pattern_hits"] == {"AstAssignmentPattern": 1, "AstImportPattern": 1}
+
+    @pytest.mark.parametrize("message, error", (
+        ({"source": SOURCE, "engine": "unknown"}, "ValueError: Unknown lexer engine 'unknown'"),
+        ({"source": SOURCE, "output": ["text"]}, "ValueError: Unknown output 'text'"),
+        ({"output": ["ast"]}, "ValueError: Either a path or a source has to be given"),
+        ({"path": "/missing.py"}, "FileNotFoundError"),
+        ({"path": (pathlib.Path(__file__).parent.parent / "README.md").as_posix()}, "ValueError: "),
+        ({"command": "restart"}, "ValueError: Unknown command 'restart'"),
+    ))
+    def test_reports_errors(self, server: Server, socket_path: str, message: dict, error: str) -> None:
+        with Client(socket_path) as client:
+            response = client.request(message)
+            assert not response["ok"] and response["error"].startswith(error)
+            if "path" in message:
+                assert message["path"] in response["error"]
+            assert client.request({"command": "ping"}) == {"ok": True}
+
+    def test_handles_concurrent_clients(self, server: Server, socket_path: str) -> None:
+        sources = [f"x_{i} = {i}\n" for i in range(8)]
+        responses = {}
+
+        def request(source: str):
+            with Client(socket_path) as client:
+                responses[source] = [client.request({"source": source, "output": ["tokens"]}) for _ in range(20)]
+
+        threads = [threading.Thread(target=request, args=(source,)) for source in sources]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for source in sources:
+            assert all([token["value"] for token in response["tokens"]] == source.split()
+                       for response in responses[source])
+
+    def test_shuts_down_on_request(self, socket_path: str) -> None:
+        server = Server(socket_path)
+        thread = threading.Thread(target=server.serve_forever, args=(POLL_INTERVAL,))
+        thread.start()
+        assert is_running(socket_path)
+        with Client(socket_path) as client:
+            assert client.request({"command": "shutdown"}) == {"ok": True}
+        thread.join(timeout=5)
+        server.server_close()
+        assert not thread.is_alive() and not is_running(socket_path)
+
+    def test_replaces_stale_socket(self, socket_path: str) -> None:
+        pathlib.Path(socket_path).touch()
+        Server(socket_path).server_close()
+        assert not pathlib.Path(socket_path).exists()
+
+    def test_refuses_to_start_twice(self, server: Server, socket_path: str) -> None:
+        with pytest.raises(FileExistsError, match="already listening"):
+            Server(socket_path)
+
+
+class TestRequestHandler:
+    def test_handles_requests_in_process(self, script: pathlib.Path) -> None:
+        handler = RequestHandler("fast")
+        response = handler.handle(next(file_requests([script.as_posix()], ["ast"])))
+        assert response == {"ok": True, "ast": [
+            {"type": "IMPORT", "start": 0, "end": 2}, {"type": "ASSIGNMENT", "start": 2, "end": 5}
+        ]}
+        assert list(handler._caches) == ["fast"]
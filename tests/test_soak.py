@@ -0,0 +1,29 @@
+from lib.lexer import Lexer
+from lib.parser import Parser
+import os
+import pytest
+
+SOURCE = "from typing import List\n\nclass Foo(Bar, Baz):\n    x: int = 1\n\n    def method():\n        y = 'z'\n"
+ITERATIONS = 10_000
+# Allocator noise, a leak of even a few dozen bytes per iteration would exceed it
+MAX_RSS_GROWTH = 2 * 1024 * 1024
+
+
+def get_rss() -> int:
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="RSS is read from /proc")
+@pytest.mark.parametrize("columnar", (False, True))
+def test_reused_lexer_and_parser_keep_memory_flat(columnar: bool) -> None:
+    lexer = Lexer(engine="fast", columnar=columnar)
+    parser = Parser()
+    for i in range(ITERATIONS):
+        if i == ITERATIONS // 10:
+            rss = get_rss()
+        lexer.reset(SOURCE)
+        parser.reset(lexer.tokens)
+
+    assert len(parser.ast) == len(Parser(lexer.tokens).ast)
+    assert get_rss() - rss < MAX_RSS_GROWTH
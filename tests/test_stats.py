@@ -0,0 +1,90 @@
+from lib.batch import process_tree
+from lib.lexer import Lexer
+from lib.parser import Parser
+from lib.stats import Stats
+import json
+import logging
+import pathlib
+import pytest
+
+base_path = pathlib.Path(__file__).parent.resolve() / "test_data"
+CODE_FILE_PATH = (base_path / "parser_test_data.py").as_posix()
+# 14 tokens, `**` and `1.5` are read as one each
+SOURCE = "import sys\nx = 2 ** 3\ny = 1.5\nprint(y)\n"
+
+
+@pytest.fixture
+def script(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "script.py"
+    path.write_text(SOURCE)
+    return path
+
+
+class TestStats:
+    @pytest.mark.parametrize("engine", ("classic", "fast", "blocks"))
+    def test_tokens_are_the_same_with_stats(self, engine: str) -> None:
+        stats = Stats()
+        lexer = Lexer(CODE_FILE_PATH, engine=engine, stats=stats)
+        assert lexer.tokens == Lexer(CODE_FILE_PATH, engine=engine).tokens
+        assert [(t.start, t.end, t.line, t.column) for t in lexer.tokens] == [
+            (t.start, t.end, t.line, t.column) for t in Lexer(CODE_FILE_PATH, engine=engine).tokens
+        ]
+        assert Parser(lexer.tokens, stats=stats).ast == Parser(lexer.tokens).ast
+
+    def test_counts_lexer_phases(self, script: pathlib.Path) -> None:
+        stats = Stats()
+        lexer = Lexer(script.as_posix(), stats=stats)
+        assert {"read", "tokenize", "map_positions"} == set(stats.phases)
+        assert all(timing.calls == 1 and timing.wall_time >= 0 for timing in stats.phases.values())
+        assert stats.chars_scanned == len(SOURCE)
+        assert stats.tokens_emitted == {
+            "IMPORT": 1, "IDENTIFIER": 5, "EQ": 2, "INT_LITERAL": 2, "POW": 1, "FLOAT_LITERAL": 1,
+            "OPEN_PAREN": 1, "CLOSE_PAREN": 1
+        }
+        assert sum(stats.tokens_emitted.values()) == len(lexer.tokens)
+        assert stats.peak_tokens == 14
+
+    def test_counts_pattern_attempts(self, script: pathlib.Path) -> None:
+        stats = Stats()
+        parser = Parser(Lexer(script.as_posix()).tokens, stats=stats)
+        assert stats.phases["parse"].calls == 1
+        assert stats.pattern_hits == {"AstImportPattern": 1, "AstAssignmentPattern": 2}
+        assert sum(stats.pattern_hits.values()) == len(parser.ast)
+        # Attempted where the statements `x`, `y` and `print` start, but not at `sys` or the `y` in parentheses
+        assert stats.pattern_attempts["AstAssignmentPattern"] == 3
+        assert stats.pattern_failures["AstAssignmentPattern"] == 1
+        assert stats.pattern_failures["AstImportPattern"] == 0
+
+    def test_accumulates_and_merges(self, script: pathlib.Path) -> None:
+        stats = Stats()
+        for _ in range(2):
+            Parser(Lexer(script.as_posix(), stats=stats).tokens, stats=stats)
+        other = Stats()
+        other.merge(stats)
+        other.merge(stats)
+        assert other.phases["parse"].calls == 4
+        assert other.tokens_emitted["IDENTIFIER"] == 2 * stats.tokens_emitted["IDENTIFIER"]
+        assert other.pattern_hits["AstImportPattern"] == 4
+        assert other.peak_tokens == stats.peak_tokens
+
+    def test_exports_json(self, script: pathlib.Path, tmp_path: pathlib.Path) -> None:
+        stats = Stats()
+        Parser(Lexer(script.as_posix(), stats=stats).tokens, stats=stats)
+        stats.write_json((tmp_path / "stats.json").as_posix())
+        data = json.loads((tmp_path / "stats.json").read_text())
+        assert data["phases"]["parse"]["calls"] == 1
+        assert data["peak_tokens"] == 14
+        assert data["pattern_failures"] == stats.pattern_failures
+
+    def test_collects_stats_of_batch(self, script: pathlib.Path) -> None:
+        results = list(process_tree([script.as_posix()], workers=1, collect_stats=True))
+        assert results[0].stats.pattern_hits["AstImportPattern"] == 1
+        assert list(process_tree([script.as_posix()], workers=1))[0].stats is None
+
+    def test_progress_is_logged(self, script: pathlib.Path, capsys, caplog) -> None:
+        with caplog.at_level(logging.INFO):
+            Parser(Lexer(script.as_posix()).tokens)
+        assert capsys.readouterr().out == ""
+        assert [record.getMessage() for record in caplog.records] == [
+            f"Tokenizing {script.as_posix()}...", "Parsing tokens..."
+        ]
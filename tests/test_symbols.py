@@ -0,0 +1,171 @@
+from lib.ast_node import AstNodeType
+from lib.symbols import INDEX_VERSION, Symbol, SymbolIndex, module_name
+import os
+import pathlib
+import pickle
+import pytest
+
+# Old enough for the stat data to be trusted
+MTIME = 1_000_000_000
+MODULE = "import os\nfrom pkg.util import helper\n\nclass Foo(Base):\n    x = 1\n\n    def run():\n        pass\n"
+UTIL = "def helper():\n    return 1\nVALUE: int = 2\n"
+
+
+def write(path: pathlib.Path, source: str, mtime: int = MTIME) -> str:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(source)
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+@pytest.fixture
+def project(tmp_path: pathlib.Path) -> pathlib.Path:
+    write(tmp_path / "pkg" / "__init__.py", "")
+    write(tmp_path / "pkg" / "mod.py", MODULE)
+    write(tmp_path / "pkg" / "util.py", UTIL)
+    return tmp_path
+
+
+@pytest.fixture
+def index(project: pathlib.Path) -> SymbolIndex:
+    index = SymbolIndex(str(project))
+    assert index.refresh([str(project)]) == 3
+    return index
+
+
+class TestSymbolIndex:
+    def test_finds_definitions(self, project: pathlib.Path, index: SymbolIndex) -> None:
+        mod = str(project / "pkg" / "mod.py")
+        util = str(project / "pkg" / "util.py")
+        assert index.find("Foo") == [Symbol("Foo", AstNodeType.CLASS, mod, 4, 6)]
+        assert index.find("run") == [Symbol("run", AstNodeType.DEF, mod, 7, 8)]
+        assert index.find("x") == [Symbol("x", AstNodeType.ASSIGNMENT, mod, 5, 4)]
+        assert index.find("helper") == [Symbol("helper", AstNodeType.DEF, util, 1, 4)]
+        assert index.find("VALUE") == [Symbol("VALUE", AstNodeType.ASSIGNMENT, util, 3, 0)]
+        assert index.find("missing") == []
+        assert "Foo" in index and "Base" not in index
+        assert len(index) == 5
+
+    @pytest.mark.parametrize("engine", ("classic", "fast", "blocks"))
+    def test_engines_agree(self, project: pathlib.Path, index: SymbolIndex, engine: str) -> None:
+        other = SymbolIndex(str(project), engine=engine)
+        other.refresh([str(project)])
+        assert other.complete("") == index.complete("")
+        assert all(other.find(name) == index.find(name) for name in index.complete(""))
+
+    def test_completes_prefixes(self, index: SymbolIndex) -> None:
+        assert index.complete("") == ["Foo", "VALUE", "helper", "run", "x"]
+        assert index.complete("h") == ["helper"]
+        assert index.complete("F", limit=0) == []
+        assert index.complete("", limit=2) == ["Foo", "VALUE"]
+        assert index.complete("z") == []
+
+    def test_keeps_completions_sorted_across_updates(self, project: pathlib.Path, index: SymbolIndex) -> None:
+        assert index.complete("h") == ["helper"]
+        write(project / "pkg" / "util.py", "def handler():\n    pass\n", mtime=MTIME + 1)
+        assert index.update_file(str(project / "pkg" / "util.py"))
+        assert index.complete("h") == ["handler"]
+        assert index.complete("") == ["Foo", "handler", "run", "x"]
+
+    def test_tracks_imports(self, project: pathlib.Path, index: SymbolIndex) -> None:
+        mod = str(project / "pkg" / "mod.py")
+        assert index.imports(mod) == ["os", "pkg.util"]
+        assert index.importers("pkg.util") == [mod]
+        assert index.importers("sys") == []
+        assert index.import_graph() == {"pkg": set(), "pkg.mod": {"os", "pkg.util"}, "pkg.util": set()}
+
+    def test_records_dotted_and_relative_imports(self, project: pathlib.Path, index: SymbolIndex) -> None:
+        source = "import a.b\nfrom . import util\nfrom .util import helper\nfrom .. import top\nfrom ...x.y import z\n"
+        write(project / "pkg" / "sub" / "mod.py", source)
+        index.refresh([str(project)])
+        mod = str(project / "pkg" / "sub" / "mod.py")
+        assert index.imports(mod) == ["a.b", "pkg.sub", "pkg.sub.util", "pkg", "...x.y"]
+        assert index.importers("a.b") == [mod]
+        assert index.importers("a") == []
+
+    def test_keeps_relative_imports_without_package(self, project: pathlib.Path) -> None:
+        path = write(project / "script.py", "from . import sibling\nfrom .other import name\n")
+        index = SymbolIndex(str(project))
+        index.update_file(path)
+        assert index.imports(path) == [".", ".other"]
+
+    def test_keeps_relative_imports_above_top_level_package(self, project: pathlib.Path) -> None:
+        path = write(project / "pkg" / "mod.py", "from .. import name\nfrom ...up import name\n")
+        index = SymbolIndex(str(project))
+        index.update_file(path)
+        assert index.imports(path) == ["..", "...up"]
+
+    @pytest.mark.parametrize("engine, source, error", (
+        ("classic", b"x = '\xff'\n", "UnicodeDecodeError"),
+        ("blocks", b"if x:\n        y = 1\n    z = 2\n", "IndentationError"),
+    ))
+    def test_isolates_errors_of_files(
+        self, project: pathlib.Path, engine: str, source: bytes, error: str
+    ) -> None:
+        broken = project / "pkg" / "broken.py"
+        broken.write_bytes(source)
+        os.utime(broken, (MTIME, MTIME))
+        index = SymbolIndex(str(project), engine=engine)
+        assert index.refresh([str(project)]) == 4
+        assert index.find("helper") and index.find("Foo")
+        assert list(index.errors) == [str(broken)] and index.errors[str(broken)].startswith(error)
+        assert index.refresh([str(project)]) == 0
+        write(broken, "fixed = 1\n", mtime=MTIME + 1)
+        assert index.refresh([str(project)]) == 1
+        assert index.errors == {} and index.find("fixed")
+
+    def test_module_names(self) -> None:
+        root = os.path.join(os.sep, "root")
+        assert module_name(os.path.join(root, "pkg", "mod.py"), root) == "pkg.mod"
+        assert module_name(os.path.join(root, "pkg", "__init__.py"), root) == "pkg"
+        assert module_name(os.path.join(root, "__init__.py"), root) == "__init__"
+
+    def test_updates_only_changed_files(self, project: pathlib.Path, index: SymbolIndex) -> None:
+        mod = str(project / "pkg" / "mod.py")
+        assert not index.update_file(mod)
+        assert index.refresh([str(project)]) == 0
+        write(project / "pkg" / "mod.py", "import sys\nclass Bar:\n    pass\n", mtime=MTIME + 1)
+        assert index.refresh([str(project)]) == 1
+        assert index.find("Foo") == [] and index.find("x") == []
+        assert index.find("Bar") == [Symbol("Bar", AstNodeType.CLASS, mod, 2, 6)]
+        assert index.importers("pkg.util") == [] and index.importers("sys") == [mod]
+
+    def test_drops_deleted_files(self, project: pathlib.Path, index: SymbolIndex) -> None:
+        util = project / "pkg" / "util.py"
+        util.unlink()
+        assert index.update_file(str(util))
+        assert index.find("helper") == []
+        assert str(util) not in index.files
+        assert not index.remove_file(str(util))
+
+    def test_refresh_drops_files_not_found(self, project: pathlib.Path, index: SymbolIndex) -> None:
+        assert index.refresh([str(project / "pkg" / "util.py")]) == 2
+        assert index.files == [str(project / "pkg" / "util.py")]
+        assert index.complete("") == ["VALUE", "helper"]
+
+    def test_definitions_of_a_name_in_several_files(self, project: pathlib.Path, index: SymbolIndex) -> None:
+        other = write(project / "other.py", "def helper():\n    pass\n")
+        index.update_file(other)
+        assert sorted(symbol.path for symbol in index.find("helper")) == sorted(
+            [other, str(project / "pkg" / "util.py")]
+        )
+        index.remove_file(other)
+        assert [symbol.path for symbol in index.find("helper")] == [str(project / "pkg" / "util.py")]
+
+    def test_round_trips_through_a_file(
+        self, tmp_path: pathlib.Path, project: pathlib.Path, index: SymbolIndex
+    ) -> None:
+        path = str(tmp_path / "symbols.idx")
+        index.save(path)
+        loaded = SymbolIndex.load(path)
+        assert (loaded.root, loaded.engine, loaded.files) == (index.root, index.engine, index.files)
+        assert loaded.complete("") == index.complete("")
+        assert loaded.find("Foo") == index.find("Foo")
+        assert loaded.import_graph() == index.import_graph()
+        assert loaded.refresh([str(project)]) == 0
+
+    def test_rejects_other_versions(self, tmp_path: pathlib.Path) -> None:
+        path = tmp_path / "symbols.idx"
+        path.write_bytes(pickle.dumps({"version": INDEX_VERSION + 1, "files": {}}))
+        with pytest.raises(ValueError):
+            SymbolIndex.load(str(path))
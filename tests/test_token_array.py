@@ -0,0 +1,99 @@
+from lib.lexer import Lexer, tokenize_source
+from lib.parser import Parser
+from lib.token import TokenType, Token
+from lib.token_array import PostingLists, TokenArray, line_start_indices, semicolon_indices, starts_line
+import pathlib
+import pytest
+
+base_path = pathlib.Path(__file__).parent.resolve() / "test_data"
+CODE_FILE_PATH = (base_path / "lexer_test_data.py").as_posix()
+
+
+@pytest.fixture(scope="module")
+def list_lexer() -> Lexer:
+    return Lexer(CODE_FILE_PATH)
+
+
+@pytest.fixture(scope="module")
+def columnar_lexer() -> Lexer:
+    return Lexer(CODE_FILE_PATH, engine="fast", columnar=True)
+
+
+class TestTokenArray:
+    def test_matches_token_list(self, list_lexer: Lexer, columnar_lexer: Lexer) -> None:
+        assert isinstance(columnar_lexer.tokens, TokenArray)
+        assert columnar_lexer.tokens == list_lexer.tokens
+        assert list(columnar_lexer.tokens) == list_lexer.tokens
+
+    def test_keeps_only_values_which_are_not_slices_of_source(self) -> None:
+        source = 'x = "multi\nline" + y\nif x:\n    x + = 1\n'
+        tokens = TokenArray.from_tokens(tokenize_source(source), source)
+        assert tokens.overrides == {2: "multiline"}
+        assert tokens == list(tokenize_source(source))
+
+    def test_slices_are_views(self, list_lexer: Lexer, columnar_lexer: Lexer) -> None:
+        view = columnar_lexer.tokens[10:20]
+        assert view.types is columnar_lexer.tokens.types
+        assert view == list_lexer.tokens[10:20]
+        assert view[2:4] == list_lexer.tokens[12:14]
+        assert view[-1] == list_lexer.tokens[19]
+        with pytest.raises(IndexError):
+            _ = view[10]
+
+    def test_finds_indices_of_type(self, list_lexer: Lexer, columnar_lexer: Lexer) -> None:
+        expected = [i for i, token in enumerate(list_lexer.tokens) if token.type == TokenType.CLASS]
+        assert columnar_lexer.tokens.indices_of(TokenType.CLASS) == expected
+        assert columnar_lexer.tokens[5:].indices_of(TokenType.CLASS) == [i - 5 for i in expected]
+
+    def test_finds_first_tokens_of_lines(self, list_lexer: Lexer, columnar_lexer: Lexer) -> None:
+        expected = line_start_indices(list_lexer.tokens)
+        assert columnar_lexer.tokens.line_start_indices() == expected
+        assert columnar_lexer.tokens[5:].line_start_indices() == [0] + [i - 5 for i in expected if i > 5]
+
+    def test_does_not_start_lines_inside_multiline_strings(self) -> None:
+        source = 'x = """multi\nline""" + y\nz = 1\n'
+        tokens = TokenArray.from_tokens(tokenize_source(source), source)
+        assert tokens.line_start_indices() == [0, 5]
+
+    def test_tells_single_tokens_starting_lines(self, list_lexer: Lexer, columnar_lexer: Lexer) -> None:
+        for tokens in (list_lexer.tokens, columnar_lexer.tokens, columnar_lexer.tokens[5:]):
+            expected = line_start_indices(tokens)
+            assert [i for i in range(len(tokens)) if starts_line(tokens, i)] == expected
+
+    @pytest.mark.parametrize("engine", ("classic", "blocks"))
+    def test_finds_tokens_holding_semicolons(self, engine: str) -> None:
+        source = 'x = 1; y = ";"\nf();g()\nz = 2;\n'
+        tokens = list(tokenize_source(source, engine))
+        expected = [i for i, token in enumerate(tokens) if ";" in token.value]
+        array = TokenArray.from_tokens(tokens, source)
+        assert semicolon_indices(tokens) == semicolon_indices(array) == expected
+        assert semicolon_indices(array[3:]) == [i - 3 for i in expected if i >= 3]
+
+    def test_builds_from_tokens(self) -> None:
+        source = "x = 1"
+        tokens = [
+            Token(value="x", type=TokenType.IDENTIFIER, start=0, end=1),
+            Token(value="=", type=TokenType.EQ, start=2, end=3),
+            Token(value="1", type=TokenType.INT_LITERAL, start=4, end=5),
+        ]
+        assert TokenArray.from_tokens(tokens, source) == tokens
+
+
+class TestParserOnTokenArray:
+    def test_produces_same_ast(self, list_lexer: Lexer, columnar_lexer: Lexer) -> None:
+        assert Parser(columnar_lexer.tokens).ast == Parser(list_lexer.tokens).ast
+
+
+class TestPostingLists:
+    def test_recorded_lists_match_searched_ones(self, list_lexer: Lexer) -> None:
+        recorded = PostingLists()
+        assert list(recorded.record(list_lexer.tokens)) == list_lexer.tokens
+        searched = PostingLists.from_tokens(list_lexer.tokens)
+        for token_type in TokenType:
+            expected = [i for i, token in enumerate(list_lexer.tokens) if token.type == token_type]
+            assert list(recorded[token_type]) == list(searched[token_type]) == expected
+            assert recorded.count(token_type) == len(expected)
+
+    def test_indices_are_relative_to_views(self, columnar_lexer: Lexer) -> None:
+        postings = PostingLists.from_tokens(columnar_lexer.tokens[5:])
+        assert list(postings[TokenType.CLASS]) == columnar_lexer.tokens[5:].indices_of(TokenType.CLASS)